@@ -1,3 +1,5 @@
+import os
+import sys
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
@@ -5,6 +7,15 @@ from sqlalchemy import pool
 
 from alembic import context
 
+# Ajout du chemin du projet au PYTHONPATH
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import des modèles
+from app.core.config import settings
+from app.core.migrations import TABLE_PROGRESSION
+from app.models import Base
+import app.models  # noqa: F401  enregistre tous les modèles dans Base.metadata
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -16,9 +27,15 @@ if config.config_file_name is not None:
 
 # add your model's MetaData object here
 # for 'autogenerate' support
-# from myapp import mymodel
-# target_metadata = mymodel.Base.metadata
-target_metadata = None
+target_metadata = Base.metadata
+
+
+def include_object(objet, nom, type_, reflete, compare_a):
+    """Écarte de l'autogenerate les tables tenues hors des modèles (progression des backfills)."""
+    if type_ == "table":
+        return nom != TABLE_PROGRESSION
+    table = getattr(objet, "table", None)
+    return table is None or table.name != TABLE_PROGRESSION
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
@@ -38,10 +55,11 @@ def run_migrations_offline() -> None:
     script output.
 
     """
-    url = config.get_main_option("sqlalchemy.url")
+    url = settings.SQLALCHEMY_DATABASE_URL
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -57,15 +75,23 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
+    configuration = config.get_section(config.config_ini_section, {})
+    configuration["sqlalchemy.url"] = settings.SQLALCHEMY_DATABASE_URL
     connectable = engine_from_config(
-        config.get_section(config.config_ini_section, {}),
+        configuration,
         prefix="sqlalchemy.",
         poolclass=pool.NullPool,
     )
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection,
+            target_metadata=target_metadata,
+            include_object=include_object,
+            # Une transaction par révision : une migration longue (backfill,
+            # index concurrent) ne garde pas ouverte celle des précédentes
+            transaction_per_migration=True,
+            compare_type=True,
         )
 
         with context.begin_transaction():
@@ -0,0 +1,158 @@
+"""
+Cache en mémoire de processus, borné (LRU) et à durée de vie limitée (TTL).
+
+Pour les petites tables de référence lues à chaque requête (catalogue des
+produits, entrepôts). Chaque cache expose ses succès et échecs en métriques.
+
+Invalidation entre processus : chaque cache a un compteur de génération dans
+Redis (`REDIS_URL`). Une écriture incrémente le compteur ; un processus qui
+constate un changement de génération vide son cache local. Sans Redis, seul
+le TTL borne la durée pendant laquelle un autre processus peut servir une
+valeur périmée.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from .config import settings
+from .metrics import registre
+
+logger = logging.getLogger(__name__)
+
+ABSENT = object()
+
+acces_cache = registre.counter(
+    "fofal_cache_acces_total",
+    "Accès aux caches en mémoire, par cache et résultat (hit, miss)",
+    labels=("cache", "resultat"),
+)
+taille_cache = registre.gauge(
+    "fofal_cache_taille",
+    "Nombre d'entrées des caches en mémoire",
+    labels=("cache",),
+)
+invalidations_cache = registre.counter(
+    "fofal_cache_invalidations_total",
+    "Vidages des caches en mémoire, par cache et origine (locale, distante)",
+    labels=("cache", "origine"),
+)
+
+
+class CacheLRU:
+    """Dictionnaire borné : les entrées les moins récemment lues sont évincées."""
+
+    def __init__(self, nom: str, taille_max: int, ttl: float):
+        self.nom = nom
+        self.taille_max = taille_max
+        self.ttl = ttl
+        self._entrees: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Incrémentée à chaque vidage : une valeur lue en base avant un vidage
+        # concurrent n'est pas écrite (voir `ecrire`)
+        self.version = 0
+
+    def lire(self, cle: Hashable) -> Any:
+        """Valeur en cache, ou ABSENT (jamais mise, évincée ou expirée)."""
+        with self._lock:
+            entree = self._entrees.get(cle)
+            if entree is not None and entree[0] > time.monotonic():
+                self._entrees.move_to_end(cle)
+                acces_cache.inc(cache=self.nom, resultat="hit")
+                return entree[1]
+            if entree is not None:
+                del self._entrees[cle]
+        acces_cache.inc(cache=self.nom, resultat="miss")
+        return ABSENT
+
+    def ecrire(self, cle: Hashable, valeur: Any, version: Optional[int] = None) -> None:
+        """
+        `version` : valeur de `self.version` relevée avant la lecture en base ;
+        si le cache a été vidé depuis, la valeur est peut-être périmée et ignorée.
+        """
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._entrees[cle] = (time.monotonic() + self.ttl, valeur)
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.taille_max:
+                self._entrees.popitem(last=False)
+            taille_cache.set(len(self._entrees), cache=self.nom)
+
+    def vider(self) -> None:
+        with self._lock:
+            self._entrees.clear()
+            self.version += 1
+        taille_cache.set(0, cache=self.nom)
+
+    def __len__(self) -> int:
+        return len(self._entrees)
+
+
+class GenerationsRedis:
+    """
+    Compteurs de génération partagés entre processus.
+    `a_change(nom)` indique si un autre processus a invalidé le cache `nom`
+    depuis le dernier contrôle ; `incrementer(nom)` signale une invalidation.
+    """
+    PREFIXE = "fofal:cache:generation:"
+
+    def __init__(self, url: Optional[str], intervalle: float = 0.0):
+        self.intervalle = intervalle
+        self._client = None
+        self._generations: Dict[str, Optional[bytes]] = {}
+        self._controles: Dict[str, float] = {}
+        if url:
+            try:
+                import redis
+            except ImportError:  # pragma: no cover - dépendance optionnelle
+                logger.warning("Module redis absent : invalidation des caches limitée au processus")
+            else:
+                self._client = redis.Redis.from_url(url, socket_timeout=0.5)
+
+    @property
+    def actif(self) -> bool:
+        return self._client is not None
+
+    def lire(self, nom: str) -> Optional[bytes]:
+        """Génération courante (à relever avant de lire la base), None sans Redis."""
+        if self._client is None:
+            return None
+        return self._client.get(self.PREFIXE + nom)
+
+    def a_change(self, nom: str) -> bool:
+        """
+        Compare la génération partagée à celle vue précédemment. Un Redis
+        injoignable est traité comme un changement : le cache est vidé plutôt
+        que de servir une valeur peut-être périmée.
+        """
+        if self._client is None:
+            return False
+        maintenant = time.monotonic()
+        if self.intervalle and maintenant - self._controles.get(nom, 0.0) < self.intervalle:
+            return False
+        try:
+            generation = self.lire(nom)
+        except Exception:
+            logger.warning("Redis injoignable : cache %s vidé", nom, exc_info=True)
+            return True
+        self._controles[nom] = maintenant
+        if nom not in self._generations:
+            self._generations[nom] = generation
+            return False
+        if generation != self._generations[nom]:
+            self._generations[nom] = generation
+            return True
+        return False
+
+    def incrementer(self, nom: str) -> None:
+        if self._client is None:
+            return
+        try:
+            self._generations[nom] = str(self._client.incr(self.PREFIXE + nom)).encode()
+        except Exception:
+            logger.warning("Redis injoignable : invalidation de %s non propagée", nom, exc_info=True)
+
+
+generations = GenerationsRedis(settings.REDIS_URL, settings.CACHE_SYNC_INTERVAL)
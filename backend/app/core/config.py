@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from functools import lru_cache
 
 class Settings(BaseSettings):
@@ -20,6 +20,45 @@ class Settings(BaseSettings):
         """Construit l'URL de connexion à la base de données."""
         return f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}/{self.POSTGRES_DB}"
 
+    @property
+    def SQLALCHEMY_ASYNC_DATABASE_URL(self) -> str:
+        """Construit l'URL de connexion asynchrone (pilote asyncpg)."""
+        return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}/{self.POSTGRES_DB}"
+
+    # Configuration du pool de connexions
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30  # secondes d'attente d'une connexion libre
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 1800  # secondes, 30 minutes
+    DB_STATEMENT_TIMEOUT_MS: int = 30000  # 0 pour désactiver
+
+    # Réplicas en lecture (rapports, listes, état du stock)
+    SQLALCHEMY_REPLICA_URLS: List[str] = []
+    DB_REPLICA_MAX_LAG_SECONDS: float = 30.0  # au-delà, la réplica est ignorée
+    DB_REPLICA_LAG_INTERVAL_SECONDS: float = 5.0  # période de mesure du retard (thread de fond)
+
+    # Clés primaires UUIDv7 (ordonnées dans le temps) au lieu de uuid4
+    DB_TIME_ORDERED_IDS: bool = False
+
+    # Instrumentation SQL (latences, requêtes par appel, détection N+1)
+    DB_INSTRUMENTATION: bool = True
+    DB_N_PLUS_ONE_THRESHOLD: int = 3  # chargements paresseux d'une même relation
+    DB_QUERY_STRICT: bool = False  # lève une exception (tests) au lieu de journaliser
+
+    # Cache du catalogue (produits, entrepôts) ; Redis propage les invalidations
+    # entre processus, sans Redis seul le TTL borne la péremption
+    REDIS_URL: Optional[str] = None
+    CATALOG_CACHE_MAX_ENTRIES: int = 10000
+    CATALOG_CACHE_TTL_SECONDS: float = 300.0
+    CATALOG_CACHE_TTL_SANS_REDIS_SECONDS: float = 30.0  # TTL plafonné quand REDIS_URL est absent
+    CACHE_SYNC_INTERVAL: float = 0.0  # secondes entre deux lectures de la génération Redis (0 : à chaque accès)
+
+    # Séries temporelles des capteurs (app.services.sensor_timeseries)
+    SENSOR_BATCH_SIZE: int = 5000  # relevés par écriture
+    SENSOR_FLUSH_SECONDS: float = 1.0  # délai maximal avant écriture d'un lot incomplet
+    SENSOR_RETENTION_DAYS: Dict[str, Optional[int]] = {"brut": 30, "heure": 365, "jour": None}  # None : conservé
+
     # Configuration de sécurité
     SECRET_KEY: str = "votre_clé_secrète_ici"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8  # 8 jours
@@ -30,14 +69,22 @@ class Settings(BaseSettings):
     # Configuration agricole
     AGRICULTURAL_CONFIG: Dict[str, Any] = {
         "palm_oil": {
+            "culture_type": "PALMIER",
             "total_hectares": 70,
             "plants_per_hectare": 143,
-            "harvest_cycle_days": 10
+            "harvest_cycle_days": 10,
+            "maturity_months": 36,  # entrée en production après plantation
+            "productive_years": 25,  # durée de production
+            "yield_kg_per_plant_per_year": 140
         },
         "papaya": {
+            "culture_type": "PAPAYE",
             "total_hectares": 10,
             "plants_per_hectare": 1600,
-            "harvest_cycle_days": 7
+            "harvest_cycle_days": 7,
+            "maturity_months": 9,  # entrée en production après plantation
+            "productive_years": 3,  # durée de production
+            "yield_kg_per_plant_per_year": 40
         }
     }
 
@@ -48,6 +95,39 @@ class Settings(BaseSettings):
         "accounting_standard": "OHADA"
     }
 
+    # Configuration de la paie (app.services.payroll)
+    PAYROLL_CONFIG: Dict[str, Any] = {
+        "monthly_hours": 173.33,  # durée légale mensuelle (40 h/semaine)
+        "daily_hours": 8,  # au-delà : heures supplémentaires
+        "working_days_per_month": 26,  # retenue par jour d'absence ou de congé sans solde
+        # Majoration des heures supplémentaires par tranche mensuelle (heures, taux) ; None : au-delà
+        "overtime_tiers": [[32, 1.2], [32, 1.3], [None, 1.4]],
+        "unpaid_leave_types": ["SANS_SOLDE"],
+        # Cotisations salariales : taux sur le brut, plafonné au besoin
+        "contributions": {
+            "cnps_pension": {"rate": 0.042, "ceiling": 750000},
+            "credit_foncier": {"rate": 0.01, "ceiling": None},
+        },
+        # Impôt sur le revenu : barème annuel sur (brut - abattement - cotisations)
+        "income_tax": {
+            "allowance_rate": 0.30,
+            "brackets": [[2000000, 0.10], [3000000, 0.15], [5000000, 0.25], [None, 0.35]],
+            "surcharge_rate": 0.10,  # centimes additionnels sur l'impôt
+        },
+    }
+
+    # Configuration des notifications
+    NOTIFICATION_CONFIG: Dict[str, Any] = {
+        "email_enabled": True,
+        "sms_enabled": False,
+        "notification_types": {
+            "stock_alert": True,
+            "payment_due": True,
+            "harvest_reminder": True,
+            "maintenance_alert": True
+        }
+    }
+
     class Config:
         case_sensitive = True
         env_file = ".env"
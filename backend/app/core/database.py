@@ -1,13 +1,186 @@
-from sqlalchemy import create_engine
+import itertools
+import logging
+import threading
+from typing import Dict, Optional
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql import Select
+from . import instrumentation
 from .config import settings
+from .metrics import registre
+
+logger = logging.getLogger(__name__)
+
+if settings.DB_INSTRUMENTATION:
+    instrumentation.installer()
+
+def _pool_options() -> dict:
+    """Paramètres du pool de connexions communs aux moteurs sync et async."""
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+
+def _creer_moteur_replica(url: str) -> Engine:
+    """
+    Crée le moteur d'une réplica en lecture.
+    Les options de pool et de timeout ne s'appliquent qu'à PostgreSQL, ce qui
+    permet d'utiliser une base SQLite comme réplica de substitution en test.
+    """
+    if make_url(url).get_backend_name() != "postgresql":
+        return create_engine(url)
+    return create_engine(
+        url,
+        connect_args={"options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"},
+        **_pool_options(),
+    )
 
 # Création du moteur SQLAlchemy
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URL)
+engine = create_engine(
+    settings.SQLALCHEMY_DATABASE_URL,
+    connect_args={"options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"},
+    **_pool_options(),
+)
+
+# Moteurs des réplicas en lecture (vide : tout passe par le primaire)
+replica_engines = [_creer_moteur_replica(url) for url in settings.SQLALCHEMY_REPLICA_URLS]
+_tourniquet_replicas = itertools.cycle(range(len(replica_engines)))
+
+replica_lag = registre.gauge(
+    "fofal_db_replica_lag_seconds",
+    "Retard de réplication mesuré pour chaque réplica en lecture",
+    labels=("replica",),
+)
+
+def _nom_replica(index: int) -> str:
+    url = replica_engines[index].url
+    return f"{url.host or 'local'}/{url.database}"
+
+def mesurer_lag_replicas() -> Dict[str, float]:
+    """
+    Mesure le retard de réplication de chaque réplica et met à jour la métrique.
+    Une réplica injoignable est considérée comme infiniment en retard.
+    """
+    resultats = {}
+    for index, moteur in enumerate(replica_engines):
+        nom = _nom_replica(index)
+        try:
+            with moteur.connect() as connexion:
+                if moteur.dialect.name == "postgresql":
+                    lag = connexion.execute(text(
+                        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+                    )).scalar()
+                else:
+                    connexion.execute(text("SELECT 1"))
+                    lag = 0
+        except Exception:
+            lag = float("inf")
+        replica_lag.set(float(lag), replica=nom)
+        resultats[nom] = float(lag)
+    return resultats
+
+_arret_mesure = threading.Event()
+_thread_mesure: Optional[threading.Thread] = None
+
+def _mesurer_en_continu(intervalle: float) -> None:
+    while not _arret_mesure.wait(intervalle):
+        try:
+            mesurer_lag_replicas()
+        except Exception:
+            logger.exception("Échec de la mesure du retard des réplicas")
+
+def demarrer_mesure_lag(intervalle: Optional[float] = None) -> None:
+    """
+    Mesure le retard des réplicas tout de suite, puis toutes les `intervalle`
+    secondes (DB_REPLICA_LAG_INTERVAL_SECONDS) dans un thread de fond.
+    Idempotent ; appelé par app.core.startup.demarrer() quand des réplicas
+    sont configurées.
+    """
+    global _thread_mesure
+    if not replica_engines or (_thread_mesure is not None and _thread_mesure.is_alive()):
+        return
+    mesurer_lag_replicas()
+    _arret_mesure.clear()
+    _thread_mesure = threading.Thread(
+        target=_mesurer_en_continu,
+        args=(intervalle or settings.DB_REPLICA_LAG_INTERVAL_SECONDS,),
+        name="mesure-lag-replicas",
+        daemon=True,
+    )
+    _thread_mesure.start()
+
+def arreter_mesure_lag() -> None:
+    """Arrête le thread de mesure du retard des réplicas."""
+    _arret_mesure.set()
+
+def _choisir_replica():
+    """
+    Retourne une réplica dont le retard est acceptable, ou None.
+    Une réplica jamais mesurée est considérée comme infiniment en retard :
+    tant que `mesurer_lag_replicas()` n'a pas tourné, tout va au primaire.
+    """
+    for _ in range(len(replica_engines)):
+        index = next(_tourniquet_replicas)
+        lag = replica_lag.valeur(float("inf"), replica=_nom_replica(index))
+        if lag <= settings.DB_REPLICA_MAX_LAG_SECONDS:
+            return replica_engines[index]
+    return None
+
+class RoutingSession(Session):
+    """
+    Session qui envoie les lectures des sessions marquées « lecture seule »
+    vers une réplica, et tout le reste vers le primaire.
+    Dès que la session écrit (flush, ou instruction autre qu'un SELECT, y
+    compris `text()`), elle reste sur le primaire jusqu'à sa fermeture
+    (lecture de ses propres écritures).
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        # Tout ce qui n'est pas un SELECT (DML, texte SQL brut, DDL) peut écrire
+        if clause is not None and not isinstance(clause, Select):
+            self.info["a_ecrit"] = True
+        if (
+            replica_engines
+            and self.info.get("lecture_seule")
+            and not self.info.get("a_ecrit")
+            and not self._flushing
+            and isinstance(clause, Select)
+            and clause._for_update_arg is None
+        ):
+            # Une seule réplica par session pour des lectures cohérentes entre elles
+            if "replica" not in self.info:
+                self.info["replica"] = _choisir_replica()
+            if self.info["replica"] is not None:
+                return self.info["replica"]
+        return engine
+
+@event.listens_for(RoutingSession, "after_flush")
+def _marquer_ecriture(session, flush_context):
+    session.info["a_ecrit"] = True
+
+# Moteur asynchrone (asyncpg) pour les endpoints à forte concurrence
+async_engine = create_async_engine(
+    settings.SQLALCHEMY_ASYNC_DATABASE_URL,
+    connect_args={"server_settings": {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)}},
+    **_pool_options(),
+)
 
 # Session locale pour les opérations de base de données
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine)
+
+# Session asynchrone ; expire_on_commit=False évite un rechargement implicite
+# (impossible hors contexte await) des objets après commit
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
 
 # Classe de base pour les modèles SQLAlchemy
 Base = declarative_base()
@@ -23,3 +196,25 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Dépendance pour les endpoints de consultation (rapports OHADA, état du stock, listes)
+def get_read_db():
+    """
+    Générateur de contexte pour une session en lecture seule.
+    Les SELECT sont servis par une réplica si elle est disponible ; toute
+    écriture bascule la session sur le primaire.
+    """
+    db = SessionLocal(info={"lecture_seule": True})
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Dépendance pour obtenir une session asynchrone
+async def get_async_db():
+    """
+    Générateur asynchrone pour la session de base de données.
+    À utiliser avec les endpoints `async def` pour ne pas bloquer la boucle d'événements.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
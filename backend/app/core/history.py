@@ -0,0 +1,53 @@
+"""
+Image avant flush des objets suivis par les écouteurs de session (journal de
+stock, agrégats de récolte, prévision des rendements...).
+
+Un écouteur `after_flush` qui annule l'effet de l'ancien état d'un objet
+modifié lit cet état dans l'historique des attributs. Sur une instance
+expirée (après un commit), une affectation « à l'aveugle »
+(`mouvement.quantite = 4`) ne charge pas l'ancienne valeur : l'historique
+est vide et l'ancien état serait confondu avec le nouveau. `suivre_colonnes`
+active `active_history` sur les colonnes suivies, pour que l'ancienne valeur
+soit lue en base avant d'être remplacée.
+
+Usage :
+    suivre_colonnes(MouvementStock, _COLONNES_SUIVIES)   # à l'import du service
+    etat_avant(objet, _COLONNES_SUIVIES)                 # dans after_flush
+"""
+from typing import Any, Dict, Iterable
+
+from sqlalchemy import event, inspect
+
+
+def _ignorer(cible, valeur, ancienne, initiateur) -> None:
+    pass
+
+
+def suivre_colonnes(modele: Any, colonnes: Iterable[str]) -> None:
+    """Charge l'ancienne valeur des `colonnes` de `modele` avant toute affectation."""
+    for nom in colonnes:
+        event.listen(getattr(modele, nom), "set", _ignorer, active_history=True)
+
+
+def etat_avant(objet: Any, colonnes: Iterable[str]) -> Dict[str, Any]:
+    """Valeurs des `colonnes` d'`objet` avant les modifications en cours du flush."""
+    attributs = inspect(objet).attrs
+    avant = {}
+    for nom in colonnes:
+        historique = attributs[nom].history
+        if historique.deleted:
+            avant[nom] = historique.deleted[0]
+        elif historique.unchanged:
+            avant[nom] = historique.unchanged[0]
+        else:
+            # Attribut ni chargé ni modifié : la valeur courante est celle de la base
+            avant[nom] = getattr(objet, nom)
+    return avant
+
+
+def colonnes_modifiees(session, objet: Any, colonnes: Iterable[str]) -> bool:
+    """Vrai si l'une des `colonnes` d'`objet` est modifiée dans le flush en cours."""
+    if not session.is_modified(objet):
+        return False
+    attributs = inspect(objet).attrs
+    return any(attributs[nom].history.has_changes() for nom in colonnes)
@@ -0,0 +1,216 @@
+"""
+Instrumentation des requêtes SQL et détection des chargements N+1.
+
+- latence de chaque requête, par SQL normalisé (histogramme Prometheus)
+- nombre de requêtes par requête HTTP (ou par bloc `suivi_requetes`)
+- détection des relations chargées paresseusement en boucle
+  (ex. `Employe.paies` ou `Parcelle.recoltes` parcourus objet par objet)
+- mode strict : dépasser le budget de requêtes ou déclencher un N+1 lève une
+  exception, ce qui fait échouer les tests concernés
+"""
+import contextvars
+import logging
+import re
+import time
+from collections import Counter as CompteurPython
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .metrics import registre
+
+logger = logging.getLogger(__name__)
+
+duree_requetes = registre.histogram(
+    "fofal_db_requete_duree_secondes",
+    "Latence des requêtes SQL par requête normalisée",
+    labels=("requete",),
+)
+requetes_par_appel = registre.histogram(
+    "fofal_db_requetes_par_appel",
+    "Nombre de requêtes SQL émises par requête HTTP",
+    labels=("endpoint",),
+    seaux=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+n_plus_un_total = registre.counter(
+    "fofal_db_n_plus_un_total",
+    "Chargements N+1 détectés, par relation",
+    labels=("endpoint", "relation"),
+)
+
+# Label des requêtes HTTP qu'aucune route n'a prises en charge
+ENDPOINT_NON_ROUTE = "<non routé>"
+
+
+class BudgetRequetesDepasse(Exception):
+    """Levée en mode strict quand une requête dépasse son budget de requêtes SQL"""
+
+
+class ChargementNPlusUn(Exception):
+    """Levée en mode strict quand un chargement N+1 est détecté"""
+
+
+@dataclass
+class SuiviRequetes:
+    """Compteurs SQL d'une requête HTTP (ou d'un bloc de code suivi)"""
+    endpoint: str
+    budget: Optional[int] = None
+    nb_requetes: int = 0
+    duree_totale: float = 0.0
+    chargements_paresseux: CompteurPython = field(default_factory=CompteurPython)
+
+    @property
+    def n_plus_un(self) -> List[str]:
+        """Relations chargées paresseusement au moins DB_N_PLUS_ONE_THRESHOLD fois."""
+        return sorted(
+            relation for relation, nombre in self.chargements_paresseux.items()
+            if nombre >= settings.DB_N_PLUS_ONE_THRESHOLD
+        )
+
+
+_suivi_courant: contextvars.ContextVar[Optional[SuiviRequetes]] = contextvars.ContextVar(
+    "suivi_requetes", default=None
+)
+
+_LITTERAUX = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTES = re.compile(r"\(\s*(?:\?|%\(\w+\)s|:\w+|\$\d+)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+|\$\d+))+\s*\)")
+_VALUES_MULTIPLES = re.compile(r"(VALUES\s*\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+", re.IGNORECASE)
+_ESPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normaliser_sql(sql: str) -> str:
+    """
+    Normalise une requête pour regrouper ses exécutions : littéraux remplacés
+    par ?, listes de paramètres (IN, VALUES multiples) réduites à (...).
+    """
+    sql = _LITTERAUX.sub("?", sql)
+    sql = _LISTES.sub("(...)", sql)
+    sql = _VALUES_MULTIPLES.sub(r"\1", sql)
+    return _ESPACES.sub(" ", sql).strip()
+
+
+# Début de l'exécution porté par le contexte d'exécution (une instance par
+# requête) : une requête en erreur, sans after_cursor_execute, ne laisse rien
+# derrière elle qui décalerait la mesure des suivantes sur la connexion
+_ATTRIBUT_DEBUT = "_fofal_debut_requete"
+
+
+def _avant_execution(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        setattr(context, _ATTRIBUT_DEBUT, time.perf_counter())
+
+
+def _apres_execution(conn, cursor, statement, parameters, context, executemany):
+    debut = getattr(context, _ATTRIBUT_DEBUT, None)
+    if debut is None:
+        return
+    duree = time.perf_counter() - debut
+    duree_requetes.observe(duree, requete=normaliser_sql(statement))
+    suivi = _suivi_courant.get()
+    if suivi is not None:
+        suivi.nb_requetes += 1
+        suivi.duree_totale += duree
+        if settings.DB_QUERY_STRICT and suivi.budget is not None and suivi.nb_requetes > suivi.budget:
+            raise BudgetRequetesDepasse(
+                f"{suivi.endpoint} : {suivi.nb_requetes} requêtes SQL pour un budget de {suivi.budget}"
+            )
+
+
+def _sur_execution_orm(orm_execute_state):
+    # Seuls les chargements paresseux (lazy="select") sont rattachés à une instance
+    if not orm_execute_state.is_relationship_load or orm_execute_state.lazy_loaded_from is None:
+        return
+    suivi = _suivi_courant.get()
+    if suivi is None:
+        return
+    relation = str(orm_execute_state.loader_strategy_path.prop)
+    suivi.chargements_paresseux[relation] += 1
+    if suivi.chargements_paresseux[relation] == settings.DB_N_PLUS_ONE_THRESHOLD:
+        logger.warning("Chargement N+1 détecté sur %s (%s)", relation, suivi.endpoint)
+        if settings.DB_QUERY_STRICT:
+            raise ChargementNPlusUn(
+                f"{suivi.endpoint} : {relation} chargée objet par objet ; utiliser un profil de chargement"
+            )
+
+
+def installer() -> None:
+    """Branche les écouteurs sur tous les moteurs et toutes les sessions (idempotent)."""
+    if not event.contains(Engine, "before_cursor_execute", _avant_execution):
+        event.listen(Engine, "before_cursor_execute", _avant_execution)
+        event.listen(Engine, "after_cursor_execute", _apres_execution)
+        event.listen(Session, "do_orm_execute", _sur_execution_orm)
+
+
+@contextmanager
+def suivi_requetes(endpoint: str, budget: Optional[int] = None) -> Iterator[SuiviRequetes]:
+    """
+    Compte les requêtes SQL émises dans le bloc.
+    `budget` : nombre maximal de requêtes ; en mode strict (DB_QUERY_STRICT),
+    son dépassement lève BudgetRequetesDepasse.
+
+        with suivi_requetes("GET /employes/{id}", budget=5) as suivi:
+            ...
+        suivi.nb_requetes, suivi.n_plus_un
+    """
+    suivi = SuiviRequetes(endpoint=endpoint, budget=budget)
+    jeton = _suivi_courant.set(suivi)
+    try:
+        yield suivi
+    finally:
+        _suivi_courant.reset(jeton)
+        if suivi.budget is not None and suivi.nb_requetes > suivi.budget:
+            logger.warning(
+                "%s : %d requêtes SQL pour un budget de %d", suivi.endpoint, suivi.nb_requetes, suivi.budget
+            )
+        requetes_par_appel.observe(suivi.nb_requetes, endpoint=suivi.endpoint)
+        for relation in suivi.n_plus_un:
+            n_plus_un_total.inc(endpoint=suivi.endpoint, relation=relation)
+
+
+def suivi_courant() -> Optional[SuiviRequetes]:
+    """Suivi de la requête en cours, s'il y en a un."""
+    return _suivi_courant.get()
+
+
+def definir_budget(budget: int) -> None:
+    """Fixe le budget de requêtes SQL de la requête en cours (à appeler dans l'endpoint)."""
+    suivi = _suivi_courant.get()
+    if suivi is not None:
+        suivi.budget = budget
+
+
+def exporter_prometheus() -> str:
+    """Métriques du processus au format texte Prometheus (endpoint /metrics)."""
+    return registre.exposer()
+
+
+class InstrumentationSQLMiddleware:
+    """
+    Middleware ASGI qui ouvre un `suivi_requetes` par requête HTTP.
+    Chaque endpoint déclare son budget avec `definir_budget(n)`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with suivi_requetes(f"{scope['method']} {scope['path']}") as suivi:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                # Le routeur renseigne scope["route"] : on étiquette par gabarit de
+                # chemin (/employes/{id}) plutôt que par URL pour borner les séries ;
+                # sans route (404, sondes), un label fixe
+                route = scope.get("route")
+                chemin = route.path if route is not None else ENDPOINT_NON_ROUTE
+                suivi.endpoint = f"{scope['method']} {chemin}"
@@ -0,0 +1,176 @@
+"""
+Registre minimal de métriques exposées au format texte Prometheus.
+
+Pas de dépendance externe : les métriques sont conservées en mémoire dans le
+processus et rendues par `registre.exposer()` (endpoint /metrics, tâche de
+supervision, etc.).
+"""
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+LabelValues = Tuple[str, ...]
+
+
+def _echapper(valeur: str) -> str:
+    """Échappe une valeur de label selon le format texte Prometheus."""
+    return str(valeur).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formater_labels(noms: Iterable[str], valeurs: Iterable[str]) -> str:
+    paires = [f'{nom}="{_echapper(valeur)}"' for nom, valeur in zip(noms, valeurs)]
+    return "{" + ",".join(paires) + "}" if paires else ""
+
+
+class Metrique:
+    """Classe de base : une série de valeurs indexées par leurs labels"""
+    type_prometheus = "untyped"
+
+    def __init__(self, nom: str, description: str, labels: Tuple[str, ...] = ()):
+        self.nom = nom
+        self.description = description
+        self.labels = tuple(labels)
+        self._valeurs: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def _cle(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(nom, "")) for nom in self.labels)
+
+    def valeur(self, defaut: float = 0.0, **labels) -> float:
+        """Retourne la valeur courante pour une combinaison de labels (`defaut` si jamais positionnée)."""
+        return self._valeurs.get(self._cle(labels), defaut)
+
+    def reinitialiser(self) -> None:
+        with self._lock:
+            self._valeurs.clear()
+
+    def lignes(self) -> List[str]:
+        """Lignes de la métrique au format texte Prometheus."""
+        lignes = [
+            f"# HELP {self.nom} {self.description}",
+            f"# TYPE {self.nom} {self.type_prometheus}",
+        ]
+        with self._lock:
+            valeurs = sorted(self._valeurs.items())
+        for cle, valeur in valeurs:
+            lignes.append(f"{self.nom}{_formater_labels(self.labels, cle)} {valeur}")
+        return lignes
+
+
+class Gauge(Metrique):
+    """Valeur instantanée (lag, taille de cache, etc.)"""
+    type_prometheus = "gauge"
+
+    def set(self, valeur: float, **labels) -> None:
+        with self._lock:
+            self._valeurs[self._cle(labels)] = float(valeur)
+
+
+class Counter(Metrique):
+    """Compteur monotone (requêtes, hits de cache, etc.)"""
+    type_prometheus = "counter"
+
+    def inc(self, montant: float = 1.0, **labels) -> None:
+        cle = self._cle(labels)
+        with self._lock:
+            self._valeurs[cle] = self._valeurs.get(cle, 0.0) + montant
+
+
+class Histogram(Metrique):
+    """Distribution de valeurs (latences) répartie en seaux cumulatifs"""
+    type_prometheus = "histogram"
+    SEAUX_DEFAUT = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, nom: str, description: str, labels: Tuple[str, ...] = (),
+                 seaux: Tuple[float, ...] = SEAUX_DEFAUT):
+        super().__init__(nom, description, labels)
+        self.seaux = tuple(sorted(seaux))
+        # Par combinaison de labels : [compteurs par seau..., somme, nombre]
+        self._series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, valeur: float, **labels) -> None:
+        cle = self._cle(labels)
+        with self._lock:
+            serie = self._series.get(cle)
+            if serie is None:
+                serie = self._series[cle] = [0.0] * (len(self.seaux) + 2)
+            for index, borne in enumerate(self.seaux):
+                if valeur <= borne:
+                    serie[index] += 1
+                    break
+            serie[-2] += valeur
+            serie[-1] += 1
+
+    def valeur(self, defaut: float = 0.0, **labels) -> float:
+        """Nombre d'observations pour une combinaison de labels (`defaut` si aucune)."""
+        serie = self._series.get(self._cle(labels))
+        return serie[-1] if serie else defaut
+
+    def somme(self, **labels) -> float:
+        serie = self._series.get(self._cle(labels))
+        return serie[-2] if serie else 0.0
+
+    def reinitialiser(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def lignes(self) -> List[str]:
+        lignes = [
+            f"# HELP {self.nom} {self.description}",
+            f"# TYPE {self.nom} {self.type_prometheus}",
+        ]
+        with self._lock:
+            series = sorted((cle, list(serie)) for cle, serie in self._series.items())
+        noms_bucket = self.labels + ("le",)
+        for cle, serie in series:
+            cumul = 0.0
+            for borne, nombre in zip(self.seaux, serie):
+                cumul += nombre
+                lignes.append(f"{self.nom}_bucket{_formater_labels(noms_bucket, cle + (repr(borne),))} {cumul}")
+            lignes.append(f"{self.nom}_bucket{_formater_labels(noms_bucket, cle + ('+Inf',))} {serie[-1]}")
+            lignes.append(f"{self.nom}_sum{_formater_labels(self.labels, cle)} {serie[-2]}")
+            lignes.append(f"{self.nom}_count{_formater_labels(self.labels, cle)} {serie[-1]}")
+        return lignes
+
+
+class Registre:
+    """Ensemble des métriques du processus"""
+
+    def __init__(self):
+        self._metriques: Dict[str, Metrique] = {}
+        self._lock = threading.Lock()
+
+    def _obtenir(self, classe, nom: str, description: str, labels: Tuple[str, ...], **options):
+        with self._lock:
+            metrique = self._metriques.get(nom)
+            if metrique is None:
+                metrique = classe(nom, description, labels, **options)
+                self._metriques[nom] = metrique
+            elif not isinstance(metrique, classe):
+                raise ValueError(f"La métrique {nom} est déjà enregistrée avec un autre type")
+            return metrique
+
+    def gauge(self, nom: str, description: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        """Retourne (en la créant si besoin) une jauge du registre."""
+        return self._obtenir(Gauge, nom, description, labels)
+
+    def counter(self, nom: str, description: str, labels: Tuple[str, ...] = ()) -> Counter:
+        """Retourne (en le créant si besoin) un compteur du registre."""
+        return self._obtenir(Counter, nom, description, labels)
+
+    def histogram(self, nom: str, description: str, labels: Tuple[str, ...] = (),
+                  seaux: Tuple[float, ...] = Histogram.SEAUX_DEFAUT) -> Histogram:
+        """Retourne (en le créant si besoin) un histogramme du registre."""
+        return self._obtenir(Histogram, nom, description, labels, seaux=seaux)
+
+    def exposer(self) -> str:
+        """Rend toutes les métriques au format texte Prometheus."""
+        with self._lock:
+            metriques = list(self._metriques.values())
+        lignes: List[str] = []
+        for metrique in metriques:
+            lignes.extend(metrique.lignes())
+        return "\n".join(lignes) + "\n"
+
+
+# Registre global du processus
+registre = Registre()
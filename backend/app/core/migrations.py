@@ -0,0 +1,214 @@
+"""
+Helpers Alembic pour les migrations en ligne des grosses tables.
+
+À utiliser dans les fonctions `upgrade()` / `downgrade()` des révisions :
+
+    from app.core.migrations import ajouter_colonne, creer_index_concurrent, remplir_par_lots
+
+    def upgrade():
+        ajouter_colonne("mouvements_stock", sa.Column("lot", sa.String(50)))
+        remplir_par_lots("mouvements_stock", "lot = reference_document", "lot IS NULL")
+        creer_index_concurrent("ix_mouvements_stock_lot", "mouvements_stock", ["lot"])
+
+- les index sont créés avec CREATE INDEX CONCURRENTLY, hors transaction ;
+- les backfills avancent par lots sur la clé primaire, chaque lot est validé
+  séparément, la progression est enregistrée et une reprise après
+  interruption repart du dernier lot traité ;
+- une pause entre les lots laisse passer la saisie courante (récoltes, stock).
+"""
+import logging
+import time
+from typing import Callable, Optional, Sequence
+
+import sqlalchemy as sa
+from alembic import context, op
+
+logger = logging.getLogger(__name__)
+
+TABLE_PROGRESSION = "migrations_progression"
+
+
+def _verifier_mode_en_ligne(operation: str) -> None:
+    if context.is_offline_mode():
+        raise RuntimeError(f"{operation} nécessite une connexion (mode --sql non supporté)")
+
+
+def ajouter_colonne(table: str, colonne: sa.Column, lock_timeout: str = "5s") -> None:
+    """
+    Ajoute une colonne (nullable, sans défaut volatil) en bornant l'attente du
+    verrou : on échoue vite plutôt que de bloquer la table derrière une longue
+    transaction. Le `lock_timeout` précédent est rétabli ensuite, pour ne pas
+    s'appliquer au reste de la transaction de migration (backfills...) ; en
+    mode --sql, il est ramené à la valeur par défaut de la session.
+    """
+    precedent = None
+    if not context.is_offline_mode():
+        precedent = op.get_bind().execute(sa.text("SELECT current_setting('lock_timeout')")).scalar()
+    op.execute(sa.text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+    op.add_column(table, colonne)
+    if precedent is None:
+        op.execute(sa.text("SET LOCAL lock_timeout TO DEFAULT"))
+    else:
+        op.execute(sa.text(f"SET LOCAL lock_timeout = '{precedent}'"))
+
+
+def _etat_index(connexion, nom: str) -> Optional[bool]:
+    """None si l'index n'existe pas, sinon sa validité (False après un échec)."""
+    return connexion.execute(
+        sa.text(
+            "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :nom"
+        ),
+        {"nom": nom},
+    ).scalar()
+
+
+def creer_index_concurrent(nom: str, table: str, colonnes: Sequence[str], unique: bool = False,
+                           where: Optional[str] = None) -> None:
+    """
+    Crée un index sans bloquer les écritures (CREATE INDEX CONCURRENTLY).
+    Idempotent : un index valide est conservé, un index invalide laissé par
+    une tentative interrompue est supprimé puis recréé.
+    """
+    _verifier_mode_en_ligne("creer_index_concurrent")
+    with op.get_context().autocommit_block():
+        connexion = op.get_bind()
+        etat = _etat_index(connexion, nom)
+        if etat:
+            logger.info("Index %s déjà présent", nom)
+            return
+        if etat is False:
+            logger.warning("Index %s invalide (création interrompue), reconstruction", nom)
+            op.drop_index(nom, table_name=table, postgresql_concurrently=True)
+        debut = time.perf_counter()
+        op.create_index(
+            nom, table, list(colonnes), unique=unique,
+            postgresql_concurrently=True,
+            postgresql_where=sa.text(where) if where else None,
+        )
+        logger.info("Index %s créé en %.1f s", nom, time.perf_counter() - debut)
+
+
+def supprimer_index_concurrent(nom: str, table: str) -> None:
+    """Supprime un index sans bloquer les écritures (DROP INDEX CONCURRENTLY)."""
+    _verifier_mode_en_ligne("supprimer_index_concurrent")
+    with op.get_context().autocommit_block():
+        if _etat_index(op.get_bind(), nom) is not None:
+            op.drop_index(nom, table_name=table, postgresql_concurrently=True)
+
+
+def _preparer_progression(connexion) -> None:
+    connexion.execute(sa.text(
+        f"CREATE TABLE IF NOT EXISTS {TABLE_PROGRESSION} ("
+        " nom TEXT PRIMARY KEY,"
+        " derniere_cle TEXT,"
+        " lignes_traitees BIGINT NOT NULL DEFAULT 0,"
+        " termine BOOLEAN NOT NULL DEFAULT FALSE,"
+        " mis_a_jour_le TIMESTAMP NOT NULL DEFAULT now())"
+    ))
+
+
+def remplir_par_lots(
+    table: str,
+    set_sql: str,
+    where_sql: str = "TRUE",
+    taille_lot: int = 5000,
+    pause: float = 0.1,
+    cle: str = "id",
+    nom: Optional[str] = None,
+    progression: Optional[Callable[[int, int], None]] = None,
+) -> int:
+    """
+    Exécute `UPDATE table SET set_sql WHERE where_sql` par lots de `taille_lot`
+    lignes, dans l'ordre de la clé primaire `cle`.
+
+    Chaque lot est validé immédiatement (pas de verrou long), suivi d'une
+    pause de `pause` secondes. La dernière clé traitée est enregistrée dans la
+    table `migrations_progression` sous `nom` : relancer la migration reprend
+    après ce point. `progression(lignes_traitees, total_estime)` est appelée
+    après chaque lot. Retourne le nombre de lignes mises à jour.
+    """
+    _verifier_mode_en_ligne("remplir_par_lots")
+    nom = nom or f"{table}:{set_sql}"
+    total_lignes = 0
+    with op.get_context().autocommit_block():
+        connexion = op.get_bind()
+        _preparer_progression(connexion)
+        etat = connexion.execute(
+            sa.text(f"SELECT derniere_cle, lignes_traitees, termine FROM {TABLE_PROGRESSION} WHERE nom = :nom"),
+            {"nom": nom},
+        ).first()
+        if etat is not None and etat.termine:
+            logger.info("Backfill %s déjà terminé", nom)
+            return 0
+        derniere_cle = etat.derniere_cle if etat else None
+        total_lignes = etat.lignes_traitees if etat else 0
+        # Estimation issue des statistiques : évite un COUNT(*) sur la table entière
+        total_estime = int(connexion.execute(
+            sa.text("SELECT reltuples FROM pg_class WHERE relname = :table"), {"table": table}
+        ).scalar() or 0)
+
+        # Bornes du lot par la clé primaire, puis mise à jour des seules lignes
+        # du lot qui satisfont where_sql (CTE nommées pour éviter toute
+        # ambiguïté avec les colonnes de la table)
+        lot_sql = sa.text(
+            f"WITH _lot_migration AS ("
+            f" SELECT {cle} AS _cle FROM {table}"
+            f" WHERE (CAST(:derniere_cle AS TEXT) IS NULL OR {cle} > CAST(:derniere_cle AS {_type_cle(connexion, table, cle)}))"
+            f" ORDER BY {cle} LIMIT :taille_lot"
+            f"), _maj_migration AS ("
+            f" UPDATE {table} SET {set_sql} FROM _lot_migration"
+            f" WHERE {table}.{cle} = _lot_migration._cle AND ({where_sql})"
+            f" RETURNING 1"
+            f") SELECT (SELECT CAST(_cle AS TEXT) FROM _lot_migration ORDER BY _cle DESC LIMIT 1),"
+            f" (SELECT count(*) FROM _lot_migration), (SELECT count(*) FROM _maj_migration)"
+        )
+        while True:
+            debut = time.perf_counter()
+            cle_lot, lues, modifiees = connexion.execute(
+                lot_sql, {"derniere_cle": derniere_cle, "taille_lot": taille_lot}
+            ).one()
+            if not lues:
+                break
+            derniere_cle = cle_lot
+            total_lignes += modifiees
+            connexion.execute(
+                sa.text(
+                    f"INSERT INTO {TABLE_PROGRESSION} (nom, derniere_cle, lignes_traitees, mis_a_jour_le)"
+                    f" VALUES (:nom, :cle, :lignes, now())"
+                    f" ON CONFLICT (nom) DO UPDATE SET derniere_cle = excluded.derniere_cle,"
+                    f" lignes_traitees = excluded.lignes_traitees, mis_a_jour_le = now()"
+                ),
+                {"nom": nom, "cle": derniere_cle, "lignes": total_lignes},
+            )
+            logger.info(
+                "Backfill %s : %d lignes mises à jour (lot de %d en %.2f s)",
+                nom, total_lignes, lues, time.perf_counter() - debut,
+            )
+            if progression is not None:
+                progression(total_lignes, total_estime)
+            if lues < taille_lot:
+                break
+            time.sleep(pause)
+
+        connexion.execute(
+            sa.text(
+                f"INSERT INTO {TABLE_PROGRESSION} (nom, derniere_cle, lignes_traitees, termine, mis_a_jour_le)"
+                f" VALUES (:nom, :cle, :lignes, TRUE, now())"
+                f" ON CONFLICT (nom) DO UPDATE SET termine = TRUE, lignes_traitees = excluded.lignes_traitees,"
+                f" mis_a_jour_le = now()"
+            ),
+            {"nom": nom, "cle": derniere_cle, "lignes": total_lignes},
+        )
+    return total_lignes
+
+
+def _type_cle(connexion, table: str, cle: str) -> str:
+    """Type SQL de la colonne clé (uuid, bigint...) pour convertir le point de reprise."""
+    return connexion.execute(
+        sa.text(
+            "SELECT format_type(a.atttypid, a.atttypmod) FROM pg_attribute a"
+            " WHERE a.attrelid = CAST(:table AS regclass) AND a.attname = :cle"
+        ),
+        {"table": table, "cle": cle},
+    ).scalar()
@@ -0,0 +1,153 @@
+"""
+Pagination par curseur (keyset) pour les endpoints de liste.
+
+Au lieu de `OFFSET`, chaque page reprend après la dernière ligne de la page
+précédente : `WHERE (tri, id) > (:valeur, :id) ORDER BY tri, id LIMIT n`.
+Le coût d'une page ne dépend plus de sa profondeur, à condition qu'un index
+couvre (colonne de tri, id).
+
+Le curseur est un jeton opaque (JSON encodé en base64 URL) qui contient la
+colonne de tri, le sens et les valeurs de la dernière ligne.
+"""
+import base64
+import enum
+import json
+import uuid
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+
+LIMITE_MAX = 100
+
+
+class CurseurInvalide(ValueError):
+    """Levée quand un curseur ne peut pas être décodé ou ne correspond pas au tri demandé"""
+
+
+@dataclass
+class Page:
+    """Une page de résultats et le curseur de la page suivante"""
+    items: List[Any]
+    limit: int
+    next_cursor: Optional[str] = None
+    filtres: Dict[str, Any] = field(default_factory=dict)
+
+
+def _vers_json(valeur: Any) -> Any:
+    if isinstance(valeur, (datetime, date)):
+        return valeur.isoformat()
+    if isinstance(valeur, (uuid.UUID, Decimal)):
+        return str(valeur)
+    if isinstance(valeur, enum.Enum):
+        return valeur.value
+    return valeur
+
+
+def _depuis_json(colonne, valeur: Any) -> Any:
+    """Reconvertit une valeur de curseur dans le type Python de la colonne."""
+    if valeur is None:
+        return None
+    type_python = colonne.type.python_type
+    if type_python is datetime:
+        return datetime.fromisoformat(valeur)
+    if type_python is date:
+        return date.fromisoformat(valeur)
+    # UUID, Decimal, Enum, int, str : construction directe depuis la valeur JSON
+    return type_python(valeur)
+
+
+def encoder_curseur(tri: str, descendant: bool, valeur: Any, identifiant: Any) -> str:
+    """Construit le jeton opaque qui désigne la position après une ligne."""
+    charge = {"t": tri, "d": descendant, "v": _vers_json(valeur), "id": _vers_json(identifiant)}
+    brut = json.dumps(charge, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(brut).decode().rstrip("=")
+
+
+def decoder_curseur(jeton: str) -> Dict[str, Any]:
+    """Décode un jeton de curseur ; lève CurseurInvalide s'il est illisible."""
+    try:
+        brut = base64.urlsafe_b64decode(jeton + "=" * (-len(jeton) % 4))
+        charge = json.loads(brut)
+        if not isinstance(charge, dict) or not {"t", "d", "v", "id"} <= charge.keys():
+            raise ValueError
+        return charge
+    except (ValueError, TypeError):
+        raise CurseurInvalide("Curseur de pagination invalide") from None
+
+
+def appliquer_filtres(stmt, modele, filtres: Optional[Dict[str, Any]]):
+    """
+    Applique les filtres d'égalité documentés de l'API
+    (`?culture_type=PALMIER&statut=ACTIVE`) ; une liste de valeurs devient un IN.
+    """
+    for nom, valeur in (filtres or {}).items():
+        if valeur is None:
+            continue
+        colonne = modele.__table__.columns.get(nom)
+        if colonne is None:
+            raise ValueError(f"Filtre inconnu pour {modele.__name__} : {nom}")
+        attribut = getattr(modele, colonne.key)
+        if isinstance(valeur, (list, tuple, set)):
+            stmt = stmt.where(attribut.in_(list(valeur)))
+        else:
+            stmt = stmt.where(attribut == valeur)
+    return stmt
+
+
+def paginer(
+    session: Session,
+    modele,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    tri: str = "created_at",
+    descendant: bool = False,
+    filtres: Optional[Dict[str, Any]] = None,
+    stmt=None,
+) -> Page:
+    """
+    Retourne une page de `modele` triée par (tri, id).
+
+    `tri` doit être une colonne non nulle et indexée avec id ; `stmt` permet de
+    partir d'une requête existante (profil de chargement, jointures).
+    """
+    limit = max(1, min(limit, LIMITE_MAX))
+    colonne = modele.__table__.columns.get(tri)
+    if colonne is None or colonne.nullable:
+        raise ValueError(f"Colonne de tri invalide pour {modele.__name__} : {tri}")
+    attribut_tri = getattr(modele, colonne.key)
+    attribut_id = modele.id
+
+    if stmt is None:
+        stmt = select(modele)
+    stmt = appliquer_filtres(stmt, modele, filtres)
+
+    if cursor:
+        position = decoder_curseur(cursor)
+        if position["t"] != tri or position["d"] != descendant:
+            raise CurseurInvalide("Le curseur ne correspond pas au tri demandé")
+        try:
+            cle = (_depuis_json(colonne, position["v"]), _depuis_json(modele.__table__.c.id, position["id"]))
+        except (ValueError, TypeError):
+            raise CurseurInvalide("Curseur de pagination invalide") from None
+        if descendant:
+            stmt = stmt.where(tuple_(attribut_tri, attribut_id) < cle)
+        else:
+            stmt = stmt.where(tuple_(attribut_tri, attribut_id) > cle)
+
+    if descendant:
+        stmt = stmt.order_by(attribut_tri.desc(), attribut_id.desc())
+    else:
+        stmt = stmt.order_by(attribut_tri.asc(), attribut_id.asc())
+
+    # Une ligne de plus pour savoir s'il existe une page suivante
+    items = session.scalars(stmt.limit(limit + 1)).unique().all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        dernier = items[-1]
+        next_cursor = encoder_curseur(tri, descendant, getattr(dernier, colonne.key), dernier.id)
+    return Page(items=list(items), limit=limit, next_cursor=next_cursor, filtres=dict(filtres or {}))
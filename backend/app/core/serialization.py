@@ -0,0 +1,68 @@
+"""
+Sérialisation JSON en masse des résultats de requêtes.
+
+Les lignes d'un résultat Core (`session.execute(select(Recolte.__table__))`)
+sont converties directement en JSON (bytes), sans construire d'instances ORM.
+UUID, Decimal, Enum, date et datetime sont pris en charge nativement.
+orjson est utilisé s'il est installé, sinon on se rabat sur le module json.
+"""
+import enum
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Iterable, Iterator, Optional, Sequence
+from uuid import UUID
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    orjson = None
+
+
+def _convertir(valeur: Any) -> Any:
+    """Conversion des types non gérés nativement par l'encodeur JSON."""
+    # Decimal en chaîne pour ne pas perdre de précision (montants, quantités)
+    if isinstance(valeur, Decimal):
+        return str(valeur)
+    if isinstance(valeur, UUID):
+        return str(valeur)
+    if isinstance(valeur, enum.Enum):
+        return valeur.value
+    if isinstance(valeur, (datetime, date, time)):
+        return valeur.isoformat()
+    raise TypeError(f"Type non sérialisable en JSON : {type(valeur).__name__}")
+
+
+def dumps(donnees: Any) -> bytes:
+    """Encode une structure Python en JSON (bytes)."""
+    if orjson is not None:
+        return orjson.dumps(donnees, default=_convertir)
+    return json.dumps(donnees, default=_convertir, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def serialiser_lignes(resultat: Iterable[Sequence[Any]], colonnes: Optional[Sequence[str]] = None) -> bytes:
+    """
+    Convertit les lignes d'un résultat Core en une liste JSON d'objets.
+
+    `resultat` est un `Result` SQLAlchemy (les noms de colonnes sont lus via
+    `keys()`) ou tout itérable de tuples accompagné de `colonnes`.
+    """
+    if colonnes is None:
+        colonnes = tuple(resultat.keys())
+    return dumps([dict(zip(colonnes, ligne)) for ligne in resultat])
+
+
+def serialiser_modeles(instances: Iterable[Any]) -> bytes:
+    """Convertit des instances de modèles en une liste JSON via `Base.dict()`."""
+    return dumps([instance.dict() for instance in instances])
+
+
+def flux_json(objets: Iterable[Any]) -> Iterator[bytes]:
+    """
+    Encode une liste JSON morceau par morceau (réponse en streaming, export de
+    fichier) : la liste complète n'est jamais construite en mémoire.
+    """
+    yield b"["
+    for index, objet in enumerate(objets):
+        yield (b"," if index else b"") + dumps(objet)
+    yield b"]"
@@ -0,0 +1,178 @@
+"""
+Démarrage des processus (API, workers Celery).
+
+- `demarrer()` fait une fois pour toutes, au boot, le travail qui tombait
+  sinon sur la première requête : import du registre des modèles,
+  configuration des mappers SQLAlchemy, création des répertoires de travail,
+  enregistrement des écouteurs des services (journal de stock...), mesure
+  périodique du retard des réplicas en lecture.
+- `import_differe()` retarde l'import des bibliothèques lourdes de rapports et
+  d'export (reportlab, openpyxl, python-docx) jusqu'à leur première utilisation.
+- `rapport_imports()` mesure le temps d'import par module (`python -X importtime`)
+  pour suivre les régressions du démarrage à froid.
+
+Usage :
+    python -m app.core.startup            # temps des étapes de démarrage
+    python -m app.core.startup --imports  # détail du temps d'import par module
+"""
+import argparse
+import importlib
+import importlib.util
+import logging
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bibliothèques de rapports/export chargées à la première utilisation
+MODULES_DIFFERES = ("reportlab", "openpyxl", "docx")
+
+# Services dont l'import enregistre des écouteurs de session : ils doivent être
+# actifs dans tout processus qui écrit en base
+SERVICES = ("app.services.stock_ledger", "app.services.stock_valuation", "app.services.stock_alerts",
+            "app.services.stock_snapshots", "app.services.catalog", "app.services.lot_traceability",
+            "app.services.harvest_rollups", "app.services.harvest_planner",
+            "app.services.harvest_teams", "app.services.yield_forecast")
+
+
+def import_differe(nom: str):
+    """
+    Retourne le module `nom` sans l'exécuter : le chargement réel a lieu au
+    premier accès à un de ses attributs.
+    """
+    if nom in sys.modules:
+        return sys.modules[nom]
+    spec = importlib.util.find_spec(nom)
+    if spec is None:
+        raise ModuleNotFoundError(f"Module introuvable : {nom}", name=nom)
+    chargeur = importlib.util.LazyLoader(spec.loader)
+    spec.loader = chargeur
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[nom] = module
+    chargeur.exec_module(module)
+    return module
+
+
+@dataclass
+class RapportDemarrage:
+    """Durée de chaque étape du démarrage, en secondes"""
+    etapes: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def total(self) -> float:
+        return sum(self.etapes.values())
+
+    def __str__(self) -> str:
+        lignes = [f"{nom:<28} {duree * 1000:8.1f} ms" for nom, duree in self.etapes.items()]
+        lignes.append(f"{'total':<28} {self.total * 1000:8.1f} ms")
+        return "\n".join(lignes)
+
+
+_rapport: Optional[RapportDemarrage] = None
+
+
+def _creer_repertoires() -> None:
+    # La configuration globale (config/settings.py) n'est pas toujours sur le
+    # chemin d'import des workers ; ses répertoires sont alors gérés ailleurs
+    try:
+        from config.settings import creer_repertoires
+    except ModuleNotFoundError:
+        return
+    creer_repertoires()
+
+
+def _configurer_modeles() -> None:
+    from sqlalchemy.orm import configure_mappers
+
+    importlib.import_module("app.models")
+    configure_mappers()
+
+
+def _charger_services() -> None:
+    for nom in SERVICES:
+        importlib.import_module(nom)
+    importlib.import_module("app.services.catalog").verifier_configuration()
+
+
+def _mesurer_replicas() -> None:
+    from .config import settings
+
+    # Sans réplica, inutile de créer les moteurs de base dès le démarrage
+    if not settings.SQLALCHEMY_REPLICA_URLS:
+        return
+    from .database import demarrer_mesure_lag
+
+    demarrer_mesure_lag()
+
+
+def demarrer() -> RapportDemarrage:
+    """
+    Prépare le processus (idempotent). À appeler au démarrage de l'API et
+    dans le signal `worker_process_init` de Celery.
+    """
+    global _rapport
+    if _rapport is not None:
+        return _rapport
+    rapport = RapportDemarrage()
+    for nom, etape in (
+        ("repertoires", _creer_repertoires),
+        ("modeles_et_mappers", _configurer_modeles),
+        ("services", _charger_services),
+        ("mesure_replicas", _mesurer_replicas),
+    ):
+        debut = time.perf_counter()
+        etape()
+        rapport.etapes[nom] = time.perf_counter() - debut
+    for nom in MODULES_DIFFERES:
+        debut = time.perf_counter()
+        try:
+            import_differe(nom)
+        except ModuleNotFoundError:
+            logger.info("Module optionnel absent : %s", nom)
+        rapport.etapes[f"differe:{nom}"] = time.perf_counter() - debut
+    logger.info("Démarrage terminé en %.1f ms", rapport.total * 1000)
+    _rapport = rapport
+    return rapport
+
+
+def rapport_imports(module: str = "app.models", top: int = 25) -> List[Tuple[str, int, int]]:
+    """
+    Temps d'import de `module` dans un interpréteur neuf, par module importé.
+    Retourne (module, temps propre µs, temps cumulé µs), trié par temps cumulé.
+    """
+    resultat = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    lignes = []
+    for ligne in resultat.stderr.splitlines():
+        if not ligne.startswith("import time:") or "self [us]" in ligne:
+            continue
+        propre, cumule, nom = (partie.strip() for partie in ligne[len("import time:"):].split("|"))
+        lignes.append((nom, int(propre), int(cumule)))
+    if resultat.returncode != 0:
+        erreur = resultat.stderr.strip().splitlines()
+        raise RuntimeError(f"Import de {module} en échec (code {resultat.returncode})"
+                           + (f" : {erreur[-1]}" if erreur else ""))
+    return sorted(lignes, key=lambda ligne: ligne[2], reverse=True)[:top]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mesure du démarrage à froid")
+    parser.add_argument("--imports", action="store_true", help="détail du temps d'import par module")
+    parser.add_argument("--module", default="app.models")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+    if args.imports:
+        print(f"{'module':<50} {'propre (ms)':>12} {'cumulé (ms)':>12}")
+        for nom, propre, cumule in rapport_imports(args.module, args.top):
+            print(f"{nom:<50} {propre / 1000:>12.1f} {cumule / 1000:>12.1f}")
+    else:
+        print(demarrer())
+
+
+if __name__ == "__main__":
+    main()
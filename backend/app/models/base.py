@@ -1,9 +1,58 @@
+import os
+import threading
+import time
+import uuid
 from datetime import datetime
-from typing import Any
-from sqlalchemy import Column, DateTime, Integer
+from operator import attrgetter
+from typing import Any, Callable, Dict, Iterable, Sequence, Tuple, Union
+from sqlalchemy import Column, DateTime, Integer, literal_column, select, tuple_
 from sqlalchemy.ext.declarative import as_declarative, declared_attr
+from sqlalchemy.orm import Mapped, Session
 from uuid import uuid4
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.dialects.postgresql import UUID
+from ..core.config import settings
+
+# Constructions INSERT ... ON CONFLICT disponibles par dialecte
+_INSERTS_UPSERT = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+_uuid7_verrou = threading.Lock()
+_uuid7_dernier_ms = 0
+_uuid7_compteur = 0
+
+def uuid7() -> uuid.UUID:
+    """
+    Génère un UUID version 7 (RFC 9562).
+    Les 48 premiers bits sont l'horodatage Unix en millisecondes : les valeurs
+    sont croissantes dans le temps, y compris au sein d'une même milliseconde
+    grâce à un compteur de 12 bits.
+    """
+    global _uuid7_dernier_ms, _uuid7_compteur
+    with _uuid7_verrou:
+        ms = time.time_ns() // 1_000_000
+        if ms > _uuid7_dernier_ms:
+            # Compteur initialisé aléatoirement, bit de poids fort à 0 pour garder de la marge
+            _uuid7_compteur = int.from_bytes(os.urandom(2), "big") & 0x7FF
+        else:
+            ms = _uuid7_dernier_ms
+            _uuid7_compteur += 1
+            if _uuid7_compteur > 0xFFF:
+                ms += 1
+                _uuid7_compteur = int.from_bytes(os.urandom(2), "big") & 0x7FF
+        _uuid7_dernier_ms = ms
+        compteur = _uuid7_compteur
+    aleatoire = int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    return uuid.UUID(int=(ms << 80) | (0x7 << 76) | (compteur << 64) | (0b10 << 62) | aleatoire)
+
+def generer_id() -> uuid.UUID:
+    """
+    Identifiant par défaut des clés primaires.
+    UUIDv7 (ordonné dans le temps) si DB_TIME_ORDERED_IDS est activé, sinon uuid4.
+    """
+    return uuid7() if settings.DB_TIME_ORDERED_IDS else uuid4()
 
 @as_declarative()
 class Base:
@@ -11,9 +60,9 @@ class Base:
     Classe de base pour tous les modèles SQLAlchemy.
     Fournit des fonctionnalités communes à tous les modèles.
     """
-    id: Any
-    created_at: datetime
-    updated_at: datetime
+    id: Mapped[Any]
+    created_at: Mapped[datetime]
+    updated_at: Mapped[datetime]
     
     # Génère automatiquement le nom de la table à partir du nom de la classe
     @declared_attr
@@ -21,19 +70,39 @@ class Base:
         return cls.__name__.lower()
 
     # Colonnes communes à tous les modèles
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=generer_id)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
+    @classmethod
+    def _accesseur_colonnes(cls) -> Tuple[Tuple[str, ...], Callable[[Any], Tuple[Any, ...]]]:
+        """
+        Noms des colonnes et accesseur précalculés, une fois par classe.
+        Évite de parcourir `__table__.columns` à chaque sérialisation.
+        Les valeurs sont lues par l'attribut mappé (`prop.key`), qui peut
+        différer du nom de la colonne (`Transaction.metadonnees` -> "metadata").
+        """
+        accesseur = cls.__dict__.get("_accesseur_colonnes_cache")
+        if accesseur is None:
+            proprietes = [
+                prop for prop in cls.__mapper__.column_attrs
+                if prop.columns[0].table is cls.__table__
+            ]
+            # str() : les noms de colonnes sont des quoted_name, refusés comme clés par orjson
+            noms = tuple(str(prop.columns[0].name) for prop in proprietes)
+            lire = attrgetter(*(prop.key for prop in proprietes))
+            # attrgetter à un seul nom ne retourne pas de tuple
+            accesseur = (noms, lire if len(noms) > 1 else (lambda obj: (lire(obj),)))
+            cls._accesseur_colonnes_cache = accesseur
+        return accesseur
+
     def dict(self):
         """
         Convertit le modèle en dictionnaire.
         Utile pour la sérialisation.
         """
-        return {
-            column.name: getattr(self, column.name)
-            for column in self.__table__.columns
-        }
+        noms, lire = self._accesseur_colonnes()
+        return dict(zip(noms, lire(self)))
 
     def update(self, **kwargs):
         """
@@ -42,3 +111,74 @@ class Base:
         for key, value in kwargs.items():
             if hasattr(self, key):
                 setattr(self, key, value)
+
+    @classmethod
+    def bulk_upsert(
+        cls,
+        session: Session,
+        rows: Iterable[Dict[str, Any]],
+        key: Union[str, Sequence[str]],
+        batch_size: int = 1000,
+    ) -> Dict[str, int]:
+        """
+        Insère ou met à jour des lignes par lots (INSERT ... ON CONFLICT).
+
+        `key` désigne la clé naturelle portant une contrainte d'unicité, par
+        exemple "code" pour Produit, "matricule" pour Employe ou
+        ("employe_id", "date") pour Presence. Toutes les lignes doivent fournir
+        les mêmes colonnes. `updated_at` est positionné sur les lignes mises à
+        jour ; `id` et `created_at` des lignes existantes sont conservés.
+        Retourne {"inserted": n, "updated": n}. Ne valide pas la transaction.
+        """
+        key = (key,) if isinstance(key, str) else tuple(key)
+        rows = list(rows)
+        counts = {"inserted": 0, "updated": 0}
+        if not rows:
+            return counts
+
+        colonnes = tuple(rows[0].keys())
+        if any(set(row.keys()) != set(colonnes) for row in rows):
+            raise ValueError("Toutes les lignes doivent fournir les mêmes colonnes")
+        if not set(key) <= set(colonnes):
+            raise ValueError(f"Les lignes doivent contenir la clé {key}")
+
+        dialecte = session.get_bind(mapper=cls).dialect.name
+        construire_insert = _INSERTS_UPSERT.get(dialecte)
+        if construire_insert is None:
+            raise NotImplementedError(f"bulk_upsert n'est pas supporté pour le dialecte {dialecte}")
+
+        table = cls.__table__
+        stmt = construire_insert(table)
+        maintenant = datetime.utcnow()
+        valeurs_maj = {
+            nom: stmt.excluded[nom]
+            for nom in colonnes
+            if nom not in key and nom not in ("id", "created_at", "updated_at")
+        }
+        valeurs_maj["updated_at"] = maintenant
+        stmt = stmt.on_conflict_do_update(index_elements=list(key), set_=valeurs_maj)
+        if dialecte == "postgresql":
+            # xmax vaut 0 pour une ligne nouvellement insérée
+            stmt = stmt.returning(literal_column("(xmax = 0)").label("inserted"))
+
+        for debut in range(0, len(rows), batch_size):
+            # Une clé ne peut apparaître qu'une fois par INSERT ... ON CONFLICT :
+            # la dernière occurrence l'emporte
+            lot = {
+                tuple(row[nom] for nom in key): row
+                for row in rows[debut:debut + batch_size]
+            }
+            lot = [{"updated_at": maintenant, **row} for row in lot.values()]
+            if dialecte == "postgresql":
+                inseres = sum(1 for ligne in session.execute(stmt, lot) if ligne.inserted)
+            else:
+                colonnes_cle = [table.c[nom] for nom in key]
+                cles = [tuple(row[nom] for nom in key) for row in lot]
+                existants = session.execute(
+                    select(*colonnes_cle).where(tuple_(*colonnes_cle).in_(cles))
+                ).all()
+                session.execute(stmt, lot)
+                inseres = len(lot) - len(existants)
+            counts["inserted"] += inseres
+            counts["updated"] += len(lot) - inseres
+        return counts
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, Enum, JSON, ForeignKey, Text, Numeric, Integer, Boolean, Date, DateTime
+from sqlalchemy import Column, String, Float, Enum, JSON, ForeignKey, Text, Numeric, Integer, Boolean, Date, DateTime, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from .base import Base
 import enum
@@ -57,11 +57,11 @@ class Employe(Base):
     compte_bancaire = Column(JSON)  # Informations bancaires
     
     # Relations
-    superieur = relationship("Employe", remote_side=[id])
-    subordonnees = relationship("Employe")
+    superieur = relationship("Employe", remote_side="Employe.id", back_populates="subordonnees")
+    subordonnees = relationship("Employe", back_populates="superieur")
     contrats = relationship("Contrat", back_populates="employe")
     paies = relationship("Paie", back_populates="employe")
-    conges = relationship("Conge", back_populates="employe")
+    conges = relationship("Conge", back_populates="employe", foreign_keys="Conge.employe_id")
     presences = relationship("Presence", back_populates="employe")
 
 class Contrat(Base):
@@ -126,6 +126,13 @@ class TypePresence(str, enum.Enum):
 class Presence(Base):
     """Modèle représentant la présence d'un employé"""
     __tablename__ = "presences"
+    __table_args__ = (
+        # Une présence par employé et par jour (clé naturelle des imports)
+        UniqueConstraint("employe_id", "date", name="uq_presences_employe_date"),
+        # Pagination par curseur sur (colonne de tri, id)
+        Index("ix_presences_created_at_id", "created_at", "id"),
+        Index("ix_presences_date_id", "date", "id"),
+    )
 
     employe_id = Column(UUID(as_uuid=True), ForeignKey("employes.id"), nullable=False)
     date = Column(Date, nullable=False)
@@ -141,6 +148,10 @@ class Presence(Base):
 class Paie(Base):
     """Modèle représentant une fiche de paie"""
     __tablename__ = "paies"
+    __table_args__ = (
+        # Une fiche par employé et par période (recalcul idempotent de la paie)
+        UniqueConstraint("employe_id", "periode", name="uq_paies_employe_periode"),
+    )
 
     employe_id = Column(UUID(as_uuid=True), ForeignKey("employes.id"), nullable=False)
     periode = Column(String(7), nullable=False)  # Format: YYYY-MM
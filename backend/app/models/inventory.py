@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, Enum, JSON, ForeignKey, Text, Numeric, Integer
+from sqlalchemy import Column, String, Float, Enum, JSON, ForeignKey, Text, Numeric, Integer, DateTime, Index, func, literal_column, Boolean
 from sqlalchemy.orm import relationship
 from .base import Base
 import enum
@@ -63,6 +63,7 @@ class MouvementStock(Base):
     reference_document = Column(String(100))  # Bon de livraison, commande, etc.
     notes = Column(Text)
     cout_unitaire = Column(Numeric(10, 2))  # Pour valorisation du stock
+    lot = Column(String(50))  # Lot concerné (solde Stock par produit, entrepôt et lot)
 
     # Relations
     produit = relationship("Produit", back_populates="mouvements")
@@ -87,7 +88,11 @@ class Entrepot(Base):
     responsable = relationship("Employe", back_populates="entrepots_geres")
 
 class Stock(Base):
-    """Modèle représentant le stock actuel d'un produit dans un entrepôt"""
+    """
+    Modèle représentant le stock actuel d'un produit dans un entrepôt.
+    `quantite` est tenue par le journal des mouvements (app.services.stock_ledger) :
+    ne pas la modifier directement, passer par un MouvementStock.
+    """
     __tablename__ = "stocks"
 
     produit_id = Column(UUID(as_uuid=True), ForeignKey("produits.id"), nullable=False)
@@ -102,6 +107,122 @@ class Stock(Base):
     produit = relationship("Produit", back_populates="stocks")
     entrepot = relationship("Entrepot", back_populates="stocks")
 
+    # Un seul solde par (produit, entrepôt, lot) ; sans lot, la ligne est unique
+    # elle aussi (COALESCE, car NULL ne viole pas une contrainte d'unicité)
+    __table_args__ = (
+        Index(
+            "uq_stocks_produit_entrepot_lot",
+            "produit_id", "entrepot_id", func.coalesce(lot, literal_column("''")),
+            unique=True,
+        ),
+    )
+
+class LigneValorisation(Base):
+    """
+    Effet d'un mouvement sur un solde (produit, entrepôt, lot), valorisé au
+    coût moyen unitaire pondéré. Tenue par app.services.stock_valuation.
+    """
+    __tablename__ = "lignes_valorisation"
+
+    mouvement_id = Column(UUID(as_uuid=True), ForeignKey("mouvements_stock.id", ondelete="CASCADE"), nullable=False, index=True)
+    produit_id = Column(UUID(as_uuid=True), ForeignKey("produits.id"), nullable=False)
+    entrepot_id = Column(UUID(as_uuid=True), ForeignKey("entrepots.id"), nullable=False)
+    lot = Column(String(50))
+    date_mouvement = Column(DateTime, nullable=False)
+    type_mouvement = Column(Enum(TypeMouvement), nullable=False)
+    quantite = Column(Numeric(10, 2), nullable=False)  # Variation signée du solde
+    cout_unitaire = Column(Numeric(14, 4))  # Coût des entrées ; NULL pour les sorties
+    quantite_apres = Column(Numeric(12, 2))
+    cmup_apres = Column(Numeric(14, 4))  # Coût moyen pondéré après le mouvement
+
+    # Rejeu d'un solde à partir d'une date : parcours de l'index dans l'ordre ;
+    # stock à une date : lignes d'une période, tous entrepôts ou un seul
+    __table_args__ = (
+        Index("ix_lignes_valorisation_solde_date", "produit_id", "entrepot_id", "lot", "date_mouvement", "mouvement_id"),
+        Index("ix_lignes_valorisation_date", "date_mouvement"),
+        Index("ix_lignes_valorisation_entrepot_date", "entrepot_id", "date_mouvement"),
+    )
+
+class SnapshotStock(Base):
+    """
+    Photographie du stock valorisé de chaque solde (produit, entrepôt, lot)
+    à une date : point de départ des requêtes de stock à date.
+    """
+    __tablename__ = "snapshots_stock"
+
+    date_snapshot = Column(DateTime, nullable=False)  # Mouvements jusqu'à cette date incluse
+    produit_id = Column(UUID(as_uuid=True), ForeignKey("produits.id"), nullable=False)
+    entrepot_id = Column(UUID(as_uuid=True), ForeignKey("entrepots.id"), nullable=False)
+    lot = Column(String(50))
+    quantite = Column(Numeric(12, 2), nullable=False)
+    cmup = Column(Numeric(14, 4), nullable=False)
+
+    __table_args__ = (
+        Index(
+            "uq_snapshots_stock", "date_snapshot", "entrepot_id", "produit_id",
+            func.coalesce(lot, literal_column("''")), unique=True,
+        ),
+    )
+
+class LienTracabilite(Base):
+    """
+    Arc du graphe de traçabilité des lots : parcelle -> récolte -> lot ->
+    mouvements (entrées, transferts, expéditions), et lot -> lot dérivé
+    (conditionnement, transformation). Un nœud est un couple (type, id) ;
+    l'id d'un lot est son numéro. Tenu par app.services.lot_traceability.
+    """
+    __tablename__ = "liens_tracabilite"
+
+    amont_type = Column(String(20), nullable=False)  # parcelle, recolte, lot
+    amont_id = Column(String(64), nullable=False)
+    aval_type = Column(String(20), nullable=False)  # recolte, lot, mouvement
+    aval_id = Column(String(64), nullable=False)
+    quantite = Column(Numeric(12, 2))  # Quantité transmise (kg récoltés, quantité du mouvement...)
+
+    # Trace aval : index unique (amont -> aval) ; trace amont : index inverse
+    __table_args__ = (
+        Index("uq_liens_tracabilite", "amont_type", "amont_id", "aval_type", "aval_id", unique=True),
+        Index("ix_liens_tracabilite_aval", "aval_type", "aval_id"),
+    )
+
+class StatutAlerte(str, enum.Enum):
+    """Statuts d'une alerte de stock"""
+    ACTIVE = "ACTIVE"
+    RESOLUE = "RESOLUE"
+
+class AlerteStock(Base):
+    """
+    Alerte de stock bas : le stock d'un produit dans un entrepôt est passé
+    sous son seuil d'alerte. Au plus une alerte active par couple.
+    """
+    __tablename__ = "alertes_stock"
+
+    produit_id = Column(UUID(as_uuid=True), ForeignKey("produits.id"), nullable=False)
+    entrepot_id = Column(UUID(as_uuid=True), ForeignKey("entrepots.id"), nullable=False)
+    statut = Column(Enum(StatutAlerte), nullable=False, default=StatutAlerte.ACTIVE)
+    quantite = Column(Numeric(12, 2), nullable=False)  # Dernière quantité constatée
+    seuil = Column(Numeric(10, 2), nullable=False)
+    date_detection = Column(DateTime, default=datetime.utcnow, nullable=False)
+    date_resolution = Column(DateTime)
+    notifiee = Column(Boolean, nullable=False, default=False)
+
+    # Relations
+    produit = relationship("Produit")
+    entrepot = relationship("Entrepot")
+
+    # Index partiels : l'ensemble des alertes actives (et celles à notifier)
+    # se lit sans parcourir l'historique
+    __table_args__ = (
+        Index(
+            "uq_alertes_stock_active", "produit_id", "entrepot_id", unique=True,
+            postgresql_where=statut == StatutAlerte.ACTIVE, sqlite_where=statut == StatutAlerte.ACTIVE,
+        ),
+        Index(
+            "ix_alertes_stock_a_notifier", "date_detection",
+            postgresql_where=notifiee.is_(False), sqlite_where=notifiee.is_(False),
+        ),
+    )
+
 class Inventaire(Base):
     """Modèle représentant un inventaire physique"""
     __tablename__ = "inventaires"
@@ -122,7 +243,7 @@ class LigneInventaire(Base):
     """Modèle représentant une ligne d'inventaire"""
     __tablename__ = "lignes_inventaire"
 
-    inventaire_id = Column(UUID(as_uuid=True), ForeignKey("inventaires.id"), nullable=False)
+    inventaire_id = Column(UUID(as_uuid=True), ForeignKey("inventaires.id"), nullable=False, index=True)
     produit_id = Column(UUID(as_uuid=True), ForeignKey("produits.id"), nullable=False)
     quantite_theorique = Column(Numeric(10, 2))
     quantite_physique = Column(Numeric(10, 2))
@@ -0,0 +1,164 @@
+"""
+Profils de chargement nommés pour les modèles riches en relations.
+
+Un profil décrit, pour un modèle racine, les relations à charger par
+`selectinload` (une requête par relation, adapté aux collections) ou par
+`joinedload` (jointure, adapté aux relations many-to-one) et les colonnes à
+différer. Un endpoint récupère ainsi un graphe d'objets complet en
+1 + (nombre de relations selectin) requêtes, quel que soit le nombre de lignes.
+
+    stmt = appliquer_profil(select(Employe).where(Employe.id == employe_id), "employe_fiche")
+
+Les chemins imbriqués s'écrivent avec des points : "lignes.produit".
+"""
+from functools import lru_cache
+from typing import Dict, List, Sequence
+
+from sqlalchemy.orm import defer, joinedload, load_only, raiseload, selectinload
+
+from .base import Base
+
+PROFILS: Dict[str, Dict[str, object]] = {
+    # Fiche complète d'un employé (RH)
+    "employe_fiche": {
+        "modele": "Employe",
+        "selectin": ["contrats", "paies", "conges", "presences"],
+        "joined": ["superieur"],
+        "defer": ["compte_bancaire"],
+    },
+    # Affectations opérationnelles d'un employé
+    "employe_affectations": {
+        "modele": "Employe",
+        "selectin": ["parcelles", "entrepots_geres", "taches_assignees", "projets_diriges", "activites_realisees"],
+    },
+    # Liste des employés : colonnes d'affichage uniquement
+    "employe_liste": {
+        "modele": "Employe",
+        "load_only": ["matricule", "nom", "prenom", "departement", "poste", "statut"],
+    },
+    # Parcelle et son historique de production
+    "parcelle_with_recoltes": {
+        "modele": "Parcelle",
+        "selectin": ["recoltes", "cycles_culture"],
+        "joined": ["responsable"],
+        "defer": ["coordonnees_gps", "recoltes.conditions_meteo", "recoltes.notes"],
+    },
+    # Parcelle, cycles et activités culturales
+    "parcelle_cycles": {
+        "modele": "Parcelle",
+        "selectin": ["cycles_culture", "cycles_culture.activites"],
+        "defer": ["coordonnees_gps"],
+    },
+    # Liste des récoltes avec leur parcelle
+    "recolte_liste": {
+        "modele": "Recolte",
+        "joined": ["parcelle"],
+        "defer": ["conditions_meteo", "notes", "parcelle.coordonnees_gps"],
+    },
+    # Produit et état de son stock par entrepôt
+    "produit_stocks": {
+        "modele": "Produit",
+        "selectin": ["stocks"],
+        "joined": ["stocks.entrepot"],
+        "defer": ["specifications"],
+    },
+    # Inventaire physique avec ses lignes et produits
+    "inventaire_complet": {
+        "modele": "Inventaire",
+        "selectin": ["lignes"],
+        "joined": ["entrepot", "responsable", "lignes.produit"],
+    },
+    # Suivi de projet
+    "projet_suivi": {
+        "modele": "Projet",
+        "selectin": ["taches", "ressources", "documents"],
+        "joined": ["responsable", "parcelle"],
+    },
+}
+
+_STRATEGIES = {"selectin": selectinload, "joined": joinedload}
+
+
+class ProfilInconnu(KeyError):
+    """Levée quand un profil de chargement n'est pas déclaré"""
+
+
+def enregistrer_profil(nom: str, modele: str, selectin: Sequence[str] = (), joined: Sequence[str] = (),
+                       defer: Sequence[str] = (), load_only: Sequence[str] = ()) -> None:
+    """Déclare (ou remplace) un profil de chargement."""
+    PROFILS[nom] = {
+        "modele": modele,
+        "selectin": list(selectin),
+        "joined": list(joined),
+        "defer": list(defer),
+        "load_only": list(load_only),
+    }
+    options_profil.cache_clear()
+
+
+def _classe(nom_modele: str):
+    for mapper in Base.registry.mappers:
+        if mapper.class_.__name__ == nom_modele:
+            return mapper.class_
+    raise ProfilInconnu(f"Modèle inconnu : {nom_modele}")
+
+
+def _chaine(racine, chemin: Sequence[str], strategies: Dict[str, str]):
+    """
+    Construit l'option de chargement d'un chemin de relations.
+    Chaque étape utilise la stratégie déclarée pour son préfixe, à défaut celle
+    du chemin complet. Retourne l'option et la classe atteinte.
+    """
+    option, classe = None, racine
+    strategie_finale = strategies.get(".".join(chemin), "selectin")
+    for index, segment in enumerate(chemin):
+        prefixe = ".".join(chemin[:index + 1])
+        chargeur = _STRATEGIES[strategies.get(prefixe, strategie_finale)]
+        attribut = getattr(classe, segment)
+        option = chargeur(attribut) if option is None else getattr(option, chargeur.__name__)(attribut)
+        classe = attribut.property.mapper.class_
+    return option, classe
+
+
+@lru_cache(maxsize=None)
+def options_profil(nom: str, strict: bool = False) -> tuple:
+    """
+    Options SQLAlchemy d'un profil.
+    En mode strict, toute autre relation lève une erreur au lieu d'être chargée
+    paresseusement (garantit le nombre de requêtes).
+    """
+    try:
+        profil = PROFILS[nom]
+    except KeyError:
+        raise ProfilInconnu(f"Profil de chargement inconnu : {nom}") from None
+    racine = _classe(profil["modele"])
+
+    strategies = {}
+    for strategie in _STRATEGIES:
+        for chemin in profil.get(strategie, ()):
+            strategies[chemin] = strategie
+
+    options: List[object] = []
+    for chemin in strategies:
+        option, _ = _chaine(racine, chemin.split("."), strategies)
+        options.append(option)
+
+    for chemin in profil.get("defer", ()):
+        *relations, colonne = chemin.split(".")
+        if relations:
+            option, classe = _chaine(racine, relations, strategies)
+            options.append(option.defer(getattr(classe, colonne)))
+        else:
+            options.append(defer(getattr(racine, colonne)))
+
+    if profil.get("load_only"):
+        options.append(load_only(*(getattr(racine, colonne) for colonne in profil["load_only"])))
+
+    if strict:
+        options.append(raiseload("*"))
+    return tuple(options)
+
+
+def appliquer_profil(stmt, nom: str, strict: bool = False):
+    """Applique un profil de chargement nommé à une requête `select()`."""
+    return stmt.options(*options_profil(nom, strict))
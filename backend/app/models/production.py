@@ -1,9 +1,10 @@
-from sqlalchemy import Column, String, Float, Date, Enum, JSON, ForeignKey, Text, Numeric
+from sqlalchemy import Column, String, Float, Date, DateTime, Enum, JSON, ForeignKey, Text, Numeric, Index, Integer
 from sqlalchemy.orm import relationship
 from .base import Base
 import enum
 from datetime import date
 from typing import Optional
+from sqlalchemy.dialects.postgresql import UUID
 
 class CultureType(str, enum.Enum):
     """Types de cultures disponibles"""
@@ -51,6 +52,31 @@ class CycleCulture(Base):
     parcelle = relationship("Parcelle", back_populates="cycles_culture")
     activites = relationship("ActiviteCulturale", back_populates="cycle")
 
+class ModeleRendement(Base):
+    """
+    Modèle de rendement d'une parcelle : statistiques suffisantes de la
+    régression du rendement par récolte (kg/ha) sur l'âge des plants
+    (rendement = c0 + c1 * age + c2 * age²) et coefficients ajustés.
+    Tenu par app.services.yield_forecast.
+    """
+    __tablename__ = "modeles_rendement"
+
+    parcelle_id = Column(UUID(as_uuid=True), ForeignKey("parcelles.id", ondelete="CASCADE"), nullable=False, unique=True)
+    # Sommes sur les récoltes : n, Σa, Σa², Σa³, Σa⁴, Σy, Σay, Σa²y (a : âge en années, y : kg/ha)
+    n = Column(Integer, nullable=False, default=0)
+    sa = Column(Float, nullable=False, default=0)
+    saa = Column(Float, nullable=False, default=0)
+    saaa = Column(Float, nullable=False, default=0)
+    saaaa = Column(Float, nullable=False, default=0)
+    sy = Column(Float, nullable=False, default=0)
+    say = Column(Float, nullable=False, default=0)
+    saay = Column(Float, nullable=False, default=0)
+    c0 = Column(Float)
+    c1 = Column(Float)
+    c2 = Column(Float)
+    source = Column(String(10))  # parcelle, culture (trop peu de récoltes), moyenne
+    date_ajustement = Column(DateTime)
+
 class QualiteRecolte(str, enum.Enum):
     """Niveaux de qualité pour les récoltes"""
     A = "A"  # Premium
@@ -60,11 +86,17 @@ class QualiteRecolte(str, enum.Enum):
 class Recolte(Base):
     """Modèle représentant une récolte"""
     __tablename__ = "recoltes"
+    __table_args__ = (
+        # Pagination par curseur sur (colonne de tri, id)
+        Index("ix_recoltes_created_at_id", "created_at", "id"),
+        Index("ix_recoltes_date_recolte_id", "date_recolte", "id"),
+    )
 
     parcelle_id = Column(UUID(as_uuid=True), ForeignKey("parcelles.id"), nullable=False)
     date_recolte = Column(Date, nullable=False)
     quantite_kg = Column(Numeric(10, 2), nullable=False)
     qualite = Column(Enum(QualiteRecolte), nullable=False)
+    lot = Column(String(50), index=True)  # Lot attribué à la récolte (traçabilité)
     equipe_recolte = Column(JSON)  # Liste des IDs des employés
     conditions_meteo = Column(JSON)
     notes = Column(Text)
@@ -72,6 +104,104 @@ class Recolte(Base):
     # Relations
     parcelle = relationship("Parcelle", back_populates="recoltes")
 
+class MembreEquipeRecolte(Base):
+    """
+    Participation d'un employé à une récolte : index de `Recolte.equipe_recolte`
+    tenu par app.services.harvest_teams.
+    """
+    __tablename__ = "equipes_recolte"
+
+    recolte_id = Column(UUID(as_uuid=True), ForeignKey("recoltes.id", ondelete="CASCADE"), nullable=False)
+    employe_id = Column(UUID(as_uuid=True), ForeignKey("employes.id", ondelete="CASCADE"), nullable=False)
+    date_recolte = Column(Date, nullable=False)
+    taille_equipe = Column(Integer, nullable=False)  # Équipe déclarée, pour la part de chacun dans la récolte
+
+    __table_args__ = (
+        Index("uq_equipes_recolte", "recolte_id", "employe_id", unique=True),
+        Index("ix_equipes_recolte_employe_date", "employe_id", "date_recolte"),
+    )
+
+class AgregatRecolte(Base):
+    """
+    Production agrégée par parcelle et qualité sur une période (jour,
+    semaine ISO, mois). Tenu par app.services.harvest_rollups à chaque
+    écriture de Recolte.
+    """
+    __tablename__ = "agregats_recolte"
+
+    granularite = Column(String(10), nullable=False)  # jour, semaine, mois
+    periode = Column(Date, nullable=False)  # Premier jour de la période
+    parcelle_id = Column(UUID(as_uuid=True), ForeignKey("parcelles.id"), nullable=False)
+    culture_type = Column(Enum(CultureType), nullable=False)
+    qualite = Column(Enum(QualiteRecolte), nullable=False)
+    quantite_kg = Column(Numeric(14, 2), nullable=False, default=0)
+    nombre_recoltes = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("uq_agregats_recolte", "granularite", "periode", "parcelle_id", "qualite", unique=True),
+        Index("ix_agregats_recolte_culture", "granularite", "culture_type", "periode"),
+    )
+
+class TourneeRecolte(Base):
+    """
+    Tournée de récolte planifiée sur une parcelle, avec le nombre de plants
+    et la production attendus. Générée par app.services.harvest_planner.
+    """
+    __tablename__ = "tournees_recolte"
+
+    parcelle_id = Column(UUID(as_uuid=True), ForeignKey("parcelles.id", ondelete="CASCADE"), nullable=False)
+    date_prevue = Column(Date, nullable=False)
+    numero = Column(Integer, nullable=False)  # Rang de la tournée depuis l'entrée en production
+    plants_estimes = Column(Integer, nullable=False)
+    quantite_prevue_kg = Column(Numeric(12, 2), nullable=False)
+
+    # Relations
+    parcelle = relationship("Parcelle")
+
+    __table_args__ = (
+        Index("uq_tournees_recolte_parcelle_date", "parcelle_id", "date_prevue", unique=True),
+        Index("ix_tournees_recolte_date", "date_prevue"),
+    )
+
+class MesureCapteur(Base):
+    """
+    Relevé brut d'un capteur de terrain ou d'une station météo sur une
+    parcelle. Ingéré par lots (app.services.sensor_timeseries), purgé
+    après la durée de rétention des données brutes.
+    """
+    __tablename__ = "mesures_capteur"
+
+    parcelle_id = Column(UUID(as_uuid=True), ForeignKey("parcelles.id"), nullable=False)
+    capteur = Column(String(50), nullable=False)  # Identifiant de l'équipement
+    grandeur = Column(String(30), nullable=False)  # temperature, humidite, pluie...
+    horodatage = Column(DateTime, nullable=False)
+    valeur = Column(Float, nullable=False)
+
+    # Lecture d'une série ; purge par date (BRIN sous PostgreSQL : index
+    # minuscule sur une table remplie dans l'ordre du temps)
+    __table_args__ = (
+        Index("ix_mesures_capteur_serie", "parcelle_id", "grandeur", "horodatage"),
+        Index("ix_mesures_capteur_horodatage", "horodatage", postgresql_using="brin"),
+    )
+
+class AgregatMesure(Base):
+    """Mesures agrégées par heure ou par jour (nombre, somme, min, max)"""
+    __tablename__ = "agregats_mesure"
+
+    granularite = Column(String(10), nullable=False)  # heure, jour
+    parcelle_id = Column(UUID(as_uuid=True), ForeignKey("parcelles.id"), nullable=False)
+    grandeur = Column(String(30), nullable=False)
+    debut = Column(DateTime, nullable=False)  # Début de l'heure ou du jour
+    nombre = Column(Integer, nullable=False)
+    somme = Column(Float, nullable=False)
+    minimum = Column(Float, nullable=False)
+    maximum = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index("uq_agregats_mesure", "granularite", "parcelle_id", "grandeur", "debut", unique=True),
+        Index("ix_agregats_mesure_debut", "granularite", "debut"),
+    )
+
 class TypeActivite(str, enum.Enum):
     """Types d'activités culturales"""
     FERTILISATION = "FERTILISATION"
@@ -91,6 +221,7 @@ class ActiviteCulturale(Base):
     produits_utilises = Column(JSON)  # Liste des produits et quantités
     responsable_id = Column(UUID(as_uuid=True), ForeignKey("employes.id"))
     notes = Column(Text)
+    intrants_sortis_le = Column(DateTime)  # Sortie de stock des produits utilisés (app.services.field_inputs)
 
     # Relations
     cycle = relationship("CycleCulture", back_populates="activites")
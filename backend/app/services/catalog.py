@@ -0,0 +1,227 @@
+"""
+Catalogue des produits et entrepôts, en cache mémoire.
+
+Les mouvements, lignes d'inventaire et ressources de projet résolvent sans
+cesse les mêmes produits (par id ou par code) et entrepôts (par code) : ces
+lectures passent par un cache LRU borné par processus (app.core.cache).
+Utilisateurs : sortie des intrants (entrepôts), contrôle des seuils d'alerte
+après chaque comptabilisation de stock (`produits_par_ids`).
+
+Les valeurs en cache sont des lignes Core (`Row`, immuables), jamais des
+instances ORM liées à une session.
+
+Invalidation :
+- toute écriture sur `produits` ou `entrepots` par une Session (unit of work
+  ou `session.execute(insert/update/delete)`) est relevée et, après
+  validation de la transaction, vide le cache de la table et incrémente sa
+  génération Redis : les autres processus la voient au prochain accès ;
+- une annulation vide le cache local des tables écrites (il a pu lire des
+  lignes non validées dans la transaction), sans toucher à Redis ;
+- une écriture Core hors Session appelle `invalider(table)` après validation ;
+- une connexion dont la transaction a écrit dans `produits` ou `entrepots`
+  lit la base directement, sans lire ni remplir le cache, jusqu'à sa
+  validation ou son annulation : les lignes non validées ne sont jamais
+  servies aux autres requêtes et la transaction voit ses propres écritures
+  (seuil d'alerte relevé puis mouvement dans la même transaction).
+
+Sans `REDIS_URL`, les autres processus ne voient une modification qu'à
+l'expiration de leurs entrées : le TTL est alors ramené à
+`CATALOG_CACHE_TTL_SANS_REDIS_SECONDS` et `verifier_configuration()`
+(appelée par app.core.startup.demarrer) journalise un avertissement.
+
+Usage :
+    from app.services.catalog import produit_par_code
+    produit = produit_par_code(connexion, "ENG-NPK")
+"""
+import logging
+import uuid
+import weakref
+from typing import Any, Dict, Iterable, Optional, Set
+
+from sqlalchemy import event, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.orm import Session
+
+from ..core.cache import ABSENT, CacheLRU, generations, invalidations_cache
+from ..core.config import settings
+from ..models.inventory import Entrepot, Produit
+from .stock_ledger import par_paquets
+
+logger = logging.getLogger(__name__)
+
+TABLES = (Produit.__table__, Entrepot.__table__)
+_CLE_SESSION = "catalogue_modifie"
+
+if generations.actif:
+    _ttl = settings.CATALOG_CACHE_TTL_SECONDS
+else:
+    _ttl = min(settings.CATALOG_CACHE_TTL_SECONDS, settings.CATALOG_CACHE_TTL_SANS_REDIS_SECONDS)
+
+caches: Dict[str, CacheLRU] = {
+    table.name: CacheLRU(f"catalogue_{table.name}", settings.CATALOG_CACHE_MAX_ENTRIES, _ttl)
+    for table in TABLES
+}
+
+# Connexions dont la transaction en cours a écrit dans le catalogue -> tables écrites
+_ecritures_en_cours: "weakref.WeakKeyDictionary[Connection, Set[str]]" = weakref.WeakKeyDictionary()
+
+
+def verifier_configuration() -> None:
+    """Avertit, au démarrage du processus, que l'invalidation entre processus repose sur le seul TTL."""
+    if not generations.actif:
+        logger.warning(
+            "Cache du catalogue sans Redis : une modification faite par un autre processus "
+            "peut rester invisible jusqu'à %.0f s (TTL)", _ttl,
+        )
+
+
+def _contourne(connexion: Connection, table) -> bool:
+    """Vrai si la transaction de `connexion` a écrit dans `table` sans l'avoir encore validé."""
+    return table.name in _ecritures_en_cours.get(connexion, ())
+
+
+def _identifiant(valeur) -> Optional[uuid.UUID]:
+    """Clé `id` normalisée : une chaîne et l'UUID correspondant partagent la même entrée."""
+    if valeur is None or isinstance(valeur, uuid.UUID):
+        return valeur
+    try:
+        return uuid.UUID(str(valeur))
+    except ValueError:
+        return None
+
+
+def _synchroniser(table) -> CacheLRU:
+    cache = caches[table.name]
+    if generations.a_change(table.name):
+        cache.vider()
+        invalidations_cache.inc(cache=cache.nom, origine="distante")
+    return cache
+
+
+def _memoriser(cache: CacheLRU, ligne, version: int) -> None:
+    cache.ecrire(("id", ligne.id), ligne, version)
+    cache.ecrire(("code", ligne.code), ligne, version)
+
+
+def _chercher(connexion: Connection, table, colonne: str, valeur) -> Optional[Any]:
+    if valeur is None:
+        return None
+    if _contourne(connexion, table):
+        return connexion.execute(select(table).where(table.c[colonne] == valeur)).first()
+    cache = _synchroniser(table)
+    ligne = cache.lire((colonne, valeur))
+    if ligne is not ABSENT:
+        return ligne
+    version = cache.version
+    ligne = connexion.execute(select(table).where(table.c[colonne] == valeur)).first()
+    # Un produit absent n'est pas mis en cache : sa création ne lèverait aucune
+    # invalidation dans les processus qui ne l'ont jamais vu
+    if ligne is not None:
+        _memoriser(cache, ligne, version)
+    return ligne
+
+
+def produit_par_id(connexion: Connection, produit_id) -> Optional[Any]:
+    return _chercher(connexion, Produit.__table__, "id", _identifiant(produit_id))
+
+
+def produits_par_ids(connexion: Connection, produits_ids: Iterable[Any]) -> Dict[uuid.UUID, Any]:
+    """Produits connus parmi `produits_ids`, par identifiant ; les absents du cache sont lus en une requête."""
+    table = Produit.__table__
+    contourne = _contourne(connexion, table)
+    cache = _synchroniser(table)
+    trouves, manquants = {}, set()
+    for identifiant in filter(None, map(_identifiant, produits_ids)):
+        ligne = ABSENT if contourne else cache.lire(("id", identifiant))
+        if ligne is ABSENT:
+            manquants.add(identifiant)
+        else:
+            trouves[identifiant] = ligne
+    if manquants:
+        version = cache.version
+        for paquet in par_paquets(list(manquants)):
+            for ligne in connexion.execute(select(table).where(table.c.id.in_(paquet))):
+                if not contourne:
+                    _memoriser(cache, ligne, version)
+                trouves[ligne.id] = ligne
+    return trouves
+
+
+def produit_par_code(connexion: Connection, code: str) -> Optional[Any]:
+    return _chercher(connexion, Produit.__table__, "code", code)
+
+
+def entrepot_par_id(connexion: Connection, entrepot_id) -> Optional[Any]:
+    return _chercher(connexion, Entrepot.__table__, "id", _identifiant(entrepot_id))
+
+
+def entrepot_par_code(connexion: Connection, code: str) -> Optional[Any]:
+    return _chercher(connexion, Entrepot.__table__, "code", code)
+
+
+def invalider(table: str) -> None:
+    """Vide le cache de `table` dans ce processus et dans les autres (génération Redis)."""
+    cache = caches[table]
+    cache.vider()
+    generations.incrementer(table)
+    invalidations_cache.inc(cache=cache.nom, origine="locale")
+
+
+def _noter(session: Session, tables) -> None:
+    session.info.setdefault(_CLE_SESSION, set()).update(tables)
+
+
+@event.listens_for(Session, "after_flush")
+def _relever_flush(session: Session, flush_context) -> None:
+    tables = {
+        type(objet).__table__.name
+        for objet in (*session.new, *session.dirty, *session.deleted)
+        if isinstance(objet, (Produit, Entrepot))
+    }
+    if tables:
+        _noter(session, tables)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _relever_dml(etat) -> None:
+    if not (etat.is_insert or etat.is_update or etat.is_delete):
+        return
+    table = getattr(etat.statement, "table", None)
+    if table is not None and table.name in caches:
+        _noter(etat.session, {table.name})
+
+
+@event.listens_for(Session, "after_commit")
+def _invalider_apres_commit(session: Session) -> None:
+    for table in session.info.pop(_CLE_SESSION, ()):
+        invalider(table)
+
+
+@event.listens_for(Session, "after_rollback")
+def _oublier(session: Session) -> None:
+    for table in session.info.pop(_CLE_SESSION, ()):
+        caches[table].vider()
+
+
+@event.listens_for(Engine, "before_execute")
+def _relever_ecriture(connexion, element, *args) -> None:
+    # Flush ORM comme écriture Core : toute instruction DML sur le catalogue
+    # fait contourner le cache à la connexion jusqu'à la fin de sa transaction
+    if isinstance(element, UpdateBase):
+        table = getattr(element, "table", None)
+        if table is not None and table.name in caches:
+            _ecritures_en_cours.setdefault(connexion, set()).add(table.name)
+
+
+@event.listens_for(Engine, "commit")
+def _fin_ecriture(connexion) -> None:
+    _ecritures_en_cours.pop(connexion, None)
+
+
+@event.listens_for(Engine, "rollback")
+def _annuler_ecriture(connexion) -> None:
+    # Le cache n'a rien lu de cette transaction ; le vider reste la garantie
+    # qu'aucune ligne annulée n'y survive
+    for table in _ecritures_en_cours.pop(connexion, ()):
+        caches[table].vider()
@@ -0,0 +1,273 @@
+"""
+Sortie de stock des intrants consommés par les activités culturales.
+
+`ActiviteCulturale.produits_utilises` est une liste de lignes :
+    {"produit_id" | "produit_code" | "produit": ..., "quantite": 12.5,
+     "entrepot_id" | "entrepot_code": ... (facultatif), "lot": ... (facultatif)}
+(`produit` : identifiant ou code). Sans entrepôt, la ligne sort de
+l'entrepôt par défaut passé au traitement.
+
+`sortir_intrants(connexion, jour)` traite en un lot toutes les activités du
+jour non encore sorties :
+
+1. les activités sont verrouillées et leurs lignes décodées ;
+2. produits et soldes sont lus en une requête (produits joints à leurs
+   soldes Stock dans les entrepôts concernés) ;
+3. chaque activité est validée en entier (produit connu, quantité positive,
+   entrepôt connu, stock suffisant compte tenu des activités précédentes du
+   lot) : une activité en erreur est rejetée sans rien sortir ;
+4. les mouvements SORTIE des activités retenues sont postés en une fois
+   (`poster_mouvements`), référencés `ACT-<id>` et datés de la fin du jour de
+   réalisation (valorisation au coût moyen de ce jour, instantanés du jour),
+   et les activités marquées (`intrants_sortis_le`).
+
+Tout se fait dans la transaction de `connexion`. Une activité rejetée reste
+à sortir : corrigée, elle sera reprise au traitement suivant.
+
+Usage :
+    python -m app.services.field_inputs [--jour 2024-06-03] [--entrepot MAG-01] [--simulation]
+"""
+import argparse
+import logging
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.engine import Connection
+
+from ..models.inventory import Produit, Stock, TypeMouvement
+from ..models.production import ActiviteCulturale
+from . import catalog
+from .stock_ledger import CleStock, par_paquets, poster_mouvements
+
+logger = logging.getLogger(__name__)
+
+SORTIE, REJETEE, SANS_INTRANT = "sortie", "rejetee", "sans_intrant"
+
+
+class StockInsuffisant(ValueError):
+    """Levée quand un solde passe en négatif au postage (consommation concurrente) : le lot est annulé"""
+
+
+@dataclass
+class ResultatActivite:
+    """Issue du traitement d'une activité"""
+    activite_id: Any
+    statut: str
+    mouvements: int = 0
+    erreurs: List[str] = field(default_factory=list)
+
+
+@dataclass
+class RapportIntrants:
+    """Résultat de la sortie des intrants d'une journée"""
+    jour: date
+    activites: int = 0
+    sorties: int = 0
+    rejetees: int = 0
+    mouvements: int = 0
+    duree: float = 0.0
+    resultats: List[ResultatActivite] = field(default_factory=list)
+
+
+def _uuid(valeur: Any) -> Optional[uuid.UUID]:
+    if isinstance(valeur, uuid.UUID):
+        return valeur
+    try:
+        return uuid.UUID(str(valeur))
+    except ValueError:
+        return None
+
+
+def lire_ligne(ligne: Any) -> Optional[Dict[str, Any]]:
+    """
+    Normalise une ligne de `produits_utilises` : produit (id ou code),
+    quantité, entrepôt, lot. Retourne None si la ligne n'est pas un objet.
+    """
+    if not isinstance(ligne, dict):
+        return None
+    produit_id = _uuid(ligne["produit_id"]) if ligne.get("produit_id") else None
+    # Code saisi librement (12 au lieu de "12") : comparé à une colonne texte
+    produit_code = str(ligne["produit_code"]) if ligne.get("produit_code") is not None else None
+    if produit_id is None and produit_code is None and ligne.get("produit"):
+        produit_id = _uuid(ligne["produit"])
+        produit_code = None if produit_id else str(ligne["produit"])
+    try:
+        quantite = Decimal(str(ligne.get("quantite")))
+    except InvalidOperation:
+        quantite = None
+    return {
+        "produit_id": produit_id,
+        "produit_code": produit_code,
+        "quantite": quantite,
+        "entrepot_id": _uuid(ligne["entrepot_id"]) if ligne.get("entrepot_id") else None,
+        "entrepot_code": str(ligne["entrepot_code"]) if ligne.get("entrepot_code") is not None else None,
+        "lot": ligne.get("lot") or None,
+    }
+
+
+def _entrepot(connexion: Connection, ligne: Dict[str, Any], defaut: Optional[Any]) -> Optional[Any]:
+    if ligne["entrepot_id"] is not None:
+        trouve = catalog.entrepot_par_id(connexion, ligne["entrepot_id"])
+    elif ligne["entrepot_code"]:
+        trouve = catalog.entrepot_par_code(connexion, ligne["entrepot_code"])
+    else:
+        return defaut
+    return trouve.id if trouve is not None else None
+
+
+def lire_stocks(connexion: Connection, produits_ids: Sequence[Any], produits_codes: Sequence[str],
+                entrepots: Sequence[Any]) -> Tuple[Dict[Any, Any], Dict[str, Any], Dict[CleStock, Decimal]]:
+    """
+    Produits (par identifiant et par code) et soldes dans les `entrepots`, en
+    une requête. Retourne (identifiants connus, code -> identifiant, soldes).
+    """
+    p, s = Produit.__table__, Stock.__table__
+    lignes = connexion.execute(
+        select(p.c.id, p.c.code, s.c.entrepot_id, s.c.lot, s.c.quantite)
+        .select_from(p.outerjoin(s, and_(s.c.produit_id == p.c.id, s.c.entrepot_id.in_(list(entrepots)))))
+        .where(or_(p.c.id.in_(list(produits_ids)), p.c.code.in_(list(produits_codes))))
+    ).all()
+    connus = {ligne.id for ligne in lignes}
+    codes = {ligne.code: ligne.id for ligne in lignes}
+    soldes = {
+        (ligne.id, ligne.entrepot_id, ligne.lot or None): ligne.quantite
+        for ligne in lignes if ligne.entrepot_id is not None
+    }
+    return connus, codes, soldes
+
+
+def sortir_intrants(connexion: Connection, jour: date, entrepot_defaut: Optional[Any] = None,
+                    simulation: bool = False) -> RapportIntrants:
+    """
+    Sort du stock les intrants de toutes les activités du `jour` non encore
+    sorties. `entrepot_defaut` (identifiant ou code) sert aux lignes sans
+    entrepôt. En `simulation`, les activités sont validées sans rien écrire.
+    """
+    debut = time.perf_counter()
+    rapport = RapportIntrants(jour=jour)
+    a = ActiviteCulturale.__table__
+    activites = connexion.execute(
+        select(a.c.id, a.c.type_activite, a.c.produits_utilises, a.c.responsable_id)
+        .where(a.c.date_realisation == jour, a.c.intrants_sortis_le.is_(None))
+        .order_by(a.c.created_at, a.c.id)
+        .with_for_update()
+    ).all()
+    rapport.activites = len(activites)
+    # Consommation datée du jour de réalisation, pas du jour du traitement
+    date_mouvement = datetime.combine(jour, datetime.max.time())
+    if entrepot_defaut is not None:
+        identifiant = _uuid(entrepot_defaut)
+        trouve = (catalog.entrepot_par_id(connexion, identifiant) if identifiant
+                  else catalog.entrepot_par_code(connexion, str(entrepot_defaut)))
+        if trouve is None:
+            raise ValueError(f"Entrepôt inconnu : {entrepot_defaut}")
+        entrepot_defaut = trouve.id
+
+    lignes_activites = {}
+    for activite in activites:
+        lignes = [lire_ligne(ligne) for ligne in activite.produits_utilises or []]
+        for ligne in lignes:
+            if ligne is not None:
+                ligne["entrepot"] = _entrepot(connexion, ligne, entrepot_defaut)
+        lignes_activites[activite.id] = lignes
+    toutes = [ligne for lignes in lignes_activites.values() for ligne in lignes if ligne is not None]
+    connus, codes, soldes = lire_stocks(
+        connexion,
+        {ligne["produit_id"] for ligne in toutes if ligne["produit_id"] is not None},
+        {ligne["produit_code"] for ligne in toutes if ligne["produit_code"]},
+        {ligne["entrepot"] for ligne in toutes if ligne["entrepot"] is not None},
+    )
+
+    disponible = defaultdict(Decimal, soldes)
+    mouvements, sorties, consommes = [], [], set()
+    for activite in activites:
+        resultat = ResultatActivite(activite.id, SANS_INTRANT)
+        rapport.resultats.append(resultat)
+        lignes = lignes_activites[activite.id]
+        besoins: Dict[CleStock, Decimal] = defaultdict(Decimal)
+        for numero, ligne in enumerate(lignes, 1):
+            if ligne is None:
+                resultat.erreurs.append(f"ligne {numero} : format illisible")
+                continue
+            produit = ligne["produit_id"] if ligne["produit_id"] in connus else codes.get(ligne["produit_code"])
+            if produit is None:
+                resultat.erreurs.append(f"ligne {numero} : produit inconnu")
+            elif ligne["quantite"] is None or not ligne["quantite"].is_finite() or ligne["quantite"] <= 0:
+                resultat.erreurs.append(f"ligne {numero} : quantité invalide")
+            elif ligne["entrepot"] is None:
+                resultat.erreurs.append(f"ligne {numero} : entrepôt inconnu ou absent")
+            else:
+                besoins[(produit, ligne["entrepot"], ligne["lot"])] += ligne["quantite"]
+        for cle, quantite in besoins.items():
+            if disponible[cle] < quantite:
+                resultat.erreurs.append(
+                    f"stock insuffisant pour le produit {cle[0]} : {quantite} demandé, {disponible[cle]} disponible"
+                )
+        if resultat.erreurs:
+            resultat.statut = REJETEE
+            rapport.rejetees += 1
+            continue
+        sorties.append(activite.id)
+        if not besoins:
+            continue
+        resultat.statut = SORTIE
+        resultat.mouvements = len(besoins)
+        rapport.sorties += 1
+        for (produit, entrepot, lot), quantite in besoins.items():
+            disponible[(produit, entrepot, lot)] -= quantite
+            consommes.add((produit, entrepot, lot))
+            mouvements.append({
+                "produit_id": produit,
+                "type_mouvement": TypeMouvement.SORTIE,
+                "quantite": quantite,
+                "entrepot_source_id": entrepot,
+                "lot": lot,
+                "responsable_id": activite.responsable_id,
+                "reference_document": f"ACT-{activite.id}",
+                "date_mouvement": date_mouvement,
+                "notes": f"Intrants {activite.type_activite.value} du {jour.isoformat()}",
+            })
+    rapport.mouvements = len(mouvements)
+
+    if not simulation:
+        nouveaux_soldes = poster_mouvements(connexion, mouvements)
+        negatifs = [cle for cle in consommes if nouveaux_soldes.get(cle, Decimal(0)) < 0]
+        if negatifs:
+            raise StockInsuffisant(f"Soldes devenus négatifs pendant la sortie des intrants : {negatifs}")
+        maintenant = datetime.utcnow()
+        for paquet in par_paquets(sorties):
+            connexion.execute(
+                update(a).where(a.c.id.in_(paquet)).values(intrants_sortis_le=maintenant, updated_at=maintenant)
+            )
+
+    rapport.duree = time.perf_counter() - debut
+    logger.info("Intrants du %s : %d activités, %d sorties, %d rejetées, %d mouvements",
+                jour, rapport.activites, rapport.sorties, rapport.rejetees, rapport.mouvements)
+    return rapport
+
+
+def main() -> None:
+    from ..core.database import engine
+
+    parser = argparse.ArgumentParser(description="Sortie de stock des intrants des activités culturales")
+    parser.add_argument("--jour", type=date.fromisoformat, default=date.today())
+    parser.add_argument("--entrepot", help="code de l'entrepôt des lignes sans entrepôt")
+    parser.add_argument("--simulation", action="store_true", help="valide les activités sans rien écrire")
+    args = parser.parse_args()
+    with engine.begin() as connexion:
+        rapport = sortir_intrants(connexion, args.jour, args.entrepot, args.simulation)
+    for resultat in rapport.resultats:
+        if resultat.erreurs:
+            print(f"{resultat.activite_id} rejetée : {'; '.join(resultat.erreurs)}")
+    print(f"{rapport.activites} activités, {rapport.sorties} sorties, {rapport.rejetees} rejetées, "
+          f"{rapport.mouvements} mouvements en {rapport.duree * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Planification des tournées de récolte à partir de AGRICULTURAL_CONFIG.
+
+Pour chaque parcelle ACTIVE dont la culture est configurée
+(`culture_type` de la configuration), le calendrier d'une saison est
+calculé en une passe vectorisée (NumPy) sur toutes les parcelles :
+
+- entrée en production à `date_plantation + maturity_months`, fin après
+  `productive_years` ;
+- une tournée tous les `harvest_cycle_days` depuis l'entrée en production ;
+- plants estimés : `surface_hectares * plants_per_hectare` ;
+- production attendue par tournée :
+  `plants * yield_kg_per_plant_per_year * harvest_cycle_days / 365`.
+
+Les tournées (TourneeRecolte) sont réécrites en masse sur la fenêtre
+planifiée. Une parcelle créée ou modifiée (statut, plantation, culture,
+surface) par une session voit ses tournées futures recalculées :
+
+- au flush, la parcelle est seulement notée dans la session (aucune requête) ;
+- juste avant le commit, une seule replanification couvre toutes les
+  parcelles notées pendant la transaction. Coût : une lecture des parcelles
+  concernées, la suppression et la réécriture de leurs tournées jusqu'à la
+  fin de la saison planifiée, soit quelques dizaines de lignes par parcelle ;
+- une session d'import en masse peut poser
+  `session.info[REPLANIFICATION_MANUELLE] = True` et appeler
+  `replanifier_session(session)` (ou `planifier()` sur la saison) quand elle
+  le souhaite.
+
+Usage :
+    python -m app.services.harvest_planner              # saison en cours
+    python -m app.services.harvest_planner --annee 2025
+"""
+import argparse
+import logging
+import time
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import delete, event, func, insert, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.history import colonnes_modifiees
+from ..models.base import generer_id
+from ..models.production import CultureType, Parcelle, ParcelleStatus, TourneeRecolte
+from .stock_ledger import par_paquets
+
+logger = logging.getLogger(__name__)
+
+JOURS_PAR_MOIS = 365.25 / 12
+_COLONNES_SUIVIES = ("statut", "date_plantation", "culture_type", "surface_hectares")
+_CLE_SESSION = "parcelles_a_replanifier"
+REPLANIFICATION_MANUELLE = "replanification_manuelle"
+_EPOQUE = np.datetime64("1970-01-01", "D")
+
+
+@dataclass
+class RapportPlanification:
+    """Résultat d'une planification"""
+    parcelles: int = 0
+    tournees: int = 0
+    quantite_prevue_kg: Decimal = Decimal(0)
+    duree: float = 0.0
+
+
+def saison(annee: int) -> Tuple[date, date]:
+    """Fenêtre [début, fin) d'une saison (année civile)."""
+    return date(annee, 1, 1), date(annee + 1, 1, 1)
+
+
+def parametres_cultures(config: Dict[str, Any]) -> Dict[CultureType, Dict[str, float]]:
+    parametres = {}
+    for culture in config.values():
+        if "culture_type" not in culture:
+            continue
+        parametres[CultureType(culture["culture_type"])] = {
+            "cycle": culture["harvest_cycle_days"],
+            "plants_par_ha": culture["plants_per_hectare"],
+            "maturite": round(culture.get("maturity_months", 0) * JOURS_PAR_MOIS),
+            "duree_vie": round(culture.get("productive_years", 100) * 365.25),
+            "rendement": culture.get("yield_kg_per_plant_per_year", 0),
+        }
+    return parametres
+
+
+def calculer_tournees(plantation: np.ndarray, surface: np.ndarray, cycle: np.ndarray, plants_par_ha: np.ndarray,
+                      maturite: np.ndarray, duree_vie: np.ndarray, rendement: np.ndarray,
+                      debut: date, fin: date) -> Dict[str, np.ndarray]:
+    """
+    Tournées de toutes les parcelles sur [debut, fin), une ligne par tournée.
+    Les entrées sont des tableaux par parcelle (dates en jours depuis 1970).
+    Retourne les tableaux `parcelle` (indice d'entrée), `numero`, `jour`,
+    `plants` et `quantite`.
+    """
+    debut_j = (np.datetime64(debut, "D") - _EPOQUE).astype(np.int64)
+    fin_j = (np.datetime64(fin, "D") - _EPOQUE).astype(np.int64)
+    production = plantation + maturite
+    premier = np.maximum(debut_j, production)
+    dernier = np.minimum(fin_j, production + duree_vie)  # exclu
+    k_min = -((production - premier) // cycle)  # plafond de (premier - production) / cycle
+    k_max = -((production - dernier) // cycle)
+    nombre = np.maximum(k_max - k_min, 0)
+
+    total = int(nombre.sum())
+    parcelle = np.repeat(np.arange(len(nombre)), nombre)
+    # Rang de chaque tournée dans sa parcelle : position globale - début du bloc
+    depart_bloc = np.repeat(np.cumsum(nombre) - nombre, nombre)
+    k = np.arange(total) - depart_bloc + k_min[parcelle]
+    plants = np.rint(surface * plants_par_ha).astype(np.int64)
+    quantite = np.rint(plants * rendement * cycle / 365.0 * 100) / 100
+    return {
+        "parcelle": parcelle,
+        "numero": k + 1,
+        "jour": production[parcelle] + k * cycle[parcelle],
+        "plants": plants[parcelle],
+        "quantite": quantite[parcelle],
+    }
+
+
+def planifier(connexion: Connection, debut: date, fin: date,
+              parcelles: Optional[Sequence[Any]] = None) -> RapportPlanification:
+    """
+    Recalcule les tournées de [debut, fin) de toutes les parcelles (ou des
+    seules `parcelles`) : les tournées existantes de la fenêtre sont
+    remplacées.
+    """
+    chrono = time.perf_counter()
+    rapport = RapportPlanification()
+    p, t = Parcelle.__table__, TourneeRecolte.__table__
+    parametres = parametres_cultures(settings.AGRICULTURAL_CONFIG)
+
+    lecture = select(p.c.id, p.c.culture_type, p.c.surface_hectares, p.c.date_plantation).where(
+        p.c.statut == ParcelleStatus.ACTIVE, p.c.culture_type.in_(list(parametres))
+    )
+    effacement = delete(t).where(t.c.date_prevue >= debut, t.c.date_prevue < fin)
+    if parcelles is not None:
+        parcelles = list(parcelles)
+        lecture = lecture.where(p.c.id.in_(parcelles))
+        effacement = effacement.where(t.c.parcelle_id.in_(parcelles))
+    lignes = connexion.execute(lecture).all()
+    connexion.execute(effacement)
+    if not lignes:
+        rapport.duree = time.perf_counter() - chrono
+        return rapport
+
+    n = len(lignes)
+
+    def colonne(nom: str) -> np.ndarray:
+        return np.fromiter((parametres[ligne.culture_type][nom] for ligne in lignes), float, n)
+
+    tournees = calculer_tournees(
+        plantation=np.array([ligne.date_plantation for ligne in lignes], dtype="datetime64[D]")
+        .astype(np.int64),
+        surface=np.fromiter((float(ligne.surface_hectares) for ligne in lignes), float, n),
+        cycle=colonne("cycle").astype(np.int64),
+        plants_par_ha=colonne("plants_par_ha"),
+        maturite=colonne("maturite").astype(np.int64),
+        duree_vie=colonne("duree_vie").astype(np.int64),
+        rendement=colonne("rendement"),
+        debut=debut, fin=fin,
+    )
+
+    dates = tournees["jour"].astype("datetime64[D]").tolist()
+    ids = [ligne.id for ligne in lignes]
+    lignes_tournees = [
+        {
+            "id": generer_id(), "parcelle_id": ids[indice], "date_prevue": jour, "numero": numero,
+            "plants_estimes": plants, "quantite_prevue_kg": Decimal(f"{quantite:.2f}"),
+        }
+        for indice, jour, numero, plants, quantite in zip(
+            tournees["parcelle"].tolist(), dates, tournees["numero"].tolist(),
+            tournees["plants"].tolist(), tournees["quantite"].tolist(),
+        )
+    ]
+    for paquet in par_paquets(lignes_tournees, 10000):
+        connexion.execute(insert(t), paquet)
+
+    rapport.parcelles = n
+    rapport.tournees = len(lignes_tournees)
+    rapport.quantite_prevue_kg = Decimal(f"{tournees['quantite'].sum():.2f}")
+    rapport.duree = time.perf_counter() - chrono
+    logger.info("Planification %s - %s : %s", debut, fin, rapport)
+    return rapport
+
+
+def replanifier(connexion: Connection, parcelles: Iterable[Any], a_partir_de: Optional[date] = None) -> RapportPlanification:
+    """
+    Recalcule les tournées futures des `parcelles`, jusqu'à la fin de la
+    saison en cours ou de la dernière saison déjà planifiée.
+    """
+    a_partir_de = a_partir_de or date.today()
+    t = TourneeRecolte.__table__
+    derniere = connexion.execute(select(func.max(t.c.date_prevue))).scalar()
+    fin = saison(max(a_partir_de.year, derniere.year if derniere else a_partir_de.year))[1]
+    return planifier(connexion, a_partir_de, fin, list(parcelles))
+
+
+def replanifier_session(session: Session) -> Optional[RapportPlanification]:
+    """
+    Replanifie, dans la transaction de `session`, les parcelles créées ou
+    modifiées depuis la dernière replanification. Retourne None s'il n'y en a aucune.
+    """
+    session.flush()
+    parcelles = session.info.pop(_CLE_SESSION, None)
+    if not parcelles:
+        return None
+    return replanifier(session.connection(), parcelles)
+
+
+@event.listens_for(Session, "after_flush")
+def _noter_flush(session, flush_context):
+    modifiees = {objet.id for objet in session.new if isinstance(objet, Parcelle)}
+    for objet in session.dirty:
+        if isinstance(objet, Parcelle) and colonnes_modifiees(session, objet, _COLONNES_SUIVIES):
+            modifiees.add(objet.id)
+    if modifiees:
+        session.info.setdefault(_CLE_SESSION, set()).update(modifiees)
+
+
+@event.listens_for(Session, "before_commit")
+def _replanifier_avant_commit(session):
+    if not session.info.get(REPLANIFICATION_MANUELLE):
+        replanifier_session(session)
+
+
+@event.listens_for(Session, "after_rollback")
+def _oublier(session):
+    session.info.pop(_CLE_SESSION, None)
+
+
+def main() -> None:
+    from ..core.database import engine
+
+    parser = argparse.ArgumentParser(description="Planification des tournées de récolte")
+    parser.add_argument("--annee", type=int, default=date.today().year)
+    args = parser.parse_args()
+    debut, fin = saison(args.annee)
+    with engine.begin() as connexion:
+        rapport = planifier(connexion, debut, fin)
+    print(f"{rapport.tournees} tournées sur {rapport.parcelles} parcelles, "
+          f"{rapport.quantite_prevue_kg} kg attendus ({rapport.duree * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
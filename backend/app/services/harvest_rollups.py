@@ -0,0 +1,221 @@
+"""
+Agrégats de production des récoltes (tableaux de bord).
+
+AgregatRecolte tient, pour chaque granularité (jour, semaine ISO, mois), la
+quantité récoltée et le nombre de récoltes par période, parcelle et
+qualité, avec la culture de la parcelle. Les tableaux de bord lisent ces
+agrégats (`production()`) : leur coût ne dépend plus de l'historique des
+récoltes.
+
+Tenue incrémentale :
+- une Recolte créée, corrigée (parcelle, date, quantité, qualité) ou
+  supprimée par une session ajuste ses agrégats au flush (ancien état
+  retiré, nouvel état ajouté) ;
+- en masse (import Core), appeler `enregistrer_recoltes()` ;
+- après une reprise de données ou un changement de culture d'une parcelle,
+  `reconstruire()` recalcule les agrégats.
+
+Usage :
+    python -m app.services.harvest_rollups --reconstruire [--depuis 2024-01-01]
+"""
+import argparse
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, event, func, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from ..core.history import colonnes_modifiees, etat_avant, suivre_colonnes
+from ..models.base import generer_id
+from ..models.production import AgregatRecolte, Parcelle, Recolte
+from .stock_ledger import par_paquets
+
+logger = logging.getLogger(__name__)
+
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+JOUR, SEMAINE, MOIS = "jour", "semaine", "mois"
+GRANULARITES = (JOUR, SEMAINE, MOIS)
+DIMENSIONS = ("parcelle_id", "culture_type", "qualite")
+
+# Colonnes d'une récolte qui déterminent ses agrégats
+_COLONNES_SUIVIES = ("id", "parcelle_id", "date_recolte", "quantite_kg", "qualite")
+suivre_colonnes(Recolte, _COLONNES_SUIVIES)
+
+# Clé d'un agrégat : (granularite, periode, parcelle_id, qualite)
+CleAgregat = Tuple[str, date, Any, Any]
+
+
+def debut_periode(jour: date, granularite: str) -> date:
+    if granularite == JOUR:
+        return jour
+    if granularite == SEMAINE:
+        return jour - timedelta(days=jour.weekday())
+    if granularite == MOIS:
+        return jour.replace(day=1)
+    raise ValueError(f"Granularité inconnue : {granularite}")
+
+
+def cumuler(recoltes: Iterable[Dict[str, Any]], signe: int = 1,
+            deltas: Optional[Dict[CleAgregat, List[Decimal]]] = None) -> Dict[CleAgregat, List]:
+    """Variations [quantité, nombre] des agrégats pour des récoltes ajoutées (ou retirées, signe -1)."""
+    deltas = deltas if deltas is not None else defaultdict(lambda: [Decimal(0), 0])
+    for recolte in recoltes:
+        for granularite in GRANULARITES:
+            cle = (granularite, debut_periode(recolte["date_recolte"], granularite),
+                   recolte["parcelle_id"], recolte["qualite"])
+            delta = deltas[cle]
+            delta[0] += signe * Decimal(recolte["quantite_kg"])
+            delta[1] += signe
+    return deltas
+
+
+def appliquer(connexion: Connection, deltas: Dict[CleAgregat, List]) -> None:
+    """Ajoute les variations aux agrégats (upsert) et retire ceux qui n'ont plus de récolte."""
+    deltas = {cle: delta for cle, delta in deltas.items() if delta[0] or delta[1]}
+    if not deltas:
+        return
+    t, p = AgregatRecolte.__table__, Parcelle.__table__
+    parcelles = {cle[2] for cle in deltas}
+    cultures = {}
+    for paquet in par_paquets(parcelles):
+        cultures.update(connexion.execute(select(p.c.id, p.c.culture_type).where(p.c.id.in_(paquet))).all())
+
+    maintenant = datetime.utcnow()
+    stmt = _INSERTS[connexion.dialect.name](t)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[t.c.granularite, t.c.periode, t.c.parcelle_id, t.c.qualite],
+        set_={
+            "quantite_kg": t.c.quantite_kg + stmt.excluded.quantite_kg,
+            "nombre_recoltes": t.c.nombre_recoltes + stmt.excluded.nombre_recoltes,
+            "updated_at": maintenant,
+        },
+    )
+    lignes = [
+        {
+            "id": generer_id(), "granularite": granularite, "periode": periode, "parcelle_id": parcelle,
+            "culture_type": cultures[parcelle], "qualite": qualite,
+            "quantite_kg": quantite, "nombre_recoltes": nombre,
+            "created_at": maintenant, "updated_at": maintenant,
+        }
+        for (granularite, periode, parcelle, qualite), (quantite, nombre) in sorted(deltas.items(), key=str)
+    ]
+    for paquet in par_paquets(lignes):
+        connexion.execute(stmt, paquet)
+    for paquet in par_paquets(list(deltas)):
+        connexion.execute(delete(t).where(
+            tuple_(t.c.granularite, t.c.periode, t.c.parcelle_id, t.c.qualite).in_(paquet),
+            t.c.nombre_recoltes <= 0,
+        ))
+
+
+def enregistrer_recoltes(connexion: Connection, recoltes: Sequence[Dict[str, Any]],
+                         annulees: Sequence[Dict[str, Any]] = ()) -> None:
+    """
+    Reporte sur les agrégats des récoltes écrites (et retire `annulees`,
+    état antérieur de récoltes corrigées ou supprimées).
+    """
+    deltas = cumuler(recoltes)
+    cumuler(annulees, signe=-1, deltas=deltas)
+    appliquer(connexion, deltas)
+
+
+def _etat(recolte: Recolte) -> Dict[str, Any]:
+    return {nom: getattr(recolte, nom) for nom in _COLONNES_SUIVIES}
+
+
+@event.listens_for(Session, "after_flush")
+def _agreger_flush(session, flush_context):
+    nouvelles, annulees = [], []
+    for objet in session.new:
+        if isinstance(objet, Recolte):
+            nouvelles.append(_etat(objet))
+    for objet in session.dirty:
+        if isinstance(objet, Recolte) and colonnes_modifiees(session, objet, _COLONNES_SUIVIES):
+            annulees.append(etat_avant(objet, _COLONNES_SUIVIES))
+            nouvelles.append(_etat(objet))
+    for objet in session.deleted:
+        if isinstance(objet, Recolte):
+            annulees.append(etat_avant(objet, _COLONNES_SUIVIES))
+    if nouvelles or annulees:
+        enregistrer_recoltes(session.connection(), nouvelles, annulees)
+
+
+def reconstruire(connexion: Connection, depuis: Optional[date] = None) -> int:
+    """
+    Recalcule les agrégats depuis les récoltes (toutes, ou à partir du mois
+    de `depuis`). Les récoltes sont lues en flux. Retourne le nombre de
+    récoltes relues.
+    """
+    t, r = AgregatRecolte.__table__, Recolte.__table__
+    stmt = delete(t)
+    lecture = select(r.c.parcelle_id, r.c.date_recolte, r.c.quantite_kg, r.c.qualite)
+    if depuis is not None:
+        # Les semaines à cheval sur le début du mois sont recalculées entières
+        depuis = debut_periode(debut_periode(depuis, MOIS), SEMAINE)
+        stmt = stmt.where(t.c.periode >= depuis)
+        lecture = lecture.where(r.c.date_recolte >= depuis)
+    connexion.execute(stmt)
+    deltas = cumuler(connexion.execution_options(stream_results=True, yield_per=10000).execute(lecture).mappings())
+    nombre = sum(delta[1] for cle, delta in deltas.items() if cle[0] == JOUR)
+    if depuis is not None:
+        # Mois commencé avant la semaine recalculée : seules ses lignes
+        # postérieures ont été relues, on ne garde que les périodes effacées
+        deltas = {cle: delta for cle, delta in deltas.items() if cle[1] >= depuis}
+    appliquer(connexion, deltas)
+    logger.info("Agrégats de récolte reconstruits depuis %s : %d récoltes", depuis or "l'origine", nombre)
+    return nombre
+
+
+def production(connexion: Connection, granularite: str, debut: date, fin: date,
+               par: Sequence[str] = (), parcelle_id=None, culture_type=None, qualite=None) -> List[Any]:
+    """
+    Production (kg, nombre de récoltes) par période entre `debut` et `fin`
+    inclus, ventilée selon les dimensions `par` (parcelle_id, culture_type,
+    qualite) et filtrée au besoin. Lit uniquement les agrégats.
+    """
+    inconnues = set(par) - set(DIMENSIONS)
+    if inconnues:
+        raise ValueError(f"Dimensions inconnues : {', '.join(sorted(inconnues))}")
+    t = AgregatRecolte.__table__
+    colonnes = [t.c.periode, *(t.c[dimension] for dimension in par)]
+    stmt = (
+        select(*colonnes, func.sum(t.c.quantite_kg).label("quantite_kg"),
+               func.sum(t.c.nombre_recoltes).label("nombre_recoltes"))
+        .where(t.c.granularite == granularite,
+               t.c.periode >= debut_periode(debut, granularite), t.c.periode <= fin)
+        .group_by(*colonnes)
+        .order_by(*colonnes)
+    )
+    for colonne, valeur in (("parcelle_id", parcelle_id), ("culture_type", culture_type), ("qualite", qualite)):
+        if valeur is not None:
+            stmt = stmt.where(t.c[colonne] == valeur)
+    return connexion.execute(stmt).all()
+
+
+def main() -> None:
+    from ..core.database import engine
+
+    parser = argparse.ArgumentParser(description="Agrégats de production des récoltes")
+    parser.add_argument("--reconstruire", action="store_true", help="recalcule les agrégats depuis les récoltes")
+    parser.add_argument("--depuis", type=date.fromisoformat, help="premier mois à recalculer")
+    parser.add_argument("--granularite", choices=GRANULARITES, default=MOIS)
+    args = parser.parse_args()
+    with engine.begin() as connexion:
+        if args.reconstruire:
+            print(f"{reconstruire(connexion, args.depuis)} récoltes agrégées")
+            return
+        fin = date.today()
+        for ligne in production(connexion, args.granularite, args.depuis or fin.replace(month=1, day=1), fin,
+                                par=("culture_type",)):
+            print(f"{ligne.periode} {ligne.culture_type.value:<8} {ligne.quantite_kg:>12} kg "
+                  f"({ligne.nombre_recoltes} récoltes)")
+
+
+if __name__ == "__main__":
+    main()
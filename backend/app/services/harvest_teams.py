@@ -0,0 +1,173 @@
+"""
+Index des équipes de récolte.
+
+`Recolte.equipe_recolte` (liste JSON d'identifiants d'employés) est recopiée
+dans la table `equipes_recolte`, indexée par (employé, date) : les récoltes
+d'un cueilleur sur une période et sa production (paie à la tâche,
+productivité) se lisent par l'index, sans décoder le JSON des récoltes.
+
+- une Recolte créée, modifiée (équipe, date) ou supprimée par une session
+  met à jour ses lignes au flush. L'équipe doit être réaffectée
+  (`recolte.equipe_recolte = [...]`) : une modification sur place de la
+  liste n'est pas vue par l'ORM ;
+- en masse, appeler `indexer_equipes()` ;
+- les identifiants inconnus (employé absent de `employes`) ne reçoivent pas
+  de ligne mais comptent dans `taille_equipe`, qui reste la taille de
+  l'équipe déclarée : la part de chacun ne dépend pas de l'enregistrement
+  des autres cueilleurs, et la part des inconnus n'est attribuée à
+  personne ;
+- un employé enregistré après la récolte n'est indexé qu'au prochain
+  enregistrement de celle-ci ou à `reconstruire()`.
+
+Usage :
+    python -m app.services.harvest_teams --reconstruire
+    python -m app.services.harvest_teams --debut 2024-06-01 --fin 2024-06-30   # production par cueilleur
+"""
+import argparse
+import logging
+import uuid
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import delete, event, func, insert, inspect, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from ..models.base import generer_id
+from ..models.hr import Employe
+from ..models.production import MembreEquipeRecolte, Recolte
+from .stock_ledger import par_paquets
+
+logger = logging.getLogger(__name__)
+
+_COLONNES_SUIVIES = ("equipe_recolte", "date_recolte")
+
+
+def _identifiants(equipe: Any) -> List[uuid.UUID]:
+    identifiants = []
+    for valeur in equipe or []:
+        try:
+            identifiant = valeur if isinstance(valeur, uuid.UUID) else uuid.UUID(str(valeur))
+        except ValueError:
+            logger.warning("Identifiant d'employé invalide dans une équipe de récolte : %r", valeur)
+            continue
+        if identifiant not in identifiants:
+            identifiants.append(identifiant)
+    return identifiants
+
+
+def indexer_equipes(connexion: Connection, recoltes: Iterable[Dict[str, Any]],
+                    supprimees: Iterable[Any] = ()) -> int:
+    """
+    Réécrit les lignes d'équipe des récoltes données (dictionnaires id,
+    date_recolte, equipe_recolte) et retire celles des récoltes supprimées.
+    Retourne le nombre de lignes écrites.
+    """
+    recoltes = list(recoltes)
+    m, e = MembreEquipeRecolte.__table__, Employe.__table__
+    for paquet in par_paquets([r["id"] for r in recoltes] + list(supprimees)):
+        connexion.execute(delete(m).where(m.c.recolte_id.in_(paquet)))
+
+    equipes = {r["id"]: _identifiants(r.get("equipe_recolte")) for r in recoltes}
+    connus = set()
+    for paquet in par_paquets({i for equipe in equipes.values() for i in equipe}):
+        connus.update(connexion.execute(select(e.c.id).where(e.c.id.in_(paquet))).scalars())
+
+    # taille_equipe : équipe déclarée (identifiants valides), connus ou non
+    lignes = [
+        {
+            "id": generer_id(), "recolte_id": recolte["id"], "employe_id": employe,
+            "date_recolte": recolte["date_recolte"], "taille_equipe": len(equipes[recolte["id"]]),
+        }
+        for recolte in recoltes
+        for employe in equipes[recolte["id"]]
+        if employe in connus
+    ]
+    for paquet in par_paquets(lignes, 10000):
+        connexion.execute(insert(m), paquet)
+    return len(lignes)
+
+
+@event.listens_for(Session, "after_flush")
+def _indexer_flush(session, flush_context):
+    recoltes = [objet for objet in session.new if isinstance(objet, Recolte)]
+    for objet in session.dirty:
+        if isinstance(objet, Recolte) and session.is_modified(objet):
+            attributs = inspect(objet).attrs
+            if any(attributs[nom].history.has_changes() for nom in _COLONNES_SUIVIES):
+                recoltes.append(objet)
+    supprimees = [objet.id for objet in session.deleted if isinstance(objet, Recolte)]
+    if recoltes or supprimees:
+        indexer_equipes(
+            session.connection(),
+            [{"id": r.id, "date_recolte": r.date_recolte, "equipe_recolte": r.equipe_recolte} for r in recoltes],
+            supprimees,
+        )
+
+
+def reconstruire(connexion: Connection, taille_lot: int = 10000) -> int:
+    """Recalcule tout l'index depuis les récoltes, lues en flux. Retourne le nombre de lignes."""
+    r = Recolte.__table__
+    connexion.execute(delete(MembreEquipeRecolte.__table__))
+    resultat = connexion.execution_options(stream_results=True, yield_per=taille_lot).execute(
+        select(r.c.id, r.c.date_recolte, r.c.equipe_recolte).where(r.c.equipe_recolte.isnot(None))
+    )
+    total = 0
+    for paquet in resultat.mappings().partitions():
+        total += indexer_equipes(connexion, paquet)
+    return total
+
+
+def recoltes_employe(connexion: Connection, employe_id, debut: date, fin: date) -> List[Any]:
+    """Récoltes d'un employé entre `debut` et `fin` inclus, avec sa part du poids récolté."""
+    m, r = MembreEquipeRecolte.__table__, Recolte.__table__
+    return connexion.execute(
+        select(r.c.id, r.c.date_recolte, r.c.parcelle_id, r.c.quantite_kg, r.c.qualite, m.c.taille_equipe,
+               (r.c.quantite_kg / m.c.taille_equipe).label("part_kg"))
+        .join(r, r.c.id == m.c.recolte_id)
+        .where(m.c.employe_id == employe_id, m.c.date_recolte >= debut, m.c.date_recolte <= fin)
+        .order_by(m.c.date_recolte)
+    ).all()
+
+
+def production_par_employe(connexion: Connection, debut: date, fin: date,
+                           employes: Optional[Sequence[Any]] = None) -> List[Any]:
+    """
+    Par employé sur la période : nombre de récoltes, poids total des
+    récoltes auxquelles il a participé et sa part (poids / taille d'équipe).
+    """
+    m, r = MembreEquipeRecolte.__table__, Recolte.__table__
+    stmt = (
+        select(m.c.employe_id, func.count().label("recoltes"),
+               func.sum(r.c.quantite_kg).label("quantite_kg"),
+               func.sum(r.c.quantite_kg / m.c.taille_equipe).label("part_kg"))
+        .join(r, r.c.id == m.c.recolte_id)
+        .where(m.c.date_recolte >= debut, m.c.date_recolte <= fin)
+        .group_by(m.c.employe_id)
+        .order_by(m.c.employe_id)
+    )
+    if employes is not None:
+        stmt = stmt.where(m.c.employe_id.in_(list(employes)))
+    return connexion.execute(stmt).all()
+
+
+def main() -> None:
+    from ..core.database import engine
+
+    parser = argparse.ArgumentParser(description="Index des équipes de récolte")
+    parser.add_argument("--reconstruire", action="store_true", help="recalcule l'index depuis les récoltes")
+    parser.add_argument("--debut", type=date.fromisoformat)
+    parser.add_argument("--fin", type=date.fromisoformat)
+    args = parser.parse_args()
+    with engine.begin() as connexion:
+        if args.reconstruire:
+            print(f"{reconstruire(connexion)} participations indexées")
+            return
+        fin = args.fin or date.today()
+        debut = args.debut or fin.replace(day=1)
+        for ligne in production_par_employe(connexion, debut, fin):
+            print(f"{ligne.employe_id} {ligne.recoltes:>5} récoltes {ligne.part_kg:>12.2f} kg")
+
+
+if __name__ == "__main__":
+    main()
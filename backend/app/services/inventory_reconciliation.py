@@ -0,0 +1,179 @@
+"""
+Rapprochement d'un inventaire physique avec le stock théorique.
+
+Le rapprochement travaille par ensembles, jamais ligne à ligne en Python :
+
+1. `quantite_theorique` de toutes les lignes est renseignée depuis Stock par
+   une seule requête UPDATE (sous-requête corrélée sur l'index des soldes) ;
+2. `ecart = quantite_physique - quantite_theorique` par une seconde UPDATE ;
+3. les lignes en écart sont lues en flux et deviennent des mouvements
+   AJUSTEMENT comptabilisés par paquets (`poster_mouvements`) ;
+4. le résumé est enregistré dans `Inventaire.ecarts` et l'inventaire passe
+   « Validé ».
+
+Les lignes d'inventaire ne portent pas de lot : l'écart d'un produit est
+calculé sur son stock tous lots confondus et régularisé sur le solde sans lot.
+
+Usage :
+    python -m app.services.inventory_reconciliation <inventaire_id> [--simulation]
+"""
+import argparse
+import logging
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterator, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.engine import Connection
+
+from ..core.serialization import flux_json
+from ..models.inventory import Inventaire, LigneInventaire, Produit, Stock, TypeMouvement
+from .stock_ledger import poster_mouvements
+
+logger = logging.getLogger(__name__)
+
+STATUT_VALIDE = "Validé"
+STATUT_TERMINE = "Terminé"
+TAILLE_PAQUET = 5000
+
+
+class InventaireDejaValide(ValueError):
+    """Levée quand on rapproche un inventaire déjà validé (ajustements déjà passés)"""
+
+
+@dataclass
+class RapportRapprochement:
+    """Résumé d'un rapprochement, enregistré dans Inventaire.ecarts"""
+    lignes: int = 0
+    lignes_comptees: int = 0
+    ecarts: int = 0
+    surplus: Decimal = Decimal(0)
+    manquants: Decimal = Decimal(0)
+    ajustements: int = 0
+    duree: float = 0.0
+
+    def resume(self) -> Dict[str, Any]:
+        resume = asdict(self)
+        resume["surplus"], resume["manquants"] = str(self.surplus), str(self.manquants)
+        resume["duree"] = round(self.duree, 3)
+        resume["date_rapprochement"] = datetime.utcnow().isoformat()
+        return resume
+
+
+def calculer_ecarts(connexion: Connection, inventaire_id, entrepot_id) -> None:
+    """Renseigne quantités théoriques et écarts de toutes les lignes (deux UPDATE)."""
+    l, s = LigneInventaire.__table__, Stock.__table__
+    theorique = (
+        select(func.coalesce(func.sum(s.c.quantite), 0))
+        .where(s.c.produit_id == l.c.produit_id, s.c.entrepot_id == entrepot_id)
+        .scalar_subquery()
+    )
+    connexion.execute(
+        update(l).where(l.c.inventaire_id == inventaire_id).values(quantite_theorique=theorique)
+    )
+    # Ligne non comptée (quantité physique absente) : pas d'écart
+    connexion.execute(
+        update(l).where(l.c.inventaire_id == inventaire_id)
+        .values(ecart=l.c.quantite_physique - l.c.quantite_theorique)
+    )
+
+
+def iterer_ecarts(connexion: Connection, inventaire_id) -> Iterator[Dict[str, Any]]:
+    """Lignes en écart, lues en flux, avec le code et le nom du produit."""
+    l, p = LigneInventaire.__table__, Produit.__table__
+    resultat = connexion.execution_options(stream_results=True, yield_per=TAILLE_PAQUET).execute(
+        select(l.c.id, l.c.produit_id, p.c.code, p.c.nom, l.c.quantite_theorique,
+               l.c.quantite_physique, l.c.ecart)
+        .join(p, p.c.id == l.c.produit_id)
+        .where(l.c.inventaire_id == inventaire_id, l.c.ecart != 0)
+        .order_by(p.c.code)
+    )
+    for ligne in resultat.mappings():
+        yield dict(ligne)
+
+
+def flux_ecarts(connexion: Connection, inventaire_id) -> Iterator[bytes]:
+    """Export JSON en flux des écarts (réponse HTTP en streaming, fichier)."""
+    return flux_json(iterer_ecarts(connexion, inventaire_id))
+
+
+def rapprocher(connexion: Connection, inventaire_id, ajuster: bool = True,
+               responsable_id: Optional[uuid.UUID] = None) -> RapportRapprochement:
+    """
+    Rapproche l'inventaire `inventaire_id` dans la transaction de `connexion`.
+    Avec `ajuster`, les écarts sont régularisés par des mouvements AJUSTEMENT
+    et l'inventaire est validé ; sinon il passe « Terminé » sans mouvement.
+    """
+    debut = time.perf_counter()
+    i, l = Inventaire.__table__, LigneInventaire.__table__
+    inventaire = connexion.execute(
+        select(i.c.entrepot_id, i.c.statut, i.c.responsable_id).where(i.c.id == inventaire_id).with_for_update()
+    ).one()
+    if inventaire.statut == STATUT_VALIDE:
+        raise InventaireDejaValide(f"Inventaire {inventaire_id} déjà validé")
+
+    calculer_ecarts(connexion, inventaire_id, inventaire.entrepot_id)
+
+    rapport = RapportRapprochement()
+    totaux = connexion.execute(
+        select(func.count(), func.count(l.c.quantite_physique)).where(l.c.inventaire_id == inventaire_id)
+    ).one()
+    rapport.lignes, rapport.lignes_comptees = totaux
+
+    reference = f"INV-{inventaire_id}"
+    paquet = []
+    for ligne in iterer_ecarts(connexion, inventaire_id):
+        ecart = Decimal(ligne["ecart"])
+        rapport.ecarts += 1
+        if ecart > 0:
+            rapport.surplus += ecart
+        else:
+            rapport.manquants -= ecart
+        if not ajuster:
+            continue
+        paquet.append({
+            "produit_id": ligne["produit_id"],
+            "type_mouvement": TypeMouvement.AJUSTEMENT,
+            "quantite": ecart,
+            "entrepot_destination_id": inventaire.entrepot_id,
+            "responsable_id": responsable_id or inventaire.responsable_id,
+            "reference_document": reference,
+            "notes": "Régularisation d'inventaire",
+        })
+        if len(paquet) >= TAILLE_PAQUET:
+            poster_mouvements(connexion, paquet)
+            rapport.ajustements, paquet = rapport.ajustements + len(paquet), []
+    if paquet:
+        poster_mouvements(connexion, paquet)
+        rapport.ajustements += len(paquet)
+
+    rapport.duree = time.perf_counter() - debut
+    connexion.execute(
+        update(i).where(i.c.id == inventaire_id).values(
+            ecarts=rapport.resume(),
+            statut=STATUT_VALIDE if ajuster else STATUT_TERMINE,
+            updated_at=datetime.utcnow(),
+        )
+    )
+    logger.info("Inventaire %s rapproché : %s", inventaire_id, rapport)
+    return rapport
+
+
+def main() -> None:
+    from ..core.database import engine
+
+    parser = argparse.ArgumentParser(description="Rapprochement d'un inventaire physique")
+    parser.add_argument("inventaire_id", type=uuid.UUID)
+    parser.add_argument("--simulation", action="store_true", help="calcule les écarts sans ajustement")
+    args = parser.parse_args()
+    with engine.begin() as connexion:
+        rapport = rapprocher(connexion, args.inventaire_id, ajuster=not args.simulation)
+    print(f"{rapport.lignes} lignes, {rapport.ecarts} écarts (surplus {rapport.surplus}, "
+          f"manquants {rapport.manquants}), {rapport.ajustements} ajustements en {rapport.duree:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+Traçabilité des lots, de la parcelle à l'expédition.
+
+Le graphe (LienTracabilite) est tenu au fil de l'eau :
+
+    parcelle -> recolte -> lot -> mouvement (entrée, transfert, sortie...)
+                           lot -> lot dérivé (`deriver_lot`)
+
+- une Recolte écrite par une session (création, changement de lot ou de
+  parcelle, suppression) met à jour ses arcs au flush ; en masse, appeler
+  `indexer_recoltes()` ;
+- un mouvement portant un lot est relié à son lot par l'écouteur du journal
+  de stock, ORM comme `poster_mouvements()`.
+
+Une trace est une requête récursive (WITH RECURSIVE) sur les deux index du
+graphe : son coût dépend de la taille de la trace, pas de l'historique.
+Les numéros de lot sont supposés uniques tous produits confondus.
+
+Usage :
+    python -m app.services.lot_traceability <lot>              # rappel : origine et destinations du lot
+    python -m app.services.lot_traceability --reconstruire     # recalcule le graphe (hors dérivations)
+"""
+import argparse
+import logging
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Tuple
+
+from sqlalchemy import and_, delete, event, func, inspect, literal, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from ..models.base import generer_id
+from ..models.inventory import LienTracabilite, MouvementStock, TypeMouvement
+from ..models.production import Recolte
+from .stock_ledger import CleStock, enregistrer_ecouteur, par_paquets
+
+logger = logging.getLogger(__name__)
+
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+PARCELLE, RECOLTE, LOT, MOUVEMENT = "parcelle", "recolte", "lot", "mouvement"
+PROFONDEUR_MAX = 50
+
+# Noeud du graphe : (type, id)
+Noeud = Tuple[str, str]
+
+
+@dataclass
+class TraceLot:
+    """Rappel d'un lot : son origine (amont) et ses destinations (aval)"""
+    lot: str
+    lots_amont: List[str] = field(default_factory=list)
+    lots_aval: List[str] = field(default_factory=list)
+    recoltes: List[Any] = field(default_factory=list)
+    mouvements: List[Any] = field(default_factory=list)
+
+    @property
+    def parcelles(self) -> List[Any]:
+        return sorted({recolte.parcelle_id for recolte in self.recoltes}, key=str)
+
+    @property
+    def expeditions(self) -> List[Any]:
+        """Sorties du stock (livraisons clients) des lots de la trace"""
+        return [mouvement for mouvement in self.mouvements if mouvement.type_mouvement == TypeMouvement.SORTIE]
+
+
+def _inserer(connexion: Connection, liens: List[Dict[str, Any]]) -> None:
+    if not liens:
+        return
+    t = LienTracabilite.__table__
+    stmt = _INSERTS[connexion.dialect.name](t).on_conflict_do_nothing(
+        index_elements=[t.c.amont_type, t.c.amont_id, t.c.aval_type, t.c.aval_id]
+    )
+    for paquet in par_paquets(liens):
+        connexion.execute(stmt, paquet)
+
+
+def _lien(amont: Noeud, aval: Noeud, quantite=None) -> Dict[str, Any]:
+    return {
+        "id": generer_id(), "amont_type": amont[0], "amont_id": amont[1],
+        "aval_type": aval[0], "aval_id": aval[1], "quantite": quantite,
+    }
+
+
+def _supprimer(connexion: Connection, type_noeud: str, ids: Iterable[str]) -> None:
+    """Supprime les arcs qui touchent les noeuds `ids` (entrants et sortants)."""
+    t = LienTracabilite.__table__
+    for paquet in par_paquets(ids):
+        connexion.execute(delete(t).where(or_(
+            and_(t.c.aval_type == type_noeud, t.c.aval_id.in_(paquet)),
+            and_(t.c.amont_type == type_noeud, t.c.amont_id.in_(paquet)),
+        )))
+
+
+# --- Tenue du graphe ---
+
+def indexer_recoltes(connexion: Connection, recoltes: Iterable[Dict[str, Any]],
+                     supprimees: Iterable[Any] = ()) -> None:
+    """
+    (Re)crée les arcs parcelle -> recolte -> lot des récoltes données
+    (dictionnaires id, parcelle_id, lot, quantite_kg) et retire ceux des
+    récoltes supprimées.
+    """
+    recoltes = list(recoltes)
+    _supprimer(connexion, RECOLTE, [str(r["id"]) for r in recoltes] + [str(i) for i in supprimees])
+    _inserer(connexion, _liens_recoltes(recoltes))
+
+
+def _liens_recoltes(recoltes: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    liens = []
+    for recolte in recoltes:
+        noeud = (RECOLTE, str(recolte["id"]))
+        liens.append(_lien((PARCELLE, str(recolte["parcelle_id"])), noeud, recolte.get("quantite_kg")))
+        if recolte.get("lot"):
+            liens.append(_lien(noeud, (LOT, recolte["lot"]), recolte.get("quantite_kg")))
+    return liens
+
+
+def deriver_lot(connexion: Connection, lot_source: str, lot_derive: str, quantite=None) -> None:
+    """Enregistre que `lot_derive` est issu (en tout ou partie) de `lot_source`."""
+    _inserer(connexion, [_lien((LOT, lot_source), (LOT, lot_derive), quantite)])
+
+
+@enregistrer_ecouteur
+def relier_mouvements(connexion: Connection, mouvements: List[Dict[str, Any]],
+                      annules: List[Dict[str, Any]], soldes: Dict[CleStock, Any]) -> None:
+    """Écouteur du journal : relie chaque mouvement à son lot."""
+    if annules:
+        t = LienTracabilite.__table__
+        for paquet in par_paquets([str(m["id"]) for m in annules]):
+            connexion.execute(delete(t).where(t.c.aval_type == MOUVEMENT, t.c.aval_id.in_(paquet)))
+    _inserer(connexion, [
+        _lien((LOT, mouvement["lot"]), (MOUVEMENT, str(mouvement["id"])), abs(mouvement["quantite"]))
+        for mouvement in mouvements if mouvement.get("lot")
+    ])
+
+
+@event.listens_for(Session, "after_flush")
+def _indexer_flush(session, flush_context):
+    recoltes, supprimees = [], []
+    for objet in session.new:
+        if isinstance(objet, Recolte):
+            recoltes.append(objet)
+    for objet in session.dirty:
+        if isinstance(objet, Recolte) and session.is_modified(objet):
+            attributs = inspect(objet).attrs
+            if any(attributs[nom].history.has_changes() for nom in ("parcelle_id", "lot", "quantite_kg")):
+                recoltes.append(objet)
+    for objet in session.deleted:
+        if isinstance(objet, Recolte):
+            supprimees.append(objet.id)
+    if recoltes or supprimees:
+        indexer_recoltes(
+            session.connection(),
+            [{"id": r.id, "parcelle_id": r.parcelle_id, "lot": r.lot, "quantite_kg": r.quantite_kg}
+             for r in recoltes],
+            supprimees,
+        )
+
+
+def reconstruire(connexion: Connection) -> int:
+    """
+    Recalcule les arcs des récoltes et des mouvements depuis les tables
+    sources (reprise, backfill). Les dérivations lot -> lot, qui n'existent
+    que dans le graphe, sont conservées. Retourne le nombre d'arcs.
+    """
+    t, r, m = LienTracabilite.__table__, Recolte.__table__, MouvementStock.__table__
+    connexion.execute(delete(t).where(t.c.amont_type != LOT))
+    connexion.execute(delete(t).where(t.c.amont_type == LOT, t.c.aval_type == MOUVEMENT))
+    _inserer(connexion, _liens_recoltes(connexion.execute(
+        select(r.c.id, r.c.parcelle_id, r.c.lot, r.c.quantite_kg)
+    ).mappings()))
+    relier_mouvements(connexion, [dict(ligne) for ligne in connexion.execute(
+        select(m.c.id, m.c.lot, m.c.quantite).where(m.c.lot.isnot(None))
+    ).mappings()], [], {})
+    return connexion.execute(select(func.count()).select_from(t)).scalar()
+
+
+# --- Traces ---
+
+def tracer(connexion: Connection, depart: Noeud, sens: str = "aval",
+           profondeur_max: int = PROFONDEUR_MAX) -> Dict[Noeud, int]:
+    """
+    Noeuds atteignables depuis `depart` vers l'aval (destinations) ou l'amont
+    (origines), avec leur distance en arcs.
+    """
+    t = LienTracabilite.__table__
+    if sens == "aval":
+        de, vers = (t.c.amont_type, t.c.amont_id), (t.c.aval_type, t.c.aval_id)
+    elif sens == "amont":
+        de, vers = (t.c.aval_type, t.c.aval_id), (t.c.amont_type, t.c.amont_id)
+    else:
+        raise ValueError(f"Sens de trace inconnu : {sens}")
+    trace = select(
+        vers[0].label("type_noeud"), vers[1].label("id_noeud"), literal(1).label("profondeur")
+    ).where(de[0] == depart[0], de[1] == depart[1]).cte("trace", recursive=True)
+    trace = trace.union_all(
+        select(vers[0], vers[1], trace.c.profondeur + 1)
+        .join(trace, and_(de[0] == trace.c.type_noeud, de[1] == trace.c.id_noeud))
+        .where(trace.c.profondeur < profondeur_max)
+    )
+    return {
+        (ligne.type_noeud, ligne.id_noeud): ligne.profondeur
+        for ligne in connexion.execute(
+            select(trace.c.type_noeud, trace.c.id_noeud, func.min(trace.c.profondeur).label("profondeur"))
+            .group_by(trace.c.type_noeud, trace.c.id_noeud)
+        )
+    }
+
+
+def _ids(noeuds: Iterable[Noeud], type_noeud: str) -> List[str]:
+    return sorted(identifiant for type_, identifiant in noeuds if type_ == type_noeud)
+
+
+def rappel(connexion: Connection, lot: str) -> TraceLot:
+    """
+    Trace complète d'un lot : récoltes et parcelles d'origine (lots amont
+    compris), lots dérivés et tous les mouvements des lots aval, dont les
+    expéditions.
+    """
+    amont = tracer(connexion, (LOT, lot), "amont")
+    aval = tracer(connexion, (LOT, lot), "aval")
+    trace = TraceLot(lot=lot, lots_amont=_ids(amont, LOT), lots_aval=_ids(aval, LOT))
+
+    r, m = Recolte.__table__, MouvementStock.__table__
+    for paquet in par_paquets([uuid.UUID(i) for i in _ids(amont, RECOLTE)]):
+        trace.recoltes.extend(connexion.execute(
+            select(r.c.id, r.c.parcelle_id, r.c.date_recolte, r.c.quantite_kg, r.c.qualite, r.c.lot)
+            .where(r.c.id.in_(paquet))
+        ).all())
+    trace.recoltes.sort(key=lambda recolte: recolte.date_recolte)
+    for paquet in par_paquets([uuid.UUID(i) for i in _ids(aval, MOUVEMENT)]):
+        trace.mouvements.extend(connexion.execute(
+            select(m.c.id, m.c.date_mouvement, m.c.type_mouvement, m.c.produit_id, m.c.lot, m.c.quantite,
+                   m.c.entrepot_source_id, m.c.entrepot_destination_id, m.c.reference_document)
+            .where(m.c.id.in_(paquet))
+        ).all())
+    trace.mouvements.sort(key=lambda mouvement: mouvement.date_mouvement)
+    return trace
+
+
+def origine_mouvement(connexion: Connection, mouvement_id) -> List[Any]:
+    """Parcelles d'origine d'un mouvement (réclamation sur une livraison)."""
+    amont = tracer(connexion, (MOUVEMENT, str(mouvement_id)), "amont")
+    return [uuid.UUID(i) for i in _ids(amont, PARCELLE)]
+
+
+def main() -> None:
+    from ..core.database import engine
+
+    parser = argparse.ArgumentParser(description="Traçabilité des lots")
+    parser.add_argument("lot", nargs="?")
+    parser.add_argument("--reconstruire", action="store_true", help="recalcule le graphe depuis les tables sources")
+    args = parser.parse_args()
+    with engine.begin() as connexion:
+        if args.reconstruire:
+            print(f"{reconstruire(connexion)} arcs de traçabilité")
+            return
+        if not args.lot:
+            parser.error("lot requis")
+        trace = rappel(connexion, args.lot)
+    print(f"Lot {trace.lot} : lots amont {trace.lots_amont or '-'}, lots dérivés {trace.lots_aval or '-'}")
+    for recolte in trace.recoltes:
+        print(f"  récolte {recolte.date_recolte} parcelle {recolte.parcelle_id} {recolte.quantite_kg} kg ({recolte.qualite})")
+    for mouvement in trace.mouvements:
+        print(f"  {mouvement.date_mouvement:%Y-%m-%d} {mouvement.type_mouvement} {mouvement.quantite} "
+              f"lot {mouvement.lot} {mouvement.reference_document or ''}")
+
+
+if __name__ == "__main__":
+    main()
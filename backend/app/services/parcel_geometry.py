@@ -0,0 +1,278 @@
+"""
+Index spatial des parcelles (géolocalisation des équipements de terrain).
+
+`Parcelle.coordonnees_gps` est lu une fois, converti en arêtes de polygones
+(NumPy) et rangé dans un R-tree en mémoire construit par tri STR
+(Sort-Tile-Recursive). L'index sert :
+
+- `localiser(connexion, points)` : parcelle de chaque point, en masse
+  (milliers de relevés par appel, parcours de l'arbre vectorisé) ;
+- `parcelle_du_point(connexion, lon, lat)` : un seul point ;
+- `parcelles_dans_boite(connexion, ...)` : parcelles dont l'emprise coupe un
+  rectangle.
+
+Formats de `coordonnees_gps` reconnus : géométrie GeoJSON (Polygon,
+MultiPolygon, éventuellement dans une Feature), liste de points
+`{"lat": .., "lon"|"lng": ..}` ou liste de couples [lon, lat]. Les
+coordonnées sont en degrés (lon, lat), sans projection.
+
+L'index est reconstruit au premier accès suivant un commit qui modifie une
+parcelle, dans ce processus comme dans les autres (génération Redis, voir
+app.core.cache). Une transaction qui a modifié des parcelles sans les avoir
+encore validées utilise un index privé construit sur sa connexion : l'index
+partagé n'est jamais bâti sur des géométries non validées. Une géométrie
+illisible est ignorée (avertissement), sans empêcher la géolocalisation des
+autres parcelles.
+"""
+import logging
+import threading
+import weakref
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import event, inspect, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from ..core.cache import generations
+from ..models.production import Parcelle
+
+logger = logging.getLogger(__name__)
+
+CAPACITE_NOEUD = 16
+_CLE_SESSION = "parcelles_modifiees"
+_NOM_CACHE = "parcelles_geometrie"
+
+Boite = Tuple[float, float, float, float]  # (lon min, lat min, lon max, lat max)
+
+
+def _anneau(points) -> Optional[np.ndarray]:
+    if points and isinstance(points[0], dict):
+        points = [(point.get("lon", point.get("lng")), point["lat"]) for point in points]
+    anneau = np.asarray(points, dtype=float)
+    if anneau.ndim != 2 or anneau.shape[0] < 3 or anneau.shape[1] < 2:
+        return None
+    return anneau[:, :2]
+
+
+def lire_anneaux(valeur: Any) -> List[np.ndarray]:
+    """Anneaux (extérieurs et trous) d'une géométrie, tableaux (n, 2) lon/lat."""
+    if isinstance(valeur, dict):
+        if valeur.get("type") == "Feature":
+            return lire_anneaux(valeur.get("geometry"))
+        if valeur.get("type") == "Polygon":
+            polygones = [valeur.get("coordinates") or []]
+        elif valeur.get("type") == "MultiPolygon":
+            polygones = valeur.get("coordinates") or []
+        else:
+            return []
+        anneaux = [_anneau(anneau) for polygone in polygones for anneau in polygone]
+    elif isinstance(valeur, list) and valeur:
+        anneaux = [_anneau(valeur)]
+    else:
+        return []
+    return [anneau for anneau in anneaux if anneau is not None]
+
+
+def _aretes(anneaux: Sequence[np.ndarray]) -> np.ndarray:
+    """Arêtes (x1, y1, x2, y2) de tous les anneaux, refermés au besoin."""
+    return np.vstack([np.hstack([anneau, np.roll(anneau, -1, axis=0)]) for anneau in anneaux])
+
+
+def points_dans_polygone(points: np.ndarray, aretes: np.ndarray) -> np.ndarray:
+    """
+    Test pair-impair (lancer de rayon) de `points` (k, 2) contre un polygone
+    donné par ses arêtes (m, 4), trous compris. Retourne un masque (k,).
+    """
+    px, py = points[:, 0:1], points[:, 1:2]
+    x1, y1, x2, y2 = aretes.T
+    traverse = (y1 > py) != (y2 > py)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_intersection = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+    return np.count_nonzero(traverse & (px < x_intersection), axis=1) % 2 == 1
+
+
+class IndexSpatial:
+    """
+    R-tree statique : feuilles triées par STR, puis regroupées par paquets de
+    `capacite` à chaque niveau. Chaque niveau est un tableau de boîtes et,
+    pour les noeuds internes, l'intervalle de leurs enfants au niveau inférieur.
+    """
+
+    def __init__(self, ids: Sequence[Any], aretes: Sequence[np.ndarray], capacite: int = CAPACITE_NOEUD):
+        self.capacite = capacite
+        boites = np.array([
+            [a[:, [0, 2]].min(), a[:, [1, 3]].min(), a[:, [0, 2]].max(), a[:, [1, 3]].max()] for a in aretes
+        ]).reshape(-1, 4)
+        ordre = self._ordre_str(boites)
+        self.ids = [ids[i] for i in ordre]
+        self.aretes = [aretes[i] for i in ordre]
+        # niveaux[0] : feuilles (une boîte par parcelle) ; niveaux[-1] : racine(s)
+        self.boites = [boites[ordre]]
+        self.enfants: List[np.ndarray] = []
+        while len(self.boites[-1]) > capacite:
+            dessous = self.boites[-1]
+            debuts = np.arange(0, len(dessous), capacite)
+            fins = np.minimum(debuts + capacite, len(dessous))
+            self.boites.append(np.column_stack([
+                np.minimum.reduceat(dessous[:, 0], debuts), np.minimum.reduceat(dessous[:, 1], debuts),
+                np.maximum.reduceat(dessous[:, 2], debuts), np.maximum.reduceat(dessous[:, 3], debuts),
+            ]))
+            self.enfants.append(np.column_stack([debuts, fins]))
+
+    def _ordre_str(self, boites: np.ndarray) -> np.ndarray:
+        n = len(boites)
+        if n == 0:
+            return np.arange(0)
+        cx, cy = (boites[:, 0] + boites[:, 2]) / 2, (boites[:, 1] + boites[:, 3]) / 2
+        tranches = int(np.ceil(np.sqrt(np.ceil(n / self.capacite))))
+        par_tranche = tranches * self.capacite
+        ordre_x = np.argsort(cx, kind="stable")
+        tranche = np.empty(n, dtype=np.int64)
+        tranche[ordre_x] = np.arange(n) // par_tranche
+        return np.lexsort((cy, tranche))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _candidats(self, boites: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Couples (feuille, requête) dont les boîtes se coupent. `boites` : (k, 4),
+        un point étant une boîte de taille nulle. Parcours vectorisé niveau par niveau.
+        """
+        haut = self.boites[-1]
+        noeuds = np.repeat(np.arange(len(haut)), len(boites))
+        requetes = np.tile(np.arange(len(boites)), len(haut))
+        for niveau in range(len(self.boites) - 1, -1, -1):
+            b, q = self.boites[niveau][noeuds], boites[requetes]
+            garde = (b[:, 0] <= q[:, 2]) & (b[:, 2] >= q[:, 0]) & (b[:, 1] <= q[:, 3]) & (b[:, 3] >= q[:, 1])
+            noeuds, requetes = noeuds[garde], requetes[garde]
+            if niveau == 0:
+                break
+            intervalles = self.enfants[niveau - 1][noeuds]
+            nombre = intervalles[:, 1] - intervalles[:, 0]
+            decalage = np.arange(int(nombre.sum())) - np.repeat(np.cumsum(nombre) - nombre, nombre)
+            noeuds = np.repeat(intervalles[:, 0], nombre) + decalage
+            requetes = np.repeat(requetes, nombre)
+        return noeuds, requetes
+
+    def localiser(self, points: np.ndarray) -> List[Optional[Any]]:
+        """Identifiant de la parcelle contenant chaque point (lon, lat), ou None."""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        resultat: List[Optional[Any]] = [None] * len(points)
+        if not len(self) or not len(points):
+            return resultat
+        feuilles, requetes = self._candidats(np.hstack([points, points]))
+        ordre = np.argsort(feuilles, kind="stable")
+        feuilles, requetes = feuilles[ordre], requetes[ordre]
+        bornes = np.flatnonzero(np.diff(feuilles)) + 1
+        for groupe_feuilles, groupe_points in zip(np.split(feuilles, bornes), np.split(requetes, bornes)):
+            if not len(groupe_feuilles):
+                continue
+            feuille = int(groupe_feuilles[0])
+            dedans = points_dans_polygone(points[groupe_points], self.aretes[feuille])
+            for indice in groupe_points[dedans].tolist():
+                if resultat[indice] is None:
+                    resultat[indice] = self.ids[feuille]
+        return resultat
+
+    def dans_boite(self, boite: Boite) -> List[Any]:
+        feuilles, _ = self._candidats(np.asarray([boite], dtype=float))
+        return [self.ids[i] for i in sorted(set(feuilles.tolist()))]
+
+
+# --- Index partagé du processus ---
+
+_index: Optional[IndexSpatial] = None
+_verrou = threading.Lock()
+# Connexions dont la transaction a flushé des parcelles modifiées, non encore validées
+_connexions_modifiees: "weakref.WeakSet[Connection]" = weakref.WeakSet()
+
+
+def construire_index(connexion: Connection) -> IndexSpatial:
+    p = Parcelle.__table__
+    ids, aretes = [], []
+    for ligne in connexion.execute(select(p.c.id, p.c.code, p.c.coordonnees_gps).where(p.c.coordonnees_gps.isnot(None))):
+        try:
+            anneaux = lire_anneaux(ligne.coordonnees_gps)
+        except (KeyError, TypeError, ValueError):
+            # Saisie libre : point sans "lat", anneaux de longueurs inégales...
+            anneaux = []
+        if not anneaux:
+            logger.warning("Géométrie illisible pour la parcelle %s", ligne.code)
+            continue
+        ids.append(ligne.id)
+        aretes.append(_aretes(anneaux))
+    return IndexSpatial(ids, aretes)
+
+
+def index_parcelles(connexion: Connection) -> IndexSpatial:
+    """
+    Index du processus, reconstruit si une parcelle a changé depuis sa
+    construction. Sur une connexion dont la transaction a modifié des
+    parcelles, index privé construit à chaque appel.
+    """
+    global _index
+    if connexion in _connexions_modifiees:
+        return construire_index(connexion)
+    with _verrou:
+        if generations.a_change(_NOM_CACHE):
+            _index = None
+        if _index is None:
+            _index = construire_index(connexion)
+            logger.info("Index spatial des parcelles : %d polygones", len(_index))
+        return _index
+
+
+def invalider() -> None:
+    global _index
+    with _verrou:
+        _index = None
+    generations.incrementer(_NOM_CACHE)
+
+
+def localiser(connexion: Connection, points: Sequence[Tuple[float, float]]) -> List[Optional[Any]]:
+    """Parcelle de chaque point (lon, lat), ou None hors parcelle."""
+    return index_parcelles(connexion).localiser(np.asarray(points, dtype=float))
+
+
+def parcelle_du_point(connexion: Connection, lon: float, lat: float) -> Optional[Any]:
+    return localiser(connexion, [(lon, lat)])[0]
+
+
+def parcelles_dans_boite(connexion: Connection, lon_min: float, lat_min: float,
+                         lon_max: float, lat_max: float) -> List[Any]:
+    """Parcelles dont l'emprise coupe le rectangle donné."""
+    return index_parcelles(connexion).dans_boite((lon_min, lat_min, lon_max, lat_max))
+
+
+@event.listens_for(Session, "after_flush")
+def _relever_flush(session, flush_context):
+    modifiees = [objet for objet in (*session.new, *session.deleted) if isinstance(objet, Parcelle)]
+    modifiees += [
+        objet for objet in session.dirty
+        if isinstance(objet, Parcelle) and inspect(objet).attrs.coordonnees_gps.history.has_changes()
+    ]
+    if modifiees:
+        connexion = session.connection()
+        _connexions_modifiees.add(connexion)
+        session.info[_CLE_SESSION] = connexion
+
+
+@event.listens_for(Session, "after_commit")
+def _invalider_apres_commit(session):
+    connexion = session.info.pop(_CLE_SESSION, None)
+    if connexion is not None:
+        _connexions_modifiees.discard(connexion)
+        invalider()
+
+
+@event.listens_for(Session, "after_rollback")
+def _oublier(session):
+    global _index
+    connexion = session.info.pop(_CLE_SESSION, None)
+    if connexion is not None:
+        _connexions_modifiees.discard(connexion)
+        # Par prudence : l'index partagé ne doit rien garder de la transaction annulée
+        with _verrou:
+            _index = None
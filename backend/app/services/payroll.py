@@ -0,0 +1,381 @@
+"""
+Calcul de la paie d'une période (YYYY-MM) pour tout le personnel.
+
+Trois étapes chronométrées :
+
+1. chargement : employés du périmètre, contrats couvrant la période, présences
+   agrégées par employé (heures, heures au-delà de `daily_hours` par jour,
+   absences non justifiées) et congés sans solde approuvés, en quelques
+   requêtes ensemblistes ;
+2. calcul : toutes les fiches en une passe vectorisée (NumPy) selon
+   PAYROLL_CONFIG :
+   - salaire de base au prorata des jours couverts par chaque contrat (à
+     défaut, `Employe.salaire_base` depuis l'embauche) ;
+   - heures supplémentaires majorées par tranches (`overtime_tiers`) au taux
+     horaire du dernier contrat (`monthly_hours`) ;
+   - primes : avantages chiffrés du dernier contrat ;
+   - retenues par jour d'absence non justifiée ou de congé sans solde
+     (`working_days_per_month`) ;
+   - cotisations salariales (`contributions`) et impôt sur le revenu au
+     barème annuel (`income_tax`) ;
+3. écriture : upsert des fiches sur (employé, période).
+
+Périmètre : employés embauchés au plus tard le dernier jour de la période
+et ayant un contrat qui la recouvre ; à défaut de contrat, le statut courant
+(ACTIF, CONGE) en décide. Un employé dont le contrat s'est terminé en cours
+de mois reçoit donc sa dernière fiche même s'il est déjà passé INACTIF.
+
+Le calcul est rejouable : une fiche non payée est recalculée, une fiche
+payée (`date_paiement` renseignée) n'est jamais modifiée, et les fiches non
+payées d'employés sortis du périmètre sont retirées.
+
+Usage :
+    python -m app.services.payroll 2024-06 [--simulation]
+"""
+import argparse
+import calendar
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import and_, case, delete, func, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+
+from ..core.config import settings
+from ..models.base import generer_id
+from ..models.hr import Conge, Contrat, Employe, Paie, Presence, StatutConge, StatutEmploye, TypePresence
+from .stock_ledger import par_paquets
+
+logger = logging.getLogger(__name__)
+
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+_EPOQUE = np.datetime64("1970-01-01", "D")
+STATUTS_PAYES = (StatutEmploye.ACTIF, StatutEmploye.CONGE)
+
+
+@dataclass
+class EntreesPaie:
+    """Données d'une période, en tableaux alignés sur `employes`"""
+    employes: List[Any]
+    jours_periode: int
+    base: np.ndarray                  # salaire de base au prorata
+    salaire_reference: np.ndarray     # salaire mensuel du dernier contrat
+    heures_supp: np.ndarray
+    absences: np.ndarray              # jours d'absence non justifiée
+    jours_sans_solde: np.ndarray
+    avantages: List[Dict[str, float]]
+
+
+@dataclass
+class RapportPaie:
+    """Résultat d'un calcul de paie"""
+    periode: str
+    employes: int = 0
+    fiches: int = 0
+    deja_payees: int = 0
+    masse_brute: Decimal = Decimal(0)
+    net_total: Decimal = Decimal(0)
+    durees: Dict[str, float] = field(default_factory=dict)
+
+
+def bornes_periode(periode: str) -> Tuple[date, date]:
+    """Premier et dernier jour d'une période YYYY-MM."""
+    annee, mois = (int(partie) for partie in periode.split("-"))
+    return date(annee, mois, 1), date(annee, mois, calendar.monthrange(annee, mois)[1])
+
+
+def _jours(dates) -> np.ndarray:
+    return (np.array(dates, dtype="datetime64[D]") - _EPOQUE).astype(np.int64)
+
+
+def _recouvrement(debut: np.ndarray, fin: np.ndarray, periode_debut: int, periode_fin: int) -> np.ndarray:
+    """Jours (bornes incluses) de [debut, fin] dans la période."""
+    return np.maximum(np.minimum(fin, periode_fin) - np.maximum(debut, periode_debut) + 1, 0)
+
+
+def _avantages(valeur: Any) -> Dict[str, float]:
+    """Avantages chiffrés d'un contrat : {libellé: montant} ou [{"libelle", "montant"}]."""
+    if isinstance(valeur, dict):
+        elements = valeur.items()
+    elif isinstance(valeur, list):
+        elements = [(a.get("libelle") or a.get("type"), a.get("montant")) for a in valeur if isinstance(a, dict)]
+    else:
+        return {}
+    montants = {}
+    for libelle, montant in elements:
+        if libelle and isinstance(montant, (int, float, str, Decimal)):
+            try:
+                montants[str(libelle)] = float(montant)
+            except ValueError:
+                continue
+    return montants
+
+
+def charger(connexion: Connection, periode: str, exclus: Optional[set] = None) -> EntreesPaie:
+    """Charge les entrées de la période pour les employés payés, hors `exclus`."""
+    config = settings.PAYROLL_CONFIG
+    debut, fin = bornes_periode(periode)
+    d0, d1 = int(_jours([debut])[0]), int(_jours([fin])[0])
+    jours_periode = d1 - d0 + 1
+    e, c, p, g = Employe.__table__, Contrat.__table__, Presence.__table__, Conge.__table__
+    # Contrat recouvrant la période (alias : les requêtes sur `contrats` ne s'y corrèlent pas)
+    ca = c.alias("contrat_periode")
+    sous_contrat_periode = (
+        select(ca.c.id)
+        .where(ca.c.employe_id == e.c.id, ca.c.date_debut <= fin,
+               or_(ca.c.date_fin.is_(None), ca.c.date_fin >= debut))
+        .exists()
+    )
+    perimetre = and_(e.c.date_embauche <= fin, or_(sous_contrat_periode, e.c.statut.in_(STATUTS_PAYES)))
+
+    employes = [
+        ligne for ligne in connexion.execute(
+            select(e.c.id, e.c.salaire_base, e.c.date_embauche).where(perimetre).order_by(e.c.id)
+        )
+        if not exclus or ligne.id not in exclus
+    ]
+    rang = {ligne.id: i for i, ligne in enumerate(employes)}
+    n = len(employes)
+    reference = np.fromiter((float(ligne.salaire_base) for ligne in employes), float, n)
+    embauche = _jours([ligne.date_embauche for ligne in employes]).reshape(n)
+    base = reference * _recouvrement(embauche, np.full(n, d1), d0, d1) / jours_periode
+
+    contrats = [
+        ligne for ligne in connexion.execute(
+            select(c.c.employe_id, c.c.date_debut, c.c.date_fin, c.c.salaire_base, c.c.avantages)
+            .join(e, e.c.id == c.c.employe_id)
+            .where(perimetre, c.c.date_debut <= fin, or_(c.c.date_fin.is_(None), c.c.date_fin >= debut))
+        )
+        if ligne.employe_id in rang
+    ]
+    avantages: List[Dict[str, float]] = [{} for _ in range(n)]
+    if contrats:
+        indices = np.fromiter((rang[ligne.employe_id] for ligne in contrats), np.int64, len(contrats))
+        salaires = np.fromiter((float(ligne.salaire_base) for ligne in contrats), float, len(contrats))
+        c_debut = _jours([ligne.date_debut for ligne in contrats]).reshape(-1)
+        c_fin = np.array([
+            (np.datetime64(ligne.date_fin, "D") - _EPOQUE).astype(np.int64) if ligne.date_fin else d1
+            for ligne in contrats
+        ], dtype=np.int64)
+        # Un contrat prend fin au plus tard la veille du contrat suivant du même employé
+        ordre = np.lexsort((c_debut, indices))
+        dernier = np.r_[indices[ordre][1:] != indices[ordre][:-1], True]
+        suivant = np.r_[c_debut[ordre][1:], d1 + 1]
+        c_fin[ordre] = np.where(dernier, c_fin[ordre], np.minimum(c_fin[ordre], suivant - 1))
+        # Employés sous contrat : somme des contrats au prorata (changement en cours de mois)
+        sous_contrat = np.zeros(n, dtype=bool)
+        sous_contrat[indices] = True
+        base[sous_contrat] = 0
+        np.add.at(base, indices, salaires * _recouvrement(c_debut, c_fin, d0, d1) / jours_periode)
+        # Dernier contrat de chaque employé : salaire de référence et avantages
+        derniers = ordre[dernier]
+        reference[indices[derniers]] = salaires[derniers]
+        for position in derniers.tolist():
+            avantages[indices[position]] = _avantages(contrats[position].avantages)
+
+    heures_supp, absences = np.zeros(n), np.zeros(n)
+    depassement = p.c.heures_travaillees - config["daily_hours"]
+    for ligne in connexion.execute(
+        select(
+            p.c.employe_id,
+            func.sum(case((depassement > 0, depassement), else_=0)),
+            func.sum(case((and_(p.c.type_presence == TypePresence.ABSENT, p.c.justification.is_(None)), 1), else_=0)),
+        )
+        .join(e, e.c.id == p.c.employe_id)
+        .where(perimetre, p.c.date >= debut, p.c.date <= fin)
+        .group_by(p.c.employe_id)
+    ):
+        if ligne[0] in rang:
+            heures_supp[rang[ligne[0]]] = float(ligne[1] or 0)
+            absences[rang[ligne[0]]] = float(ligne[2] or 0)
+
+    jours_sans_solde = np.zeros(n)
+    conges = [
+        ligne for ligne in connexion.execute(
+            select(g.c.employe_id, g.c.date_debut, g.c.date_fin, g.c.nb_jours)
+            .join(e, e.c.id == g.c.employe_id)
+            .where(perimetre, g.c.statut == StatutConge.APPROUVE, g.c.type_conge.in_(config["unpaid_leave_types"]),
+                   g.c.date_debut <= fin, g.c.date_fin >= debut)
+        )
+        if ligne.employe_id in rang
+    ]
+    if conges:
+        g_debut = _jours([ligne.date_debut for ligne in conges]).reshape(-1)
+        g_fin = _jours([ligne.date_fin for ligne in conges]).reshape(-1)
+        nb_jours = np.fromiter((ligne.nb_jours for ligne in conges), float, len(conges))
+        # Jours ouvrés du congé tombant dans la période, au prorata des jours calendaires
+        np.add.at(
+            jours_sans_solde,
+            np.fromiter((rang[ligne.employe_id] for ligne in conges), np.int64, len(conges)),
+            nb_jours * _recouvrement(g_debut, g_fin, d0, d1) / (g_fin - g_debut + 1),
+        )
+
+    return EntreesPaie(
+        employes=[ligne.id for ligne in employes], jours_periode=jours_periode, base=base,
+        salaire_reference=reference, heures_supp=heures_supp, absences=absences,
+        jours_sans_solde=jours_sans_solde, avantages=avantages,
+    )
+
+
+def _impot_annuel(imposable: np.ndarray, tranches: List[List[Optional[float]]]) -> np.ndarray:
+    impot, plancher = np.zeros_like(imposable), 0.0
+    for plafond, taux in tranches:
+        haut = np.inf if plafond is None else plafond
+        impot += np.clip(imposable - plancher, 0, haut - plancher) * taux
+        plancher = haut
+    return impot
+
+
+def calculer(entrees: EntreesPaie, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Montants de toutes les fiches, en tableaux alignés sur `entrees.employes`."""
+    taux_horaire = entrees.salaire_reference / config["monthly_hours"]
+    taux_journalier = entrees.salaire_reference / config["working_days_per_month"]
+
+    montant_supp, reste = np.zeros_like(entrees.heures_supp), entrees.heures_supp.copy()
+    for heures, majoration in config["overtime_tiers"]:
+        tranche = reste if heures is None else np.minimum(reste, heures)
+        montant_supp += tranche * taux_horaire * majoration
+        reste = reste - tranche
+
+    primes = np.fromiter((sum(a.values()) for a in entrees.avantages), float, len(entrees.avantages))
+    retenue_absences = taux_journalier * entrees.absences
+    retenue_sans_solde = taux_journalier * entrees.jours_sans_solde
+    # Les retenues ne dépassent pas la rémunération du mois
+    avant_retenues = entrees.base + montant_supp + primes
+    retenues = retenue_absences + retenue_sans_solde
+    with np.errstate(divide="ignore", invalid="ignore"):
+        echelle = np.where(retenues > avant_retenues, avant_retenues / retenues, 1.0)
+    retenue_absences, retenue_sans_solde = retenue_absences * echelle, retenue_sans_solde * echelle
+    brut = avant_retenues - retenue_absences - retenue_sans_solde
+
+    cotisations = {
+        code: cotisation["rate"] * (brut if cotisation.get("ceiling") is None else np.minimum(brut, cotisation["ceiling"]))
+        for code, cotisation in config["contributions"].items()
+    }
+    total_cotisations = sum(cotisations.values(), np.zeros_like(brut))
+    impot = config["income_tax"]
+    imposable = np.maximum(brut * (1 - impot["allowance_rate"]) - total_cotisations, 0)
+    irpp = _impot_annuel(imposable * 12, impot["brackets"]) / 12
+    centimes = irpp * impot.get("surcharge_rate", 0)
+
+    return {
+        "base": entrees.base,
+        "heures_supp": entrees.heures_supp,
+        "montant_supp": montant_supp,
+        "retenue_absences": retenue_absences,
+        "retenue_sans_solde": retenue_sans_solde,
+        "brut": brut,
+        "cotisations": cotisations,
+        "irpp": irpp,
+        "centimes": centimes,
+        "net": brut - total_cotisations - irpp - centimes,
+    }
+
+
+def _fiches(periode: str, entrees: EntreesPaie, montants: Dict[str, Any]) -> List[Dict[str, Any]]:
+    arrondis = {
+        nom: np.round(valeur, 2).tolist() for nom, valeur in montants.items() if isinstance(valeur, np.ndarray)
+    }
+    cotisations = {code: np.round(valeur, 2).tolist() for code, valeur in montants["cotisations"].items()}
+    maintenant = datetime.utcnow()
+    return [
+        {
+            "id": generer_id(), "employe_id": employe, "periode": periode,
+            "salaire_base": Decimal(f"{arrondis['base'][i]:.2f}"),
+            "heures_supp": Decimal(f"{arrondis['heures_supp'][i]:.2f}"),
+            "primes": {"heures_supplementaires": arrondis["montant_supp"][i],
+                       **{libelle: round(montant, 2) for libelle, montant in entrees.avantages[i].items()}},
+            "deductions": {"absences": arrondis["retenue_absences"][i],
+                           "conges_sans_solde": arrondis["retenue_sans_solde"][i]},
+            "cotisations": {code: valeurs[i] for code, valeurs in cotisations.items()},
+            "impositions": {"irpp": arrondis["irpp"][i], "centimes_additionnels": arrondis["centimes"][i]},
+            "net_a_payer": Decimal(f"{arrondis['net'][i]:.2f}"),
+            "created_at": maintenant, "updated_at": maintenant,
+        }
+        for i, employe in enumerate(entrees.employes)
+    ]
+
+
+def ecrire(connexion: Connection, periode: str, fiches: List[Dict[str, Any]]) -> None:
+    """Upsert des fiches ; les fiches payées ne sont pas modifiées, les fiches non payées hors lot sont retirées."""
+    t = Paie.__table__
+    stmt = _INSERTS[connexion.dialect.name](t)
+    colonnes = ("salaire_base", "heures_supp", "primes", "deductions", "cotisations", "impositions",
+                "net_a_payer", "updated_at")
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[t.c.employe_id, t.c.periode],
+        set_={nom: stmt.excluded[nom] for nom in colonnes},
+        where=t.c.date_paiement.is_(None),
+    )
+    for paquet in par_paquets(fiches, 5000):
+        connexion.execute(stmt, paquet)
+    # Fiches non payées d'employés absents du lot : hors périmètre
+    calcules = {fiche["employe_id"] for fiche in fiches}
+    obsoletes = [
+        employe for employe in connexion.execute(
+            select(t.c.employe_id).where(t.c.periode == periode, t.c.date_paiement.is_(None))
+        ).scalars()
+        if employe not in calcules
+    ]
+    for paquet in par_paquets(obsoletes):
+        connexion.execute(delete(t).where(
+            t.c.periode == periode, t.c.date_paiement.is_(None), t.c.employe_id.in_(paquet)
+        ))
+
+
+def calculer_paie(connexion: Connection, periode: str, simulation: bool = False) -> RapportPaie:
+    """
+    Calcule (et, hors `simulation`, enregistre) les fiches de la période dans
+    la transaction de `connexion`.
+    """
+    bornes_periode(periode)
+    rapport = RapportPaie(periode=periode)
+    t = Paie.__table__
+
+    chrono = time.perf_counter()
+    payees = set(connexion.execute(
+        select(t.c.employe_id).where(t.c.periode == periode, t.c.date_paiement.isnot(None))
+    ).scalars())
+    entrees = charger(connexion, periode, payees)
+    rapport.durees["chargement"] = time.perf_counter() - chrono
+
+    chrono = time.perf_counter()
+    montants = calculer(entrees, settings.PAYROLL_CONFIG)
+    fiches = _fiches(periode, entrees, montants)
+    rapport.durees["calcul"] = time.perf_counter() - chrono
+
+    chrono = time.perf_counter()
+    if not simulation:
+        ecrire(connexion, periode, fiches)
+    rapport.durees["ecriture"] = time.perf_counter() - chrono
+
+    rapport.employes = len(entrees.employes) + len(payees)
+    rapport.fiches = len(fiches)
+    rapport.deja_payees = len(payees)
+    rapport.masse_brute = Decimal(f"{montants['brut'].sum():.2f}")
+    rapport.net_total = sum((fiche["net_a_payer"] for fiche in fiches), Decimal(0))
+    logger.info("Paie %s : %s", periode, rapport)
+    return rapport
+
+
+def main() -> None:
+    from ..core.database import engine
+
+    parser = argparse.ArgumentParser(description="Calcul de la paie d'une période")
+    parser.add_argument("periode", help="période YYYY-MM")
+    parser.add_argument("--simulation", action="store_true", help="calcule sans enregistrer les fiches")
+    args = parser.parse_args()
+    with engine.begin() as connexion:
+        rapport = calculer_paie(connexion, args.periode, args.simulation)
+    etapes = ", ".join(f"{etape} {duree * 1000:.0f} ms" for etape, duree in rapport.durees.items())
+    print(f"{rapport.fiches} fiches ({rapport.deja_payees} déjà payées), brut {rapport.masse_brute}, "
+          f"net {rapport.net_total} ({etapes})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Séries temporelles des capteurs de terrain et stations météo, par parcelle.
+
+Ingestion par lots : `ingerer(connexion, releves)` écrit les relevés bruts
+(COPY sous PostgreSQL, INSERT multi-lignes ailleurs) et met à jour dans la
+même transaction les agrégats horaires et journaliers (nombre, somme, min,
+max) par upsert : les agrégats sont toujours à jour, relevés en retard
+compris. `TamponMesures` regroupe un flux de relevés en lots de
+`SENSOR_BATCH_SIZE` ; un lot incomplet est écrit par une minuterie au plus
+tard `SENSOR_FLUSH_SECONDS` après son premier relevé, même si le flux s'arrête.
+
+Lecture : `serie()` choisit la résolution selon la durée demandée (brut,
+heure, jour) ; `conditions_meteo()` résume une journée pour renseigner
+`Recolte.conditions_meteo`.
+
+Rétention (`SENSOR_RETENTION_DAYS`) : les relevés bruts et agrégats horaires
+anciens sont purgés, les agrégats journaliers conservés.
+
+Usage :
+    python -m app.services.sensor_timeseries --retention
+"""
+import argparse
+import csv
+import io
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+
+from ..core.config import settings
+from ..core.metrics import registre
+from ..models.base import generer_id
+from ..models.production import AgregatMesure, MesureCapteur
+from .stock_ledger import par_paquets
+
+logger = logging.getLogger(__name__)
+
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+# min/max de deux valeurs : LEAST/GREATEST sous PostgreSQL, MIN/MAX scalaires sous SQLite
+_PLUS_PETIT = {"postgresql": func.least, "sqlite": func.min}
+_PLUS_GRAND = {"postgresql": func.greatest, "sqlite": func.max}
+
+BRUT, HEURE, JOUR = "brut", "heure", "jour"
+_COLONNES = ("id", "parcelle_id", "capteur", "grandeur", "horodatage", "valeur", "created_at", "updated_at")
+
+releves_ingeres = registre.counter(
+    "fofal_capteurs_releves_total",
+    "Relevés de capteurs ingérés",
+)
+duree_ingestion = registre.histogram(
+    "fofal_capteurs_ingestion_secondes",
+    "Durée d'écriture d'un lot de relevés (bruts et agrégats)",
+)
+
+
+class Releve(NamedTuple):
+    parcelle_id: Any
+    capteur: str
+    grandeur: str
+    horodatage: datetime
+    valeur: float
+
+
+@dataclass
+class PointSerie:
+    """Point d'une série : un relevé brut ou un agrégat"""
+    debut: datetime
+    nombre: int
+    moyenne: float
+    minimum: float
+    maximum: float
+
+
+def _agreger(releves: Iterable[Releve]) -> Dict[tuple, List[float]]:
+    """Agrégats [nombre, somme, min, max] d'un lot, par (granularité, parcelle, grandeur, début)."""
+    agregats: Dict[tuple, List[float]] = {}
+    for releve in releves:
+        heure = releve.horodatage.replace(minute=0, second=0, microsecond=0)
+        for cle in ((HEURE, releve.parcelle_id, releve.grandeur, heure),
+                    (JOUR, releve.parcelle_id, releve.grandeur, heure.replace(hour=0))):
+            agregat = agregats.get(cle)
+            if agregat is None:
+                agregats[cle] = [1, releve.valeur, releve.valeur, releve.valeur]
+            else:
+                agregat[0] += 1
+                agregat[1] += releve.valeur
+                agregat[2] = min(agregat[2], releve.valeur)
+                agregat[3] = max(agregat[3], releve.valeur)
+    return agregats
+
+
+def _copier(connexion: Connection, lignes: List[tuple]) -> bool:
+    """COPY des relevés bruts sous PostgreSQL (psycopg2). Retourne False si indisponible."""
+    if connexion.dialect.name != "postgresql":
+        return False
+    with connexion.connection.dbapi_connection.cursor() as curseur:
+        if not hasattr(curseur, "copy_expert"):
+            return False
+        tampon = io.StringIO()
+        csv.writer(tampon).writerows(lignes)
+        tampon.seek(0)
+        curseur.copy_expert(
+            f"COPY {MesureCapteur.__tablename__} ({', '.join(_COLONNES)}) FROM STDIN WITH (FORMAT csv)", tampon
+        )
+    return True
+
+
+def ingerer(connexion: Connection, releves: Iterable[Any]) -> int:
+    """
+    Écrit un lot de relevés (Releve ou tuples parcelle_id, capteur, grandeur,
+    horodatage, valeur) et met à jour leurs agrégats. Retourne le nombre de relevés.
+    """
+    debut = time.perf_counter()
+    releves = [releve if isinstance(releve, Releve) else Releve(*releve) for releve in releves]
+    if not releves:
+        return 0
+    maintenant = datetime.utcnow()
+    lignes = [(generer_id(), *releve, maintenant, maintenant) for releve in releves]
+    if not _copier(connexion, lignes):
+        t = MesureCapteur.__table__
+        for paquet in par_paquets(lignes, 5000):
+            connexion.execute(insert(t), [dict(zip(_COLONNES, ligne)) for ligne in paquet])
+
+    a, dialecte = AgregatMesure.__table__, connexion.dialect.name
+    stmt = _INSERTS[dialecte](a)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[a.c.granularite, a.c.parcelle_id, a.c.grandeur, a.c.debut],
+        set_={
+            "nombre": a.c.nombre + stmt.excluded.nombre,
+            "somme": a.c.somme + stmt.excluded.somme,
+            "minimum": _PLUS_PETIT[dialecte](a.c.minimum, stmt.excluded.minimum),
+            "maximum": _PLUS_GRAND[dialecte](a.c.maximum, stmt.excluded.maximum),
+            "updated_at": maintenant,
+        },
+    )
+    agregats = [
+        {
+            "id": generer_id(), "granularite": granularite, "parcelle_id": parcelle, "grandeur": grandeur,
+            "debut": periode, "nombre": nombre, "somme": somme, "minimum": minimum, "maximum": maximum,
+            "created_at": maintenant, "updated_at": maintenant,
+        }
+        # Ordre fixe des clés : deux lots concurrents verrouillent les agrégats dans le même ordre
+        for (granularite, parcelle, grandeur, periode), (nombre, somme, minimum, maximum)
+        in sorted(_agreger(releves).items(), key=lambda element: (element[0][0], str(element[0][1]), *element[0][2:]))
+    ]
+    for paquet in par_paquets(agregats, 5000):
+        connexion.execute(stmt, paquet)
+
+    releves_ingeres.inc(len(releves))
+    duree_ingestion.observe(time.perf_counter() - debut)
+    return len(releves)
+
+
+class TamponMesures:
+    """
+    Regroupe un flux de relevés en lots, écrits chacun dans sa transaction.
+    Un lot est écrit dès `taille` relevés, ou par une minuterie (thread) `delai`
+    secondes après son premier relevé. À utiliser comme gestionnaire de
+    contexte pour écrire le dernier lot et arrêter la minuterie.
+    """
+
+    def __init__(self, engine: Engine, taille: Optional[int] = None, delai: Optional[float] = None):
+        self.engine = engine
+        self.taille = taille or settings.SENSOR_BATCH_SIZE
+        self.delai = delai if delai is not None else settings.SENSOR_FLUSH_SECONDS
+        self._releves: List[Any] = []
+        self._minuterie: Optional[threading.Timer] = None
+        self._verrou = threading.Lock()
+
+    def ajouter(self, *releves: Any) -> None:
+        with self._verrou:
+            if not self._releves and self.delai > 0:
+                self._minuterie = threading.Timer(self.delai, self._echeance)
+                self._minuterie.daemon = True
+                self._minuterie.start()
+            self._releves.extend(releves)
+            pret = len(self._releves) >= self.taille or self.delai <= 0
+            lot = self._prendre() if pret else None
+        if lot:
+            self._ecrire(lot)
+
+    def _echeance(self) -> None:
+        try:
+            self.vider()
+        except Exception:
+            logger.exception("Échec de l'écriture d'un lot de relevés à échéance")
+
+    def vider(self) -> None:
+        with self._verrou:
+            lot = self._prendre()
+        if lot:
+            self._ecrire(lot)
+
+    def _prendre(self) -> List[Any]:
+        if self._minuterie is not None:
+            self._minuterie.cancel()
+            self._minuterie = None
+        lot, self._releves = self._releves, []
+        return lot
+
+    def _ecrire(self, lot: List[Any]) -> None:
+        with self.engine.begin() as connexion:
+            ingerer(connexion, lot)
+
+    def __enter__(self) -> "TamponMesures":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.vider()
+
+
+# --- Lecture ---
+
+def _resolution(debut: datetime, fin: datetime) -> str:
+    duree = fin - debut
+    if duree <= timedelta(days=2):
+        return BRUT
+    if duree <= timedelta(days=92):
+        return HEURE
+    return JOUR
+
+
+def serie(connexion: Connection, parcelle_id, grandeur: str, debut: datetime, fin: datetime,
+          granularite: Optional[str] = None) -> List[PointSerie]:
+    """
+    Série d'une grandeur sur une parcelle entre `debut` inclus et `fin` exclue,
+    en relevés bruts, horaires ou journaliers (par défaut selon la durée).
+    """
+    granularite = granularite or _resolution(debut, fin)
+    if granularite == BRUT:
+        m = MesureCapteur.__table__
+        return [
+            PointSerie(ligne.horodatage, 1, ligne.valeur, ligne.valeur, ligne.valeur)
+            for ligne in connexion.execute(
+                select(m.c.horodatage, m.c.valeur)
+                .where(m.c.parcelle_id == parcelle_id, m.c.grandeur == grandeur,
+                       m.c.horodatage >= debut, m.c.horodatage < fin)
+                .order_by(m.c.horodatage)
+            )
+        ]
+    a = AgregatMesure.__table__
+    return [
+        PointSerie(ligne.debut, ligne.nombre, ligne.somme / ligne.nombre, ligne.minimum, ligne.maximum)
+        for ligne in connexion.execute(
+            select(a.c.debut, a.c.nombre, a.c.somme, a.c.minimum, a.c.maximum)
+            .where(a.c.granularite == granularite, a.c.parcelle_id == parcelle_id, a.c.grandeur == grandeur,
+                   a.c.debut >= debut, a.c.debut < fin)
+            .order_by(a.c.debut)
+        )
+    ]
+
+
+def conditions_meteo(connexion: Connection, parcelle_id, jour: date) -> Dict[str, Dict[str, float]]:
+    """
+    Résumé d'une journée sur la parcelle, au format de `Recolte.conditions_meteo` :
+    {grandeur: {"moyenne", "min", "max", "cumul"}}.
+    """
+    a = AgregatMesure.__table__
+    debut = datetime.combine(jour, datetime.min.time())
+    return {
+        ligne.grandeur: {
+            "moyenne": round(ligne.somme / ligne.nombre, 2), "min": round(ligne.minimum, 2),
+            "max": round(ligne.maximum, 2), "cumul": round(ligne.somme, 2),
+        }
+        for ligne in connexion.execute(
+            select(a.c.grandeur, a.c.nombre, a.c.somme, a.c.minimum, a.c.maximum)
+            .where(a.c.granularite == JOUR, a.c.parcelle_id == parcelle_id, a.c.debut == debut)
+        )
+    }
+
+
+def appliquer_retention(connexion: Connection, maintenant: Optional[datetime] = None) -> Dict[str, int]:
+    """Purge les relevés bruts et agrégats plus anciens que leur durée de rétention."""
+    maintenant = maintenant or datetime.utcnow()
+    m, a = MesureCapteur.__table__, AgregatMesure.__table__
+    supprimes = {}
+    for niveau, jours in settings.SENSOR_RETENTION_DAYS.items():
+        if jours is None:
+            continue
+        limite = maintenant - timedelta(days=jours)
+        if niveau == BRUT:
+            resultat = connexion.execute(delete(m).where(m.c.horodatage < limite))
+        else:
+            resultat = connexion.execute(delete(a).where(a.c.granularite == niveau, a.c.debut < limite))
+        supprimes[niveau] = resultat.rowcount
+    logger.info("Rétention des mesures : %s", supprimes)
+    return supprimes
+
+
+def main() -> None:
+    from ..core.database import engine
+
+    parser = argparse.ArgumentParser(description="Séries temporelles des capteurs")
+    parser.add_argument("--retention", action="store_true", help="purge selon SENSOR_RETENTION_DAYS")
+    args = parser.parse_args()
+    if not args.retention:
+        parser.print_help()
+        return
+    with engine.begin() as connexion:
+        for niveau, nombre in appliquer_retention(connexion).items():
+            print(f"{niveau} : {nombre} lignes supprimées")
+
+
+if __name__ == "__main__":
+    main()
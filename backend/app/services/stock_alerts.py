@@ -0,0 +1,180 @@
+"""
+Surveillance des seuils d'alerte de stock.
+
+Écouteur du journal de stock : après chaque comptabilisation, seuls les
+couples (produit, entrepôt) touchés par les mouvements sont comparés au
+`seuil_alerte` de leur produit (lu dans le cache du catalogue, sans
+relecture de la table des produits à chaque mouvement).
+
+- passage sous le seuil : une AlerteStock ACTIVE est créée (une seule par
+  couple, garantie par un index unique partiel) ;
+- toujours sous le seuil : l'alerte active est mise à jour, pas dupliquée ;
+- retour au-dessus du seuil : l'alerte passe RESOLUE.
+
+Les alertes actives se lisent par l'index partiel (`alertes_actives()`).
+L'envoi des notifications se fait après validation de la transaction, par
+`notifier_alertes()` (`python -m app.services.stock_alerts`).
+"""
+import argparse
+import logging
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import bindparam, func, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+
+from ..core.config import settings
+from ..core.metrics import registre
+from ..models.base import generer_id
+from ..models.inventory import AlerteStock, StatutAlerte, Stock
+from . import catalog
+from .stock_ledger import CleStock, enregistrer_ecouteur, par_paquets
+
+logger = logging.getLogger(__name__)
+
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+alertes_declenchees = registre.counter(
+    "fofal_stock_alertes_total",
+    "Alertes de stock bas déclenchées",
+)
+
+
+def alertes_activees() -> bool:
+    return bool(settings.NOTIFICATION_CONFIG.get("notification_types", {}).get("stock_alert"))
+
+
+def verifier_seuils(connexion: Connection, couples) -> Dict[str, int]:
+    """
+    Compare au seuil d'alerte le stock total (tous lots) des couples
+    (produit_id, entrepot_id) donnés et met à jour les alertes.
+    Retourne {"creees": n, "resolues": n}.
+    """
+    couples = list(set(couples))
+    resultat = {"creees": 0, "resolues": 0}
+    if not couples:
+        return resultat
+    s, a = Stock.__table__, AlerteStock.__table__
+    produits = catalog.produits_par_ids(connexion, {produit for produit, _ in couples})
+    seuils = {identifiant: ligne.seuil_alerte for identifiant, ligne in produits.items()
+              if ligne.seuil_alerte is not None}
+    suivis = [couple for couple in couples if couple[0] in seuils]
+
+    niveaux, actives = {}, {}
+    for paquet in par_paquets(suivis):
+        for ligne in connexion.execute(
+            select(s.c.produit_id, s.c.entrepot_id, func.sum(s.c.quantite).label("quantite"))
+            .where(tuple_(s.c.produit_id, s.c.entrepot_id).in_(paquet))
+            .group_by(s.c.produit_id, s.c.entrepot_id)
+        ):
+            niveaux[(ligne.produit_id, ligne.entrepot_id)] = (ligne.quantite, seuils[ligne.produit_id])
+    for paquet in par_paquets(couples):
+        for ligne in connexion.execute(
+            select(a.c.id, a.c.produit_id, a.c.entrepot_id)
+            .where(a.c.statut == StatutAlerte.ACTIVE, tuple_(a.c.produit_id, a.c.entrepot_id).in_(paquet))
+        ):
+            actives[(ligne.produit_id, ligne.entrepot_id)] = ligne.id
+
+    maintenant = datetime.utcnow()
+    nouvelles, maj, resolues = [], [], []
+    creees = 0
+    for couple in couples:
+        quantite, seuil = niveaux.get(couple, (None, None))
+        sous_seuil = seuil is not None and Decimal(quantite) <= Decimal(seuil)
+        if sous_seuil and couple not in actives:
+            nouvelles.append({
+                "id": generer_id(), "produit_id": couple[0], "entrepot_id": couple[1],
+                "statut": StatutAlerte.ACTIVE, "quantite": quantite, "seuil": seuil,
+                "date_detection": maintenant, "notifiee": False,
+                "created_at": maintenant, "updated_at": maintenant,
+            })
+        elif sous_seuil:
+            maj.append({"_id": actives[couple], "_quantite": quantite})
+        elif couple in actives:
+            resolues.append(actives[couple])
+
+    if nouvelles:
+        # Une transaction concurrente a pu créer l'alerte entre-temps : l'index
+        # unique partiel la déduplique ; seules les lignes insérées (RETURNING)
+        # comptent comme alertes déclenchées
+        stmt = _INSERTS[connexion.dialect.name](a).on_conflict_do_nothing(
+            index_elements=[a.c.produit_id, a.c.entrepot_id],
+            index_where=a.c.statut == StatutAlerte.ACTIVE,
+        ).returning(a.c.id)
+        creees = len(connexion.execute(stmt, nouvelles).all())
+        if creees:
+            alertes_declenchees.inc(creees)
+            logger.info("%d alerte(s) de stock bas", creees)
+    if maj:
+        connexion.execute(
+            update(a).where(a.c.id == bindparam("_id"))
+            .values(quantite=bindparam("_quantite"), updated_at=maintenant),
+            maj,
+        )
+    for paquet in par_paquets(resolues):
+        connexion.execute(
+            update(a).where(a.c.id.in_(paquet))
+            .values(statut=StatutAlerte.RESOLUE, date_resolution=maintenant, updated_at=maintenant)
+        )
+    resultat["creees"], resultat["resolues"] = creees, len(resolues)
+    return resultat
+
+
+@enregistrer_ecouteur
+def surveiller(connexion: Connection, mouvements: List[Dict[str, Any]],
+               annules: List[Dict[str, Any]], soldes: Dict[CleStock, Any]) -> None:
+    """Écouteur du journal : vérifie les seuils des seuls couples touchés."""
+    if alertes_activees() and soldes:
+        verifier_seuils(connexion, {(produit, entrepot) for produit, entrepot, _ in soldes})
+
+
+def alertes_actives(connexion: Connection, entrepot_id=None) -> List[Any]:
+    """Alertes actives (produits actuellement sous le seuil), les plus récentes d'abord."""
+    a = AlerteStock.__table__
+    stmt = select(a).where(a.c.statut == StatutAlerte.ACTIVE)
+    if entrepot_id is not None:
+        stmt = stmt.where(a.c.entrepot_id == entrepot_id)
+    return connexion.execute(stmt.order_by(a.c.date_detection.desc())).all()
+
+
+def notifier_alertes(connexion: Connection, envoyer: Optional[Callable[[Any], None]] = None) -> int:
+    """
+    Envoie les alertes non encore notifiées (index partiel) et les marque
+    comme notifiées. `envoyer(alerte)` reçoit chaque ligne ; par défaut
+    l'alerte est journalisée. Retourne le nombre d'alertes envoyées.
+    """
+    a = AlerteStock.__table__
+    envoyer = envoyer or (lambda alerte: logger.warning(
+        "Stock bas : produit %s, entrepôt %s, %s <= seuil %s",
+        alerte.produit_id, alerte.entrepot_id, alerte.quantite, alerte.seuil,
+    ))
+    alertes = connexion.execute(
+        select(a).where(a.c.notifiee.is_(False)).order_by(a.c.date_detection)
+    ).all()
+    for alerte in alertes:
+        if alerte.statut == StatutAlerte.ACTIVE:
+            envoyer(alerte)
+    if alertes:
+        connexion.execute(update(a).where(a.c.id.in_([alerte.id for alerte in alertes])).values(notifiee=True))
+    return sum(1 for alerte in alertes if alerte.statut == StatutAlerte.ACTIVE)
+
+
+def main() -> None:
+    from ..core.database import engine
+
+    parser = argparse.ArgumentParser(description="Alertes de stock bas")
+    parser.add_argument("--lister", action="store_true", help="affiche les alertes actives sans notifier")
+    args = parser.parse_args()
+    with engine.begin() as connexion:
+        if args.lister:
+            for alerte in alertes_actives(connexion):
+                print(f"{alerte.produit_id} {alerte.entrepot_id} {alerte.quantite} <= {alerte.seuil} "
+                      f"depuis {alerte.date_detection:%Y-%m-%d %H:%M}")
+        else:
+            print(f"{notifier_alertes(connexion)} alerte(s) notifiée(s)")
+
+
+if __name__ == "__main__":
+    main()
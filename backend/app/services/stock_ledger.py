@@ -0,0 +1,356 @@
+"""
+Journal des mouvements de stock et tenue des soldes.
+
+Chaque MouvementStock est comptabilisé sur le solde Stock de son couple
+(produit, entrepôt, lot) dans la même transaction que son écriture :
+
+- ENTREE            : + quantité sur l'entrepôt de destination
+- SORTIE, PERTE     : - quantité sur l'entrepôt source
+- TRANSFERT         : - quantité sur la source, + quantité sur la destination
+- AJUSTEMENT        : quantité signée sur la destination (à défaut la source)
+
+`Stock.quantite` est donc toujours à jour et se lit par une simple recherche
+sur l'index unique (produit, entrepôt, lot), sans sommer l'historique.
+
+Deux voies d'écriture :
+- ORM : les MouvementStock ajoutés, modifiés ou supprimés dans une session
+  sont comptabilisés automatiquement au flush ;
+- masse : `poster_mouvements(connexion, mouvements)` insère les mouvements et
+  applique les soldes en quelques requêtes (imports, inventaires, intrants).
+
+`verifier_soldes()` recalcule tous les soldes depuis le journal et signale
+les écarts (`python -m app.services.stock_ledger [--corriger]`).
+"""
+import argparse
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import case, event, func, insert, literal, literal_column, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from ..core.history import colonnes_modifiees, etat_avant, suivre_colonnes
+from ..core.metrics import registre
+from ..models.base import generer_id
+from ..models.inventory import MouvementStock, Stock, TypeMouvement
+
+logger = logging.getLogger(__name__)
+
+# Clé d'un solde : (produit_id, entrepot_id, lot)
+CleStock = Tuple[Any, Any, Optional[str]]
+# Écouteur appelé après comptabilisation :
+# (connexion, mouvements écrits, états annulés, nouveaux soldes)
+Ecouteur = Callable[[Connection, List[Dict[str, Any]], List[Dict[str, Any]], Dict[CleStock, Decimal]], None]
+
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+# Valeur du lot absent dans l'index unique des soldes ; rendue en littéral pour
+# que la cible ON CONFLICT corresponde exactement à l'expression indexée
+SANS_LOT = literal_column("''")
+
+# Colonnes d'un mouvement qui déterminent son effet sur les soldes et sa
+# valorisation ; une modification de l'une d'elles annule puis recomptabilise
+_COLONNES_SUIVIES = (
+    "id", "produit_id", "type_mouvement", "quantite",
+    "entrepot_source_id", "entrepot_destination_id", "lot",
+    "date_mouvement", "cout_unitaire",
+)
+
+_ecouteurs: List[Ecouteur] = []
+
+ecarts_soldes = registre.gauge(
+    "fofal_stock_ecarts_soldes",
+    "Nombre de soldes Stock en écart avec le journal lors de la dernière vérification",
+)
+
+
+def enregistrer_ecouteur(ecouteur: Ecouteur) -> Ecouteur:
+    """
+    Enregistre une fonction appelée après chaque comptabilisation, dans la même
+    transaction (valorisation, alertes...). Utilisable comme décorateur.
+    """
+    if ecouteur not in _ecouteurs:
+        _ecouteurs.append(ecouteur)
+    return ecouteur
+
+
+def par_paquets(elements: Iterable[Any], taille: int = 1000) -> Iterable[List[Any]]:
+    """Découpe une séquence en paquets (listes IN et executemany de taille bornée)."""
+    elements = list(elements)
+    for debut in range(0, len(elements), taille):
+        yield elements[debut:debut + taille]
+
+
+def _type(valeur) -> TypeMouvement:
+    return valeur if isinstance(valeur, TypeMouvement) else TypeMouvement(valeur)
+
+
+def _lot(valeur: Optional[str]) -> Optional[str]:
+    return valeur or None
+
+
+def effets_mouvement(mouvement: Dict[str, Any]) -> List[Tuple[CleStock, Decimal]]:
+    """Variations de solde produites par un mouvement : [((produit, entrepôt, lot), delta)]."""
+    type_mouvement = _type(mouvement["type_mouvement"])
+    quantite = Decimal(mouvement["quantite"])
+    produit, lot = mouvement["produit_id"], _lot(mouvement.get("lot"))
+    source = mouvement.get("entrepot_source_id")
+    destination = mouvement.get("entrepot_destination_id")
+
+    if type_mouvement is TypeMouvement.ENTREE:
+        effets = [(destination, quantite)]
+    elif type_mouvement in (TypeMouvement.SORTIE, TypeMouvement.PERTE):
+        effets = [(source, -quantite)]
+    elif type_mouvement is TypeMouvement.TRANSFERT:
+        effets = [(source, -quantite), (destination, quantite)]
+    else:
+        effets = [(destination or source, quantite)]
+
+    for entrepot, _ in effets:
+        if entrepot is None:
+            raise ValueError(f"Mouvement {type_mouvement.value} sans entrepôt requis")
+    return [((produit, entrepot, lot), delta) for entrepot, delta in effets]
+
+
+def cumuler_effets(
+    mouvements: Iterable[Dict[str, Any]], signe: int = 1, deltas: Optional[Dict[CleStock, Decimal]] = None
+) -> Dict[CleStock, Decimal]:
+    """Somme les variations de plusieurs mouvements par clé de solde."""
+    deltas = defaultdict(Decimal) if deltas is None else deltas
+    for mouvement in mouvements:
+        for cle, delta in effets_mouvement(mouvement):
+            deltas[cle] += signe * delta
+    return deltas
+
+
+def appliquer_deltas(connexion: Connection, deltas: Dict[CleStock, Decimal]) -> Dict[CleStock, Decimal]:
+    """
+    Applique des variations aux soldes en une requête INSERT ... ON CONFLICT
+    (création du solde s'il n'existe pas). Retourne les nouveaux soldes des
+    clés touchées.
+    """
+    deltas = {cle: delta for cle, delta in deltas.items() if delta}
+    if not deltas:
+        return {}
+    construire_insert = _INSERTS.get(connexion.dialect.name)
+    if construire_insert is None:
+        raise NotImplementedError(f"Journal de stock non supporté pour le dialecte {connexion.dialect.name}")
+
+    table = Stock.__table__
+    maintenant = datetime.utcnow()
+    stmt = construire_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.produit_id, table.c.entrepot_id, func.coalesce(table.c.lot, SANS_LOT)],
+        set_={
+            "quantite": table.c.quantite + stmt.excluded.quantite,
+            "date_derniere_maj": maintenant,
+            "updated_at": maintenant,
+        },
+    ).returning(table.c.produit_id, table.c.entrepot_id, table.c.lot, table.c.quantite)
+
+    # Ordre de clé stable : deux transactions concurrentes verrouillent les
+    # soldes dans le même ordre et ne peuvent pas s'interbloquer
+    lignes = [
+        {
+            "id": generer_id(),
+            "produit_id": produit,
+            "entrepot_id": entrepot,
+            "lot": lot,
+            "quantite": delta,
+            "date_derniere_maj": maintenant,
+            "created_at": maintenant,
+            "updated_at": maintenant,
+        }
+        for (produit, entrepot, lot), delta in sorted(deltas.items(), key=lambda item: tuple(map(str, item[0])))
+    ]
+    return {
+        (ligne.produit_id, ligne.entrepot_id, _lot(ligne.lot)): ligne.quantite
+        for ligne in connexion.execute(stmt, lignes)
+    }
+
+
+def comptabiliser(
+    connexion: Connection,
+    mouvements: Sequence[Dict[str, Any]],
+    annules: Sequence[Dict[str, Any]] = (),
+) -> Dict[CleStock, Decimal]:
+    """
+    Comptabilise des mouvements déjà écrits (et annule l'effet de `annules`,
+    état antérieur de mouvements modifiés ou supprimés), puis prévient les
+    écouteurs. Retourne les nouveaux soldes.
+    """
+    deltas = cumuler_effets(mouvements)
+    cumuler_effets(annules, signe=-1, deltas=deltas)
+    soldes = appliquer_deltas(connexion, deltas)
+    for ecouteur in _ecouteurs:
+        ecouteur(connexion, list(mouvements), list(annules), soldes)
+    return soldes
+
+
+def poster_mouvements(connexion: Connection, mouvements: Iterable[Dict[str, Any]]) -> Dict[CleStock, Decimal]:
+    """
+    Insère des mouvements en masse et met à jour les soldes dans la
+    transaction de `connexion`. Retourne les nouveaux soldes des clés touchées.
+    """
+    maintenant = datetime.utcnow()
+    lignes = [
+        {
+            "id": generer_id(),
+            "date_mouvement": maintenant,
+            "created_at": maintenant,
+            "updated_at": maintenant,
+            **mouvement,
+        }
+        for mouvement in mouvements
+    ]
+    if not lignes:
+        return {}
+    # Toutes les lignes doivent avoir les mêmes colonnes pour un executemany
+    colonnes = set().union(*lignes)
+    lignes = [{colonne: ligne.get(colonne) for colonne in colonnes} for ligne in lignes]
+    connexion.execute(insert(MouvementStock.__table__), lignes)
+    return comptabiliser(connexion, lignes)
+
+
+def solde(connexion, produit_id, entrepot_id, lot: Optional[str] = None) -> Decimal:
+    """Quantité en stock d'un produit dans un entrepôt (et un lot), lue sur l'index unique."""
+    table = Stock.__table__
+    quantite = connexion.execute(
+        select(table.c.quantite).where(
+            table.c.produit_id == produit_id,
+            table.c.entrepot_id == entrepot_id,
+            func.coalesce(table.c.lot, SANS_LOT) == (lot or ""),
+        )
+    ).scalar()
+    return quantite if quantite is not None else Decimal(0)
+
+
+# --- Comptabilisation automatique des mouvements écrits par l'ORM ---
+
+suivre_colonnes(MouvementStock, _COLONNES_SUIVIES)
+
+
+@event.listens_for(Session, "after_flush")
+def _comptabiliser_flush(session, flush_context):
+    nouveaux, annules = [], []
+    for objet in session.new:
+        if isinstance(objet, MouvementStock):
+            nouveaux.append(objet.dict())
+    for objet in session.dirty:
+        if isinstance(objet, MouvementStock) and colonnes_modifiees(session, objet, _COLONNES_SUIVIES):
+            annules.append(etat_avant(objet, _COLONNES_SUIVIES))
+            nouveaux.append(objet.dict())
+    for objet in session.deleted:
+        if isinstance(objet, MouvementStock):
+            annules.append(etat_avant(objet, _COLONNES_SUIVIES))
+    if not nouveaux and not annules:
+        return
+    soldes = comptabiliser(session.connection(), nouveaux, annules)
+    session.info.setdefault("soldes_modifies", set()).update(soldes)
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _expirer_soldes(session, flush_context):
+    # Les Stock déjà chargés dans la session relisent leur quantité à jour
+    modifies = session.info.pop("soldes_modifies", None)
+    if not modifies:
+        return
+    for objet in list(session.identity_map.values()):
+        if isinstance(objet, Stock) and (objet.produit_id, objet.entrepot_id, _lot(objet.lot)) in modifies:
+            session.expire(objet, ["quantite", "date_derniere_maj", "updated_at"])
+
+
+# --- Vérification des soldes ---
+
+def lignes_signees():
+    """
+    Journal éclaté en lignes signées (produit_id, entrepot_id, lot, delta),
+    équivalent SQL de `effets_mouvement`.
+    """
+    m = MouvementStock.__table__
+    entree = (TypeMouvement.ENTREE, TypeMouvement.TRANSFERT)
+    sortie = (TypeMouvement.SORTIE, TypeMouvement.PERTE, TypeMouvement.TRANSFERT)
+    return union_all(
+        select(m.c.produit_id, m.c.entrepot_destination_id.label("entrepot_id"), m.c.lot,
+               m.c.quantite.label("delta"))
+        .where(m.c.type_mouvement.in_(entree)),
+        select(m.c.produit_id, m.c.entrepot_source_id.label("entrepot_id"), m.c.lot,
+               (literal(0) - m.c.quantite).label("delta"))
+        .where(m.c.type_mouvement.in_(sortie)),
+        select(m.c.produit_id,
+               case((m.c.entrepot_destination_id.is_(None), m.c.entrepot_source_id),
+                    else_=m.c.entrepot_destination_id).label("entrepot_id"),
+               m.c.lot, m.c.quantite.label("delta"))
+        .where(m.c.type_mouvement == TypeMouvement.AJUSTEMENT),
+    ).subquery("lignes_signees")
+
+
+@dataclass
+class EcartSolde:
+    """Solde Stock différent de la somme du journal"""
+    produit_id: Any
+    entrepot_id: Any
+    lot: Optional[str]
+    quantite_stock: Decimal
+    quantite_journal: Decimal
+
+    @property
+    def ecart(self) -> Decimal:
+        return self.quantite_stock - self.quantite_journal
+
+
+def verifier_soldes(connexion: Connection, corriger: bool = False) -> List[EcartSolde]:
+    """
+    Recalcule tous les soldes depuis le journal (une agrégation) et les compare
+    aux lignes Stock (une lecture). Avec `corriger`, aligne les soldes sur le
+    journal dans la transaction de `connexion`.
+    """
+    lignes = lignes_signees()
+    journal: Dict[CleStock, Decimal] = defaultdict(Decimal)
+    for ligne in connexion.execute(
+        select(lignes.c.produit_id, lignes.c.entrepot_id, lignes.c.lot, func.sum(lignes.c.delta))
+        .group_by(lignes.c.produit_id, lignes.c.entrepot_id, lignes.c.lot)
+    ):
+        journal[(ligne[0], ligne[1], _lot(ligne[2]))] += Decimal(ligne[3])
+
+    table = Stock.__table__
+    stocks: Dict[CleStock, Decimal] = defaultdict(Decimal)
+    for ligne in connexion.execute(select(table.c.produit_id, table.c.entrepot_id, table.c.lot, table.c.quantite)):
+        stocks[(ligne[0], ligne[1], _lot(ligne[2]))] += Decimal(ligne[3])
+
+    ecarts = [
+        EcartSolde(cle[0], cle[1], cle[2], stocks.get(cle, Decimal(0)), journal.get(cle, Decimal(0)))
+        for cle in stocks.keys() | journal.keys()
+        if stocks.get(cle, Decimal(0)) != journal.get(cle, Decimal(0))
+    ]
+    ecarts_soldes.set(len(ecarts))
+    if ecarts:
+        logger.warning("%d soldes de stock en écart avec le journal", len(ecarts))
+    if corriger and ecarts:
+        appliquer_deltas(connexion, {
+            (ecart.produit_id, ecart.entrepot_id, ecart.lot): -ecart.ecart for ecart in ecarts
+        })
+    return ecarts
+
+
+def main() -> None:
+    from ..core.database import engine
+
+    parser = argparse.ArgumentParser(description="Vérification des soldes de stock depuis le journal")
+    parser.add_argument("--corriger", action="store_true", help="aligne les soldes sur le journal")
+    args = parser.parse_args()
+    with engine.begin() as connexion:
+        ecarts = verifier_soldes(connexion, corriger=args.corriger)
+    for ecart in ecarts:
+        print(f"{ecart.produit_id} {ecart.entrepot_id} {ecart.lot or '-'} "
+              f"stock={ecart.quantite_stock} journal={ecart.quantite_journal} écart={ecart.ecart}")
+    print(f"{len(ecarts)} écart(s){' corrigé(s)' if args.corriger else ''}")
+
+
+if __name__ == "__main__":
+    main()
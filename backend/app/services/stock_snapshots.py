@@ -0,0 +1,276 @@
+"""
+Stock à date à partir de photographies périodiques.
+
+Le stock valorisé d'un solde à une date X est celui de sa dernière ligne de
+valorisation antérieure ou égale à X (quantité et CMUP après mouvement).
+Plutôt que de parcourir tout l'historique, on part de la photographie
+(SnapshotStock) la plus proche avant X et on ne lit que les lignes de la
+période (S, X] : le coût dépend du nombre de mouvements récents.
+
+- `stock_a_date(connexion, X, entrepot_id=None)` : positions valorisées à X ;
+- `creer_snapshot(connexion, X)` : photographie à X, construite elle-même
+  depuis la précédente ;
+- un mouvement antidaté avant des photographies existantes les corrige pour
+  les soldes touchés (écouteur du journal) ;
+- `reconstruire_snapshots(connexion, depuis)` refait les photographies
+  postérieures à `depuis` ; appelée par `stock_valuation.revaloriser()`
+  quand la revalorisation réécrit des lignes.
+
+Usage :
+    python -m app.services.stock_snapshots            # photographie de fin de journée d'hier
+    python -m app.services.stock_snapshots --mois     # photographies de fin de mois manquantes
+"""
+import argparse
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+
+from ..models.base import generer_id
+from ..models.inventory import LigneValorisation, SnapshotStock, TypeMouvement
+from .stock_ledger import SANS_LOT, CleStock, effets_mouvement, enregistrer_ecouteur, par_paquets
+# Les lignes de valorisation doivent être à jour avant l'écouteur des photographies
+from . import stock_valuation  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+@dataclass
+class PositionStock:
+    """Stock valorisé d'un solde à une date"""
+    produit_id: Any
+    entrepot_id: Any
+    lot: Optional[str]
+    quantite: Decimal
+    cmup: Decimal
+
+    @property
+    def valeur(self) -> Decimal:
+        return (self.quantite * self.cmup).quantize(Decimal("0.01"))
+
+
+def fin_de_journee(jour: date) -> datetime:
+    return datetime.combine(jour, time.max)
+
+
+def dernier_snapshot(connexion: Connection, a_date: Optional[datetime] = None) -> Optional[datetime]:
+    """Date de la photographie la plus récente (antérieure ou égale à `a_date`)."""
+    sn = SnapshotStock.__table__
+    stmt = select(func.max(sn.c.date_snapshot))
+    if a_date is not None:
+        stmt = stmt.where(sn.c.date_snapshot <= a_date)
+    return connexion.execute(stmt).scalar()
+
+
+def stock_a_date(connexion: Connection, a_date: datetime, entrepot_id=None,
+                 produit_id=None) -> List[PositionStock]:
+    """
+    Positions de stock (quantité, CMUP) de chaque solde à `a_date` incluse,
+    depuis la photographie la plus proche et les seules lignes postérieures.
+    """
+    t, sn = LigneValorisation.__table__, SnapshotStock.__table__
+    depuis = dernier_snapshot(connexion, a_date)
+    positions: Dict[CleStock, PositionStock] = {}
+
+    if depuis is not None:
+        stmt = select(sn.c.produit_id, sn.c.entrepot_id, sn.c.lot, sn.c.quantite, sn.c.cmup).where(
+            sn.c.date_snapshot == depuis
+        )
+        if entrepot_id is not None:
+            stmt = stmt.where(sn.c.entrepot_id == entrepot_id)
+        if produit_id is not None:
+            stmt = stmt.where(sn.c.produit_id == produit_id)
+        for ligne in connexion.execute(stmt):
+            positions[(ligne.produit_id, ligne.entrepot_id, ligne.lot)] = PositionStock(
+                ligne.produit_id, ligne.entrepot_id, ligne.lot, Decimal(ligne.quantite), Decimal(ligne.cmup)
+            )
+
+    # Dernière ligne de chaque solde sur la période (depuis, a_date]
+    rang = func.row_number().over(
+        partition_by=(t.c.produit_id, t.c.entrepot_id, t.c.lot),
+        order_by=(t.c.date_mouvement.desc(), t.c.mouvement_id.desc()),
+    )
+    periode = select(t.c.produit_id, t.c.entrepot_id, t.c.lot, t.c.quantite_apres, t.c.cmup_apres,
+                     rang.label("rang")).where(t.c.date_mouvement <= a_date)
+    if depuis is not None:
+        periode = periode.where(t.c.date_mouvement > depuis)
+    if entrepot_id is not None:
+        periode = periode.where(t.c.entrepot_id == entrepot_id)
+    if produit_id is not None:
+        periode = periode.where(t.c.produit_id == produit_id)
+    periode = periode.subquery()
+    for ligne in connexion.execute(select(periode).where(periode.c.rang == 1)):
+        positions[(ligne.produit_id, ligne.entrepot_id, ligne.lot)] = PositionStock(
+            ligne.produit_id, ligne.entrepot_id, ligne.lot, Decimal(ligne.quantite_apres), Decimal(ligne.cmup_apres)
+        )
+    return list(positions.values())
+
+
+def _ecrire(connexion: Connection, a_date: datetime, positions: List[PositionStock]) -> None:
+    sn = SnapshotStock.__table__
+    maintenant = datetime.utcnow()
+    stmt = _INSERTS[connexion.dialect.name](sn)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[sn.c.date_snapshot, sn.c.entrepot_id, sn.c.produit_id, func.coalesce(sn.c.lot, SANS_LOT)],
+        set_={"quantite": stmt.excluded.quantite, "cmup": stmt.excluded.cmup, "updated_at": maintenant},
+    )
+    lignes = [
+        {
+            "id": generer_id(), "date_snapshot": a_date, "produit_id": position.produit_id,
+            "entrepot_id": position.entrepot_id, "lot": position.lot,
+            "quantite": position.quantite, "cmup": position.cmup,
+            "created_at": maintenant, "updated_at": maintenant,
+        }
+        for position in positions
+    ]
+    for paquet in par_paquets(lignes):
+        connexion.execute(stmt, paquet)
+
+
+def creer_snapshot(connexion: Connection, a_date: datetime) -> int:
+    """Photographie (ou refait) le stock de tous les soldes à `a_date`. Retourne le nombre de soldes."""
+    sn = SnapshotStock.__table__
+    # Une photographie refaite part de la précédente, pas d'elle-même
+    connexion.execute(delete(sn).where(sn.c.date_snapshot == a_date))
+    positions = stock_a_date(connexion, a_date)
+    _ecrire(connexion, a_date, positions)
+    logger.info("Photographie du stock au %s : %d soldes", a_date, len(positions))
+    return len(positions)
+
+
+def reconstruire_snapshots(connexion: Connection, depuis: Optional[datetime] = None) -> List[datetime]:
+    """
+    Refait, dans l'ordre chronologique, les photographies datées de `depuis`
+    ou après (toutes par défaut) : chacune repart de la précédente, déjà
+    refaite. Retourne leurs dates.
+    """
+    sn = SnapshotStock.__table__
+    stmt = select(sn.c.date_snapshot).distinct().order_by(sn.c.date_snapshot)
+    if depuis is not None:
+        stmt = stmt.where(sn.c.date_snapshot >= depuis)
+    dates = connexion.execute(stmt).scalars().all()
+    if dates:
+        connexion.execute(delete(sn).where(sn.c.date_snapshot >= dates[0]))
+    for a_date in dates:
+        creer_snapshot(connexion, a_date)
+    return dates
+
+
+def creer_snapshots_mensuels(connexion: Connection, jusqu_a: date) -> List[datetime]:
+    """Crée les photographies de fin de mois manquantes jusqu'au mois précédant `jusqu_a`."""
+    t = LigneValorisation.__table__
+    dernier = dernier_snapshot(connexion)
+    depart = dernier or connexion.execute(select(func.min(t.c.date_mouvement))).scalar()
+    creees = []
+    if depart is None:
+        return creees
+    mois = date(depart.year, depart.month, 1)
+    while True:
+        suivant = date(mois.year + mois.month // 12, mois.month % 12 + 1, 1)
+        if suivant > jusqu_a:
+            break
+        fin = fin_de_journee(suivant - timedelta(days=1))
+        if dernier is None or fin > dernier:
+            creer_snapshot(connexion, fin)
+            creees.append(fin)
+        mois = suivant
+    return creees
+
+
+@enregistrer_ecouteur
+def actualiser_snapshots(connexion: Connection, mouvements: List[Dict[str, Any]],
+                         annules: List[Dict[str, Any]], soldes: Dict[CleStock, Any]) -> None:
+    """
+    Écouteur du journal : un mouvement daté avant la dernière photographie
+    (saisie tardive, correction) met à jour les photographies postérieures
+    des seuls soldes touchés.
+    """
+    dernier = None
+    depuis: Dict[CleStock, datetime] = {}
+    for mouvement in (*mouvements, *annules):
+        if dernier is None:
+            dernier = dernier_snapshot(connexion)
+            if dernier is None:
+                return
+        if mouvement["date_mouvement"] > dernier:
+            continue
+        for cle, _ in effets_mouvement(mouvement):
+            if cle not in depuis or mouvement["date_mouvement"] < depuis[cle]:
+                depuis[cle] = mouvement["date_mouvement"]
+    if not depuis:
+        return
+
+    t, sn = LigneValorisation.__table__, SnapshotStock.__table__
+    # Le CMUP d'un solde se propage par ses transferts sortants : les soldes
+    # destinataires de la période sont touchés eux aussi
+    a_suivre = dict(depuis)
+    while a_suivre:
+        (produit, entrepot, lot), date_min = a_suivre.popitem()
+        sortants = select(t.c.mouvement_id).where(
+            t.c.produit_id == produit,
+            t.c.entrepot_id == entrepot,
+            t.c.lot.is_(None) if lot is None else t.c.lot == lot,
+            t.c.date_mouvement >= date_min,
+            t.c.date_mouvement <= dernier,
+            t.c.type_mouvement == TypeMouvement.TRANSFERT,
+            t.c.quantite < 0,
+        )
+        for entree in connexion.execute(
+            select(t.c.produit_id, t.c.entrepot_id, t.c.lot, t.c.date_mouvement)
+            .where(t.c.mouvement_id.in_(sortants), t.c.quantite > 0)
+        ):
+            cle = (entree.produit_id, entree.entrepot_id, entree.lot)
+            if cle not in depuis or entree.date_mouvement < depuis[cle]:
+                depuis[cle] = a_suivre[cle] = entree.date_mouvement
+
+    dates = connexion.execute(
+        select(sn.c.date_snapshot).distinct().where(sn.c.date_snapshot >= min(depuis.values()))
+        .order_by(sn.c.date_snapshot)
+    ).scalars().all()
+    for a_date in dates:
+        positions = []
+        for (produit, entrepot, lot), date_min in depuis.items():
+            if date_min > a_date:
+                continue
+            # Dernière ligne du solde à la date : descente de l'index du solde
+            ligne = connexion.execute(
+                select(t.c.quantite_apres, t.c.cmup_apres)
+                .where(
+                    t.c.produit_id == produit,
+                    t.c.entrepot_id == entrepot,
+                    t.c.lot.is_(None) if lot is None else t.c.lot == lot,
+                    t.c.date_mouvement <= a_date,
+                )
+                .order_by(t.c.date_mouvement.desc(), t.c.mouvement_id.desc())
+                .limit(1)
+            ).first()
+            quantite, cmup = (ligne.quantite_apres, ligne.cmup_apres) if ligne else (Decimal(0), Decimal(0))
+            positions.append(PositionStock(produit, entrepot, lot, quantite, cmup))
+        _ecrire(connexion, a_date, positions)
+
+
+def main() -> None:
+    from ..core.database import engine
+
+    parser = argparse.ArgumentParser(description="Photographies périodiques du stock")
+    parser.add_argument("--mois", action="store_true", help="crée les photographies de fin de mois manquantes")
+    parser.add_argument("--date", type=date.fromisoformat, help="jour à photographier (fin de journée)")
+    args = parser.parse_args()
+    with engine.begin() as connexion:
+        if args.mois:
+            for fin in creer_snapshots_mensuels(connexion, date.today()):
+                print(f"photographie au {fin:%Y-%m-%d}")
+        else:
+            jour = args.date or date.today() - timedelta(days=1)
+            print(f"{creer_snapshot(connexion, fin_de_journee(jour))} soldes photographiés au {jour}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,522 @@
+"""
+Valorisation des stocks au coût moyen unitaire pondéré (CMUP).
+
+Chaque effet d'un mouvement sur un solde (produit, entrepôt, lot) devient une
+LigneValorisation qui porte la quantité et le CMUP après le mouvement :
+
+- entrée avec coût : cmup = (q × cmup + entrée × coût) / (q + entrée)
+- sortie, perte : le CMUP ne change pas, seule la quantité baisse
+- transfert : sortie au CMUP de la source, entrée à ce coût sur la destination
+
+Incrémental : un mouvement à la date du jour ne lit que la dernière ligne de
+son solde (une requête par paquet de soldes, quel que soit le nombre de
+mouvements comptabilisés ensemble). Un mouvement antidaté ne rejoue que les lignes postérieures de ce
+solde (et, par les transferts, celles des soldes alimentés en aval).
+
+Batch : `revaloriser()` recalcule toutes les lignes en une passe NumPy qui
+avance d'un mouvement à la fois sur tous les soldes en parallèle
+(`python -m app.services.stock_valuation [--reconstruire]`), puis refait les
+photographies de stock (app.services.stock_snapshots) postérieures à la
+première ligne réécrite.
+
+Les calculs se font en flottants arrondis à chaque pas (quantités à 2
+décimales, coûts à 4), de la même façon dans les deux voies : le batch
+retrouve exactement les valeurs de l'incrémental.
+"""
+import argparse
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import and_, bindparam, delete, func, insert, select, tuple_, update
+from sqlalchemy.engine import Connection
+
+from ..models.base import generer_id
+from ..models.inventory import LigneValorisation, MouvementStock, Stock, TypeMouvement
+from .stock_ledger import SANS_LOT, CleStock, effets_mouvement, enregistrer_ecouteur, par_paquets
+
+logger = logging.getLogger(__name__)
+
+# Types dont le coût unitaire saisi valorise les entrées
+_TYPES_COUT_SAISI = (TypeMouvement.ENTREE, TypeMouvement.AJUSTEMENT)
+# Nombre maximal de passes batch pour propager le coût des transferts en chaîne
+PASSES_MAX = 50
+
+Position = Tuple[datetime, Any]
+
+
+def _arrondir(valeur: float, decimales: int) -> float:
+    # Même arrondi que np.rint(x * 10**n) / 10**n (au pair le plus proche)
+    facteur = 10.0 ** decimales
+    return round(valeur * facteur) / facteur
+
+
+def _pas(quantite: float, cmup: float, delta: float, cout: Optional[float]) -> Tuple[float, float]:
+    """Un mouvement appliqué à un solde : retourne (quantité après, CMUP après)."""
+    apres = _arrondir(quantite + delta, 2)
+    if delta > 0 and cout is not None:
+        cmup = cout if quantite <= 0 else _arrondir((quantite * cmup + delta * cout) / apres, 4)
+    return apres, cmup
+
+
+def _filtre_cle(table, cle: CleStock):
+    produit, entrepot, lot = cle
+    return and_(
+        table.c.produit_id == produit,
+        table.c.entrepot_id == entrepot,
+        table.c.lot.is_(None) if lot is None else table.c.lot == lot,
+    )
+
+
+def _type(valeur) -> TypeMouvement:
+    return valeur if isinstance(valeur, TypeMouvement) else TypeMouvement(valeur)
+
+
+def lignes_mouvement(mouvement: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Lignes de valorisation d'un mouvement (CMUP calculé au rejeu)."""
+    type_mouvement = _type(mouvement["type_mouvement"])
+    maintenant = datetime.utcnow()
+    lignes = []
+    for (produit, entrepot, lot), delta in effets_mouvement(mouvement):
+        cout = mouvement.get("cout_unitaire") if delta > 0 and type_mouvement in _TYPES_COUT_SAISI else None
+        lignes.append({
+            "id": generer_id(),
+            "mouvement_id": mouvement["id"],
+            "produit_id": produit,
+            "entrepot_id": entrepot,
+            "lot": lot,
+            "date_mouvement": mouvement["date_mouvement"],
+            "type_mouvement": type_mouvement,
+            "quantite": delta,
+            "cout_unitaire": cout,
+            "quantite_apres": None,
+            "cmup_apres": None,
+            "created_at": maintenant,
+            "updated_at": maintenant,
+        })
+    return lignes
+
+
+def _noter(a_rejouer: Dict[CleStock, Position], cle: CleStock, position: Position) -> None:
+    if cle not in a_rejouer or position < a_rejouer[cle]:
+        a_rejouer[cle] = position
+
+
+def _mettre_a_jour_stock(connexion: Connection, cle: CleStock, cmup: float) -> None:
+    table = Stock.__table__
+    produit, entrepot, lot = cle
+    connexion.execute(
+        update(table)
+        .where(table.c.produit_id == produit, table.c.entrepot_id == entrepot,
+               func.coalesce(table.c.lot, SANS_LOT) == (lot or ""))
+        .values(valeur_unitaire=round(cmup, 2))
+    )
+
+
+def _rejouer(connexion: Connection, cle: CleStock, depuis: Position) -> Dict[Any, float]:
+    """
+    Recalcule les lignes du solde `cle` à partir de la position `depuis`.
+    Retourne le coût de sortie des transferts rencontrés (par mouvement).
+    """
+    t = LigneValorisation.__table__
+    position = tuple_(t.c.date_mouvement, t.c.mouvement_id)
+    filtre = _filtre_cle(t, cle)
+    precedente = connexion.execute(
+        select(t.c.quantite_apres, t.c.cmup_apres)
+        .where(filtre, position < depuis)
+        .order_by(t.c.date_mouvement.desc(), t.c.mouvement_id.desc())
+        .limit(1)
+    ).first()
+    quantite, cmup = (float(precedente[0]), float(precedente[1])) if precedente else (0.0, 0.0)
+
+    maj, couts_transferts = [], {}
+    for ligne in connexion.execute(
+        select(t.c.id, t.c.mouvement_id, t.c.type_mouvement, t.c.quantite, t.c.cout_unitaire,
+               t.c.quantite_apres, t.c.cmup_apres)
+        .where(filtre, position >= depuis)
+        .order_by(t.c.date_mouvement, t.c.mouvement_id)
+    ):
+        delta = float(ligne.quantite)
+        if delta < 0 and _type(ligne.type_mouvement) is TypeMouvement.TRANSFERT:
+            couts_transferts[ligne.mouvement_id] = cmup
+        cout = None if ligne.cout_unitaire is None else float(ligne.cout_unitaire)
+        quantite, cmup = _pas(quantite, cmup, delta, cout)
+        if (
+            ligne.quantite_apres is None
+            or float(ligne.quantite_apres) != quantite
+            or float(ligne.cmup_apres) != cmup
+        ):
+            maj.append({"_id": ligne.id, "_quantite": quantite, "_cmup": cmup})
+
+    if maj:
+        connexion.execute(
+            update(t).where(t.c.id == bindparam("_id"))
+            .values(quantite_apres=bindparam("_quantite"), cmup_apres=bindparam("_cmup")),
+            maj,
+        )
+    _mettre_a_jour_stock(connexion, cle, cmup)
+    return couts_transferts
+
+
+def rejouer(connexion: Connection, a_rejouer: Dict[CleStock, Position]) -> int:
+    """
+    Rejoue les soldes donnés à partir de leur position, puis ceux dont une
+    entrée par transfert change de coût. Retourne le nombre de rejeux.
+    """
+    t = LigneValorisation.__table__
+    rejeux = 0
+    a_rejouer = dict(a_rejouer)
+    while a_rejouer:
+        cle = min(a_rejouer, key=lambda c: a_rejouer[c])
+        couts = _rejouer(connexion, cle, a_rejouer.pop(cle))
+        rejeux += 1
+        if not couts:
+            continue
+        for entree in connexion.execute(
+            select(t.c.id, t.c.mouvement_id, t.c.produit_id, t.c.entrepot_id, t.c.lot,
+                   t.c.date_mouvement, t.c.cout_unitaire)
+            .where(t.c.mouvement_id.in_(list(couts)), t.c.quantite > 0)
+        ).all():
+            cout = couts[entree.mouvement_id]
+            if entree.cout_unitaire is not None and float(entree.cout_unitaire) == cout:
+                continue
+            connexion.execute(update(t).where(t.c.id == entree.id).values(cout_unitaire=cout))
+            _noter(a_rejouer, (entree.produit_id, entree.entrepot_id, entree.lot),
+                   (entree.date_mouvement, entree.mouvement_id))
+    return rejeux
+
+
+def _dernieres_lignes(connexion: Connection, cles) -> Dict[CleStock, Any]:
+    """
+    Dernière ligne de valorisation de chaque solde, par paquets : une sous-requête
+    corrélée (parcours descendant de l'index, LIMIT 1) par ligne Stock.
+    """
+    t, s = LigneValorisation.__table__, Stock.__table__
+    cles = set(cles)
+    dernieres = {}
+    for paquet in par_paquets(sorted(cles, key=lambda cle: tuple(map(str, cle)))):
+        couples = list({(produit, entrepot) for produit, entrepot, _ in paquet})
+        # Lot renseigné ou absent : deux requêtes pour garder des conditions
+        # d'égalité (ou IS NULL) exploitables par l'index
+        for avec_lot in {lot is not None for _, _, lot in paquet}:
+            l = t.alias("derniere")
+            derniere = (
+                select(l.c.id)
+                .where(
+                    l.c.produit_id == s.c.produit_id,
+                    l.c.entrepot_id == s.c.entrepot_id,
+                    l.c.lot == s.c.lot if avec_lot else l.c.lot.is_(None),
+                )
+                .order_by(l.c.date_mouvement.desc(), l.c.mouvement_id.desc())
+                .limit(1)
+                .scalar_subquery()
+            )
+            ids = select(derniere).where(
+                tuple_(s.c.produit_id, s.c.entrepot_id).in_(couples),
+                s.c.lot.isnot(None) if avec_lot else s.c.lot.is_(None),
+            )
+            for ligne in connexion.execute(
+                select(t.c.produit_id, t.c.entrepot_id, t.c.lot, t.c.date_mouvement, t.c.mouvement_id,
+                       t.c.quantite_apres, t.c.cmup_apres)
+                .where(t.c.id.in_(ids.scalar_subquery()))
+            ):
+                cle = (ligne.produit_id, ligne.entrepot_id, ligne.lot)
+                if cle in cles:
+                    dernieres[cle] = ligne
+    return dernieres
+
+
+def _valoriser_en_fin(connexion: Connection, lignes: List[Dict[str, Any]], exclues) -> set:
+    """
+    Calcule directement les lignes nouvelles qui viennent après toutes les
+    lignes existantes de leur solde (cas courant). Retourne les soldes à
+    rejouer : antidatés, exclus, ou liés à ceux-ci par un transfert.
+    """
+    cles = {(ligne["produit_id"], ligne["entrepot_id"], ligne["lot"]) for ligne in lignes}
+    premieres: Dict[CleStock, Position] = {}
+    for ligne in lignes:
+        _noter(premieres, (ligne["produit_id"], ligne["entrepot_id"], ligne["lot"]),
+               (ligne["date_mouvement"], ligne["mouvement_id"]))
+    dernieres = _dernieres_lignes(connexion, cles - set(exclues))
+
+    a_rejouer = set(exclues) & cles
+    for cle, ligne in dernieres.items():
+        if (ligne.date_mouvement, ligne.mouvement_id) >= premieres[cle]:
+            a_rejouer.add(cle)
+    # Les deux soldes d'un transfert sont rejoués ensemble
+    transferts: Dict[Any, List[CleStock]] = {}
+    for ligne in lignes:
+        if ligne["type_mouvement"] is TypeMouvement.TRANSFERT:
+            transferts.setdefault(ligne["mouvement_id"], []).append(
+                (ligne["produit_id"], ligne["entrepot_id"], ligne["lot"]))
+    change = True
+    while change:
+        change = False
+        for paire in transferts.values():
+            if any(cle in a_rejouer for cle in paire) and not all(cle in a_rejouer for cle in paire):
+                a_rejouer.update(paire)
+                change = True
+
+    etats = {
+        cle: (float(ligne.quantite_apres), float(ligne.cmup_apres))
+        for cle, ligne in dernieres.items() if cle not in a_rejouer
+    }
+    couts_transferts = {}
+    # Tri stable : la sortie d'un transfert précède son entrée
+    for ligne in sorted(lignes, key=lambda ligne: (ligne["date_mouvement"], ligne["mouvement_id"])):
+        cle = (ligne["produit_id"], ligne["entrepot_id"], ligne["lot"])
+        if cle in a_rejouer:
+            continue
+        quantite, cmup = etats.get(cle, (0.0, 0.0))
+        delta = float(ligne["quantite"])
+        if ligne["type_mouvement"] is TypeMouvement.TRANSFERT:
+            if delta < 0:
+                couts_transferts[ligne["mouvement_id"]] = cmup
+            else:
+                ligne["cout_unitaire"] = couts_transferts[ligne["mouvement_id"]]
+        cout = None if ligne["cout_unitaire"] is None else float(ligne["cout_unitaire"])
+        etats[cle] = _pas(quantite, cmup, delta, cout)
+        ligne["quantite_apres"], ligne["cmup_apres"] = etats[cle]
+
+    s = Stock.__table__
+    valeurs = [
+        {"_produit": cle[0], "_entrepot": cle[1], "_lot": cle[2] or "", "_valeur": round(etats[cle][1], 2)}
+        for cle in cles - a_rejouer
+    ]
+    for paquet in par_paquets(valeurs):
+        connexion.execute(
+            update(s).where(
+                s.c.produit_id == bindparam("_produit"),
+                s.c.entrepot_id == bindparam("_entrepot"),
+                func.coalesce(s.c.lot, SANS_LOT) == bindparam("_lot"),
+            ).values(valeur_unitaire=bindparam("_valeur")),
+            paquet,
+        )
+    return a_rejouer
+
+
+@enregistrer_ecouteur
+def valoriser(connexion: Connection, mouvements: List[Dict[str, Any]],
+              annules: List[Dict[str, Any]], soldes: Dict[CleStock, Any]) -> None:
+    """Écouteur du journal : met à jour la valorisation des soldes touchés."""
+    t = LigneValorisation.__table__
+    a_rejouer: Dict[CleStock, Position] = {}
+    # Seuls les mouvements modifiés ou supprimés ont déjà des lignes
+    for paquet in par_paquets([mouvement["id"] for mouvement in annules]):
+        connexion.execute(delete(t).where(t.c.mouvement_id.in_(paquet)))
+    for mouvement in annules:
+        for cle, _ in effets_mouvement(mouvement):
+            _noter(a_rejouer, cle, (mouvement["date_mouvement"], mouvement["id"]))
+
+    lignes = [ligne for mouvement in mouvements for ligne in lignes_mouvement(mouvement)]
+    if lignes:
+        soldes_rejoues = _valoriser_en_fin(connexion, lignes, a_rejouer.keys())
+        connexion.execute(insert(t), lignes)
+        for ligne in lignes:
+            cle = (ligne["produit_id"], ligne["entrepot_id"], ligne["lot"])
+            if cle in soldes_rejoues:
+                _noter(a_rejouer, cle, (ligne["date_mouvement"], ligne["mouvement_id"]))
+    rejouer(connexion, a_rejouer)
+
+
+# --- Revalorisation batch ---
+
+def calculer_cmup(deltas: np.ndarray, couts: np.ndarray, debuts: np.ndarray, longueurs: np.ndarray):
+    """
+    CMUP de toutes les lignes, triées par solde puis par position ; le solde k
+    occupe les lignes [debuts[k], debuts[k] + longueurs[k]). `couts` vaut NaN
+    pour les lignes sans coût d'entrée. Le pas j traite la j-ième ligne de
+    tous les soldes qui en ont au moins j + 1, en une opération vectorielle.
+    Retourne (quantités après, CMUP après, CMUP avant).
+    """
+    ordre = np.argsort(-longueurs, kind="stable")
+    debuts, longueurs = debuts[ordre], longueurs[ordre]
+    quantite = np.zeros(len(debuts))
+    cmup = np.zeros(len(debuts))
+    quantites_apres = np.empty(len(deltas))
+    cmup_apres = np.empty(len(deltas))
+    cmup_avant = np.empty(len(deltas))
+    longueurs_negatives = -longueurs
+    for j in range(int(longueurs[0]) if len(longueurs) else 0):
+        actifs = int(np.searchsorted(longueurs_negatives, -j, side="left"))
+        lignes = debuts[:actifs] + j
+        q, c = quantite[:actifs], cmup[:actifs]
+        delta, cout = deltas[lignes], couts[lignes]
+        cmup_avant[lignes] = c
+        apres = np.rint((q + delta) * 100) / 100
+        entree = (delta > 0) & ~np.isnan(cout)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            moyenne = np.rint((q * c + delta * cout) / apres * 10000) / 10000
+        nouveau = np.where(entree, np.where(q <= 0, cout, moyenne), c)
+        quantite[:actifs], cmup[:actifs] = apres, nouveau
+        quantites_apres[lignes], cmup_apres[lignes] = apres, nouveau
+    return quantites_apres, cmup_apres, cmup_avant
+
+
+def _flottant(valeur) -> float:
+    return np.nan if valeur is None else float(valeur)
+
+
+def reconstruire_lignes(connexion: Connection, taille_lot: int = 10000) -> int:
+    """Recrée toutes les lignes de valorisation depuis le journal des mouvements."""
+    t = LigneValorisation.__table__
+    connexion.execute(delete(t))
+    total, lot = 0, []
+    resultat = connexion.execution_options(stream_results=True, yield_per=taille_lot).execute(
+        select(MouvementStock.__table__)
+    )
+    for mouvement in resultat.mappings():
+        lot.extend(lignes_mouvement(dict(mouvement)))
+        if len(lot) >= taille_lot:
+            connexion.execute(insert(t), lot)
+            total, lot = total + len(lot), []
+    if lot:
+        connexion.execute(insert(t), lot)
+        total += len(lot)
+    return total
+
+
+@dataclass
+class RapportValorisation:
+    """Résultat d'une revalorisation complète"""
+    lignes: int
+    soldes: int
+    lignes_modifiees: int
+    passes: int
+    valeur_totale: float
+    snapshots: int
+    duree: float
+
+
+def revaloriser(connexion: Connection, reconstruire: bool = False) -> RapportValorisation:
+    """
+    Recalcule le CMUP de toutes les lignes et de tous les soldes en une passe
+    vectorisée ; seules les lignes dont la valeur change sont réécrites.
+    Les coûts d'entrée des transferts sont propagés par passes successives
+    jusqu'à stabilité (une passe par niveau de transferts en chaîne). Les
+    photographies de stock postérieures à la première ligne réécrite (toutes
+    avec `reconstruire`) sont refaites.
+    """
+    debut = time.perf_counter()
+    if reconstruire:
+        reconstruire_lignes(connexion)
+    t = LigneValorisation.__table__
+    lignes = connexion.execute(
+        select(t.c.id, t.c.produit_id, t.c.entrepot_id, t.c.lot, t.c.mouvement_id, t.c.type_mouvement,
+               t.c.date_mouvement, t.c.quantite, t.c.cout_unitaire, t.c.quantite_apres, t.c.cmup_apres)
+        .order_by(t.c.produit_id, t.c.entrepot_id, t.c.lot, t.c.date_mouvement, t.c.mouvement_id)
+    ).all()
+    n = len(lignes)
+    deltas = np.fromiter((float(ligne.quantite) for ligne in lignes), float, n)
+    couts = np.fromiter((_flottant(ligne.cout_unitaire) for ligne in lignes), float, n)
+    quantites_lues = np.fromiter((_flottant(ligne.quantite_apres) for ligne in lignes), float, n)
+    cmup_lus = np.fromiter((_flottant(ligne.cmup_apres) for ligne in lignes), float, n)
+    couts_lus = couts.copy()
+
+    cles = [(ligne.produit_id, ligne.entrepot_id, ligne.lot) for ligne in lignes]
+    rupture = np.fromiter((i == 0 or cles[i] != cles[i - 1] for i in range(n)), bool, n)
+    debuts = np.flatnonzero(rupture)
+    longueurs = np.diff(np.append(debuts, n))
+
+    # Appariement sortie -> entrée des transferts
+    sorties, entrees = {}, {}
+    for i, ligne in enumerate(lignes):
+        if _type(ligne.type_mouvement) is TypeMouvement.TRANSFERT:
+            (sorties if deltas[i] < 0 else entrees)[ligne.mouvement_id] = i
+    paires = [(sorties[m], entrees[m]) for m in sorties.keys() & entrees.keys()]
+    index_sorties = np.array([s for s, _ in paires], dtype=np.int64)
+    index_entrees = np.array([e for _, e in paires], dtype=np.int64)
+
+    passes = 0
+    while True:
+        passes += 1
+        quantites, cmup, cmup_avant = calculer_cmup(deltas, couts, debuts, longueurs)
+        if not len(paires):
+            break
+        nouveaux = cmup_avant[index_sorties]
+        if np.array_equal(nouveaux, couts[index_entrees], equal_nan=True) or passes >= PASSES_MAX:
+            break
+        couts[index_entrees] = nouveaux
+
+    # NaN (valeur non encore calculée) est toujours différent : ligne réécrite
+    modifiees = np.flatnonzero(
+        (quantites != quantites_lues)
+        | (cmup != cmup_lus)
+        | ~((couts == couts_lus) | (np.isnan(couts) & np.isnan(couts_lus)))
+    )
+    if len(modifiees):
+        connexion.execute(
+            update(t).where(t.c.id == bindparam("_id")).values(
+                quantite_apres=bindparam("_quantite"),
+                cmup_apres=bindparam("_cmup"),
+                cout_unitaire=bindparam("_cout"),
+            ),
+            [
+                {
+                    "_id": lignes[i].id,
+                    "_quantite": float(quantites[i]),
+                    "_cmup": float(cmup[i]),
+                    "_cout": None if np.isnan(couts[i]) else float(couts[i]),
+                }
+                for i in modifiees.tolist()
+            ],
+        )
+
+    # Dernière ligne de chaque solde : valeur unitaire courante du Stock
+    fins = debuts + longueurs - 1
+    s = Stock.__table__
+    if len(fins):
+        connexion.execute(
+            update(s).where(
+                s.c.produit_id == bindparam("_produit"),
+                s.c.entrepot_id == bindparam("_entrepot"),
+                func.coalesce(s.c.lot, SANS_LOT) == bindparam("_lot"),
+            ).values(valeur_unitaire=bindparam("_valeur")),
+            [
+                {"_produit": cles[i][0], "_entrepot": cles[i][1], "_lot": cles[i][2] or "",
+                 "_valeur": round(float(cmup[i]), 2)}
+                for i in fins.tolist()
+            ],
+        )
+
+    # Import local : stock_snapshots importe ce module, dont l'écouteur doit
+    # être enregistré avant le sien
+    from .stock_snapshots import reconstruire_snapshots
+
+    snapshots = []
+    if reconstruire or len(modifiees):
+        depuis = None if reconstruire else min(lignes[i].date_mouvement for i in modifiees.tolist())
+        snapshots = reconstruire_snapshots(connexion, depuis)
+
+    rapport = RapportValorisation(
+        lignes=n,
+        soldes=len(debuts),
+        lignes_modifiees=len(modifiees),
+        passes=passes,
+        valeur_totale=float(np.sum(quantites[fins] * cmup[fins])) if len(fins) else 0.0,
+        snapshots=len(snapshots),
+        duree=time.perf_counter() - debut,
+    )
+    logger.info("Revalorisation : %s", rapport)
+    return rapport
+
+
+def main() -> None:
+    from ..core.database import engine
+
+    parser = argparse.ArgumentParser(description="Revalorisation complète des stocks au CMUP")
+    parser.add_argument("--reconstruire", action="store_true",
+                        help="recrée les lignes de valorisation depuis le journal")
+    args = parser.parse_args()
+    with engine.begin() as connexion:
+        rapport = revaloriser(connexion, reconstruire=args.reconstruire)
+    print(f"{rapport.lignes} lignes, {rapport.soldes} soldes, {rapport.lignes_modifiees} modifiées "
+          f"en {rapport.passes} passe(s), valeur {rapport.valeur_totale:,.2f}, "
+          f"{rapport.snapshots} photographie(s) refaite(s) en {rapport.duree:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
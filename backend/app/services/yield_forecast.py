@@ -0,0 +1,457 @@
+"""
+Prévision des rendements : renseigne `CycleCulture.rendement_prevu` (kg/ha
+sur le cycle) à partir de l'historique des récoltes.
+
+Modèle : le rendement d'une récolte (kg/ha) est une fonction quadratique de
+l'âge des plants (années depuis `date_plantation`) :
+`y = c0 + c1 * age + c2 * age²`. Chaque parcelle tient dans
+ModeleRendement les statistiques suffisantes de cette régression (n, Σa..Σa⁴,
+Σy, Σay, Σa²y) : elles s'additionnent, une récolte ajoutée ou retirée les
+met à jour sans relire l'historique, et l'ajustement de toutes les parcelles
+est une résolution 3×3 vectorisée (NumPy).
+
+Repli quand une parcelle n'a pas assez de récoltes (`OBSERVATIONS_MIN`) ou
+d'âges trop groupés : modèle de la culture (statistiques de ses parcelles
+cumulées) mis à l'échelle de la parcelle, puis moyenne observée, puis
+rendement théorique de AGRICULTURAL_CONFIG.
+
+Prévision d'un cycle ouvert (sans `date_fin` ou fini après aujourd'hui) :
+somme du modèle sur ses tournées, une tous les `harvest_cycle_days` depuis
+l'entrée en production (`maturity_months`) et pendant `productive_years`,
+comme la planification (app.services.harvest_planner). Sans `date_fin`, le
+cycle dure `DUREE_CYCLE_DEFAUT` jours. Une valeur saisie à la main pour un
+cycle ouvert est remplacée.
+
+Tenue incrémentale, au flush d'une session :
+- récolte créée, corrigée ou supprimée : statistiques de sa parcelle
+  ajustées, parcelle réajustée et ses cycles ouverts re-prévus ;
+- parcelle dont la plantation ou la surface change : ses statistiques sont
+  recalculées depuis ses récoltes ;
+- cycle créé ou dont les dates changent : parcelle réajustée et ses cycles
+  re-prévus.
+Les parcelles en repli sur leur culture ne sont réajustées que par le
+traitement complet (`prevoir()`), à lancer après un import en masse.
+
+Usage :
+    python -m app.services.yield_forecast                  # ajuste et prévoit tous les cycles ouverts
+    python -m app.services.yield_forecast --reconstruire   # recalcule d'abord les statistiques
+"""
+import argparse
+import logging
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import bindparam, delete, event, func, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.history import colonnes_modifiees, etat_avant, suivre_colonnes
+from ..models.base import generer_id
+from ..models.production import CycleCulture, ModeleRendement, Parcelle, Recolte
+from .harvest_planner import parametres_cultures
+from .stock_ledger import par_paquets
+
+logger = logging.getLogger(__name__)
+
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+STATISTIQUES = ("n", "sa", "saa", "saaa", "saaaa", "sy", "say", "saay")
+PARCELLE, CULTURE, MOYENNE, CONFIG = "parcelle", "culture", "moyenne", "config"
+
+OBSERVATIONS_MIN = 12      # récoltes nécessaires pour un modèle propre à la parcelle (ou à la culture)
+ECART_AGE_MIN = 0.5        # écart-type minimal des âges observés (années)
+ECHELLE_MAX = 5.0          # borne du facteur parcelle / culture
+DUREE_CYCLE_DEFAUT = 365   # jours, cycle ouvert sans date de fin
+JOURS_PAR_AN = 365.25
+
+_COLONNES_RECOLTE = ("parcelle_id", "date_recolte", "quantite_kg")
+_COLONNES_PARCELLE = ("date_plantation", "surface_hectares")
+_COLONNES_CYCLE = ("parcelle_id", "date_debut", "date_fin")
+suivre_colonnes(Recolte, _COLONNES_RECOLTE)
+suivre_colonnes(CycleCulture, ("parcelle_id",))
+
+_EPOQUE = np.datetime64("1970-01-01", "D")
+
+
+@dataclass
+class RapportPrevision:
+    """Résultat d'une prévision"""
+    parcelles: int = 0
+    cycles: int = 0
+    duree_statistiques: float = 0.0
+    duree_ajustement: float = 0.0
+    duree_cycles: float = 0.0
+
+
+def _jours(dates: Sequence[date]) -> np.ndarray:
+    return (np.array(dates, dtype="datetime64[D]") - _EPOQUE).astype(np.int64)
+
+
+# --- Statistiques suffisantes ---
+
+def statistiques(indices: np.ndarray, age: np.ndarray, rendement: np.ndarray, signe: np.ndarray,
+                 nombre: int) -> np.ndarray:
+    """
+    Sommes (nombre, 8) des observations (âge, rendement) par indice de
+    parcelle ; `signe` vaut 1 pour une récolte ajoutée, -1 pour une retirée.
+    """
+    a2 = age * age
+    poids = (np.ones_like(age), age, a2, a2 * age, a2 * a2, rendement, age * rendement, a2 * rendement)
+    return np.column_stack([np.bincount(indices, weights=signe * w, minlength=nombre) for w in poids])
+
+
+def _observations(connexion: Connection, recoltes: Sequence[Dict[str, Any]], signes: Sequence[int]):
+    """Parcelles, indices, âges (années) et rendements (kg/ha) de récoltes."""
+    p = Parcelle.__table__
+    parcelles = {}
+    for paquet in par_paquets({r["parcelle_id"] for r in recoltes}):
+        parcelles.update(
+            (ligne.id, ligne) for ligne in
+            connexion.execute(select(p.c.id, p.c.date_plantation, p.c.surface_hectares).where(p.c.id.in_(paquet)))
+        )
+    retenues = [
+        (r, signe) for r, signe in zip(recoltes, signes)
+        if r["parcelle_id"] in parcelles and parcelles[r["parcelle_id"]].surface_hectares
+        and r["date_recolte"] >= parcelles[r["parcelle_id"]].date_plantation
+    ]
+    ids = list({r["parcelle_id"]: None for r, _ in retenues})
+    rang = {parcelle: i for i, parcelle in enumerate(ids)}
+    n = len(retenues)
+    indices = np.fromiter((rang[r["parcelle_id"]] for r, _ in retenues), np.int64, n)
+    age = (_jours([r["date_recolte"] for r, _ in retenues])
+           - _jours([parcelles[r["parcelle_id"]].date_plantation for r, _ in retenues])) / JOURS_PAR_AN
+    rendement = np.fromiter(
+        (float(r["quantite_kg"]) / float(parcelles[r["parcelle_id"]].surface_hectares) for r, _ in retenues), float, n
+    )
+    return ids, indices, age.reshape(n), rendement, np.fromiter((s for _, s in retenues), float, n)
+
+
+def _appliquer(connexion: Connection, ids: Sequence[Any], sommes: np.ndarray) -> None:
+    """Ajoute les sommes aux statistiques des parcelles (upsert)."""
+    if not len(ids):
+        return
+    m = ModeleRendement.__table__
+    maintenant = datetime.utcnow()
+    stmt = _INSERTS[connexion.dialect.name](m)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[m.c.parcelle_id],
+        set_={**{nom: m.c[nom] + stmt.excluded[nom] for nom in STATISTIQUES}, "updated_at": maintenant},
+    )
+    lignes = [
+        {"id": generer_id(), "parcelle_id": parcelle, "created_at": maintenant, "updated_at": maintenant,
+         **dict(zip(STATISTIQUES, (int(ligne[0]), *ligne[1:].tolist())))}
+        for parcelle, ligne in sorted(zip(ids, sommes), key=lambda element: str(element[0]))
+    ]
+    for paquet in par_paquets(lignes):
+        connexion.execute(stmt, paquet)
+
+
+def enregistrer_recoltes(connexion: Connection, recoltes: Sequence[Dict[str, Any]],
+                         annulees: Sequence[Dict[str, Any]] = ()) -> List[Any]:
+    """
+    Reporte sur les statistiques des récoltes écrites (et retire `annulees`,
+    état antérieur de récoltes corrigées ou supprimées). Retourne les
+    parcelles touchées.
+    """
+    toutes = [*recoltes, *annulees]
+    if not toutes:
+        return []
+    ids, indices, age, rendement, signe = _observations(
+        connexion, toutes, [1] * len(recoltes) + [-1] * len(annulees)
+    )
+    _appliquer(connexion, ids, statistiques(indices, age, rendement, signe, len(ids)))
+    return ids
+
+
+def reconstruire(connexion: Connection, parcelles: Optional[Sequence[Any]] = None, taille_lot: int = 10000) -> int:
+    """
+    Recalcule les statistiques depuis les récoltes (toutes, ou celles des
+    `parcelles`), lues en flux. Retourne le nombre de récoltes relues.
+    """
+    m, r = ModeleRendement.__table__, Recolte.__table__
+    lecture = select(*(r.c[nom] for nom in _COLONNES_RECOLTE))
+    if parcelles is None:
+        connexion.execute(delete(m))
+    else:
+        parcelles = list(parcelles)
+        for paquet in par_paquets(parcelles):
+            connexion.execute(delete(m).where(m.c.parcelle_id.in_(paquet)))
+        lecture = lecture.where(r.c.parcelle_id.in_(parcelles))
+    resultat = connexion.execution_options(stream_results=True, yield_per=taille_lot).execute(lecture)
+    total = 0
+    for paquet in resultat.mappings().partitions():
+        total += len(paquet)
+        enregistrer_recoltes(connexion, paquet)
+    return total
+
+
+# --- Ajustement ---
+
+def _resoudre(sommes: np.ndarray) -> np.ndarray:
+    """Coefficients (c0, c1, c2) des moindres carrés pour chaque ligne de sommes (k, 8)."""
+    n, sa, saa, saaa, saaaa, sy, say, saay = sommes.T
+    xtx = np.stack([n, sa, saa, sa, saa, saaa, saa, saaa, saaaa], axis=1).reshape(-1, 3, 3)
+    xty = np.stack([sy, say, saay], axis=1)[:, :, None]
+    return (np.linalg.pinv(xtx) @ xty)[:, :, 0]
+
+
+def _exploitable(sommes: np.ndarray) -> np.ndarray:
+    n, sa, saa = sommes[:, 0], sommes[:, 1], sommes[:, 2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variance = saa / n - (sa / n) ** 2
+    return (n >= OBSERVATIONS_MIN) & (variance >= ECART_AGE_MIN ** 2)
+
+
+def ajuster_coefficients(sommes: np.ndarray, cultures: np.ndarray, sommes_cultures: np.ndarray,
+                         theorique: np.ndarray):
+    """
+    Coefficients (k, 3) et source du modèle de chaque parcelle. `cultures`
+    indexe `sommes_cultures` (statistiques cumulées par culture) et
+    `theorique` (rendement par récolte de la configuration, NaN si absente).
+    """
+    k = len(sommes)
+    coefficients = np.full((k, 3), np.nan)
+    sources = np.full(k, None, dtype=object)
+    n, sa, saa, sy = sommes[:, 0], sommes[:, 1], sommes[:, 2], sommes[:, 5]
+
+    # Culture (mise à l'échelle de la parcelle : observé / prévu aux mêmes âges)
+    culture = _resoudre(sommes_cultures)[cultures]
+    prevu = culture[:, 0] * n + culture[:, 1] * sa + culture[:, 2] * saa
+    with np.errstate(divide="ignore", invalid="ignore"):
+        echelle = np.where((n > 0) & (prevu > 0), sy / prevu, 1.0)
+    echelle = np.clip(echelle, 1 / ECHELLE_MAX, ECHELLE_MAX)
+    n_culture, sy_culture = sommes_cultures[cultures, 0], sommes_cultures[cultures, 5]
+    replis = (
+        (_exploitable(sommes), _resoudre(sommes), PARCELLE),
+        (_exploitable(sommes_cultures)[cultures], culture * echelle[:, None], CULTURE),
+        (n > 0, np.column_stack([sy / np.maximum(n, 1), np.zeros(k), np.zeros(k)]), MOYENNE),
+        (n_culture > 0, np.column_stack([sy_culture / np.maximum(n_culture, 1), np.zeros(k), np.zeros(k)]), MOYENNE),
+        (~np.isnan(theorique[cultures]), np.column_stack([theorique[cultures], np.zeros(k), np.zeros(k)]), CONFIG),
+    )
+    libre = np.ones(k, dtype=bool)
+    for condition, valeurs, source in replis:
+        choix = libre & condition
+        coefficients[choix] = valeurs[choix]
+        sources[choix] = source
+        libre &= ~choix
+    return coefficients, sources
+
+
+def ajuster(connexion: Connection, parcelles: Optional[Sequence[Any]] = None) -> int:
+    """
+    Réajuste le modèle de toutes les parcelles (ou des seules `parcelles`).
+    Retourne le nombre de parcelles ajustées.
+    """
+    p, m = Parcelle.__table__, ModeleRendement.__table__
+    colonnes = [func.coalesce(m.c[nom], 0).label(nom) for nom in STATISTIQUES]
+    lecture = select(p.c.id, p.c.culture_type, *colonnes).select_from(p.outerjoin(m, m.c.parcelle_id == p.c.id))
+    if parcelles is None:
+        lignes = connexion.execute(lecture).all()
+    else:
+        lignes = []
+        for paquet in par_paquets(list(parcelles)):
+            lignes.extend(connexion.execute(lecture.where(p.c.id.in_(paquet))))
+    if not lignes:
+        return 0
+
+    liste_cultures = sorted({ligne.culture_type for ligne in lignes})
+    rang = {culture: i for i, culture in enumerate(liste_cultures)}
+    sommes_cultures = np.zeros((len(liste_cultures), len(STATISTIQUES)))
+    for ligne in connexion.execute(
+        select(p.c.culture_type, *(func.sum(m.c[nom]) for nom in STATISTIQUES))
+        .join(m, m.c.parcelle_id == p.c.id)
+        .where(p.c.culture_type.in_(liste_cultures))
+        .group_by(p.c.culture_type)
+    ):
+        sommes_cultures[rang[ligne[0]]] = [float(valeur or 0) for valeur in ligne[1:]]
+    parametres = parametres_cultures(settings.AGRICULTURAL_CONFIG)
+    theorique = np.array([
+        parametres[culture]["plants_par_ha"] * parametres[culture]["rendement"] * parametres[culture]["cycle"] / 365.0
+        if culture in parametres else np.nan
+        for culture in liste_cultures
+    ])
+
+    coefficients, sources = ajuster_coefficients(
+        np.array([[float(valeur) for valeur in ligne[2:]] for ligne in lignes]).reshape(-1, len(STATISTIQUES)),
+        np.fromiter((rang[ligne.culture_type] for ligne in lignes), np.int64, len(lignes)),
+        sommes_cultures, theorique,
+    )
+
+    maintenant = datetime.utcnow()
+    stmt = _INSERTS[connexion.dialect.name](m)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[m.c.parcelle_id],
+        set_={nom: stmt.excluded[nom] for nom in ("c0", "c1", "c2", "source", "date_ajustement", "updated_at")},
+    )
+    valeurs = [
+        {
+            "id": generer_id(), "parcelle_id": ligne.id, **{nom: 0 for nom in STATISTIQUES},
+            **dict(zip(("c0", "c1", "c2"), [None if np.isnan(c) else c for c in coefficient.tolist()])),
+            "source": source, "date_ajustement": maintenant, "created_at": maintenant, "updated_at": maintenant,
+        }
+        for ligne, coefficient, source in sorted(zip(lignes, coefficients, sources), key=lambda e: str(e[0].id))
+    ]
+    for paquet in par_paquets(valeurs):
+        connexion.execute(stmt, paquet)
+    return len(lignes)
+
+
+# --- Prévision des cycles ---
+
+def _somme_rangs(k: np.ndarray, puissance: int) -> np.ndarray:
+    """Σ j^puissance pour j de 0 à k - 1."""
+    if puissance == 1:
+        return k * (k - 1) / 2
+    return (k - 1) * k * (2 * k - 1) / 6
+
+
+def prevoir_rendements(coefficients: np.ndarray, plantation: np.ndarray, debut: np.ndarray, fin: np.ndarray,
+                       cycle: np.ndarray, maturite: np.ndarray, duree_vie: np.ndarray) -> np.ndarray:
+    """
+    Rendement prévu (kg/ha) de chaque cycle [debut, fin) : somme du modèle
+    aux âges des tournées du cycle. Dates en jours depuis 1970, durées en jours.
+    """
+    production = plantation + maturite
+    premier = np.maximum(debut, production)
+    dernier = np.minimum(fin, production + duree_vie)  # exclu
+    k_min = np.maximum(-((production - premier) // cycle), 0)
+    k_max = np.maximum(-((production - dernier) // cycle), k_min)
+    nombre = (k_max - k_min).astype(float)
+    s1 = _somme_rangs(k_max, 1) - _somme_rangs(k_min, 1)
+    s2 = _somme_rangs(k_max, 2) - _somme_rangs(k_min, 2)
+    # Âge de la tournée k : alpha + beta * k (années)
+    alpha, beta = maturite / JOURS_PAR_AN, cycle / JOURS_PAR_AN
+    somme_age = nombre * alpha + beta * s1
+    somme_age2 = nombre * alpha ** 2 + 2 * alpha * beta * s1 + beta ** 2 * s2
+    total = coefficients[:, 0] * nombre + coefficients[:, 1] * somme_age + coefficients[:, 2] * somme_age2
+    return np.maximum(total, 0)
+
+
+def mettre_a_jour_cycles(connexion: Connection, parcelles: Optional[Sequence[Any]] = None,
+                         aujourd_hui: Optional[date] = None) -> int:
+    """
+    Recalcule `rendement_prevu` des cycles ouverts (de toutes les parcelles
+    ou des seules `parcelles`). Retourne le nombre de cycles mis à jour.
+    """
+    aujourd_hui = aujourd_hui or date.today()
+    c, p, m = CycleCulture.__table__, Parcelle.__table__, ModeleRendement.__table__
+    parametres = parametres_cultures(settings.AGRICULTURAL_CONFIG)
+    lecture = (
+        select(c.c.id, c.c.date_debut, c.c.date_fin, p.c.date_plantation, p.c.culture_type, m.c.c0, m.c.c1, m.c.c2)
+        .join(p, p.c.id == c.c.parcelle_id)
+        .join(m, m.c.parcelle_id == c.c.parcelle_id)
+        .where(or_(c.c.date_fin.is_(None), c.c.date_fin >= aujourd_hui), m.c.c0.isnot(None),
+               p.c.culture_type.in_(list(parametres)))
+    )
+    if parcelles is None:
+        lignes = connexion.execute(lecture).all()
+    else:
+        lignes = []
+        for paquet in par_paquets(list(parcelles)):
+            lignes.extend(connexion.execute(lecture.where(c.c.parcelle_id.in_(paquet))))
+    if not lignes:
+        return 0
+
+    n = len(lignes)
+
+    def colonne(nom: str) -> np.ndarray:
+        return np.fromiter((parametres[ligne.culture_type][nom] for ligne in lignes), float, n).astype(np.int64)
+
+    debut = _jours([ligne.date_debut for ligne in lignes])
+    fin = np.array([
+        (np.datetime64(ligne.date_fin, "D") - _EPOQUE).astype(np.int64) if ligne.date_fin else -1 for ligne in lignes
+    ], dtype=np.int64)
+    fin = np.where(fin < 0, debut + DUREE_CYCLE_DEFAUT, fin)
+    rendements = prevoir_rendements(
+        np.array([[ligne.c0, ligne.c1, ligne.c2] for ligne in lignes], dtype=float),
+        _jours([ligne.date_plantation for ligne in lignes]), debut, fin,
+        colonne("cycle"), colonne("maturite"), colonne("duree_vie"),
+    )
+
+    stmt = update(c).where(c.c.id == bindparam("b_id")).values(rendement_prevu=bindparam("b_rendement"))
+    valeurs = [
+        {"b_id": ligne.id, "b_rendement": Decimal(f"{rendement:.2f}")}
+        for ligne, rendement in sorted(zip(lignes, rendements.tolist()), key=lambda e: str(e[0].id))
+    ]
+    for paquet in par_paquets(valeurs):
+        connexion.execute(stmt, paquet)
+    return n
+
+
+def prevoir(connexion: Connection, reconstruire_statistiques: bool = False) -> RapportPrevision:
+    """Ajuste toutes les parcelles et prévoit tous les cycles ouverts, en un traitement."""
+    rapport = RapportPrevision()
+    chrono = time.perf_counter()
+    if reconstruire_statistiques:
+        reconstruire(connexion)
+    rapport.duree_statistiques = time.perf_counter() - chrono
+
+    chrono = time.perf_counter()
+    rapport.parcelles = ajuster(connexion)
+    rapport.duree_ajustement = time.perf_counter() - chrono
+
+    chrono = time.perf_counter()
+    rapport.cycles = mettre_a_jour_cycles(connexion)
+    rapport.duree_cycles = time.perf_counter() - chrono
+    logger.info("Prévision des rendements : %s", rapport)
+    return rapport
+
+
+# --- Tenue au flush ---
+
+@event.listens_for(Session, "after_flush")
+def _prevoir_flush(session, flush_context):
+    nouvelles, annulees = [], []
+    recalculees, cycles = set(), set()
+    for objet in session.new:
+        if isinstance(objet, Recolte):
+            nouvelles.append({nom: getattr(objet, nom) for nom in _COLONNES_RECOLTE})
+        elif isinstance(objet, CycleCulture):
+            cycles.add(objet.parcelle_id)
+    for objet in session.dirty:
+        if isinstance(objet, Recolte) and colonnes_modifiees(session, objet, _COLONNES_RECOLTE):
+            annulees.append(etat_avant(objet, _COLONNES_RECOLTE))
+            nouvelles.append({nom: getattr(objet, nom) for nom in _COLONNES_RECOLTE})
+        elif isinstance(objet, Parcelle) and colonnes_modifiees(session, objet, _COLONNES_PARCELLE + ("culture_type",)):
+            recalculees.add(objet.id)
+        elif isinstance(objet, CycleCulture) and colonnes_modifiees(session, objet, _COLONNES_CYCLE):
+            # Un cycle déplacé met aussi à jour la prévision de son ancienne parcelle
+            cycles.update({objet.parcelle_id, etat_avant(objet, ("parcelle_id",))["parcelle_id"]})
+    for objet in session.deleted:
+        if isinstance(objet, Recolte):
+            annulees.append(etat_avant(objet, _COLONNES_RECOLTE))
+    if not (nouvelles or annulees or recalculees or cycles):
+        return
+
+    connexion = session.connection()
+    if recalculees:
+        # Les récoltes de ces parcelles sont relues dans leur état flushé
+        reconstruire(connexion, list(recalculees))
+        nouvelles = [r for r in nouvelles if r["parcelle_id"] not in recalculees]
+        annulees = [r for r in annulees if r["parcelle_id"] not in recalculees]
+    touchees = set(enregistrer_recoltes(connexion, nouvelles, annulees)) | recalculees | cycles
+    ajuster(connexion, list(touchees))
+    mettre_a_jour_cycles(connexion, list(touchees))
+
+
+def main() -> None:
+    from ..core.database import engine
+
+    parser = argparse.ArgumentParser(description="Prévision des rendements des cycles de culture")
+    parser.add_argument("--reconstruire", action="store_true", help="recalcule les statistiques depuis les récoltes")
+    args = parser.parse_args()
+    with engine.begin() as connexion:
+        rapport = prevoir(connexion, args.reconstruire)
+    print(f"{rapport.parcelles} parcelles ajustées, {rapport.cycles} cycles prévus "
+          f"(statistiques {rapport.duree_statistiques * 1000:.0f} ms, ajustement {rapport.duree_ajustement * 1000:.0f} ms, "
+          f"cycles {rapport.duree_cycles * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
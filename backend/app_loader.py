@@ -0,0 +1,47 @@
+"""
+Assemblage du paquet `app` de l'arborescence de développement.
+
+Les modèles sont répartis entre backend/app/models et
+fofal_erp_2024/backend/app/models (où se trouve le registre
+`app.models/__init__.py`). À l'import, ce module met les deux répertoires sur
+le chemin, backend/app en tête (ses modules, core.config..., priment sur
+leurs homonymes), et assemble `app.models` sur les deux, comme dans
+l'arborescence déployée.
+
+Utilisé par les tests (tests/conftest.py) et les benchmarks ; à importer
+avant tout module `app` :
+
+    import app_loader  # noqa: F401
+    from app.models import Parcelle
+"""
+import importlib.util
+import sys
+from pathlib import Path
+
+RACINE = Path(__file__).resolve().parents[1]
+BACKEND = RACINE / "backend"
+FOFAL = RACINE / "fofal_erp_2024" / "backend"
+
+
+def assembler() -> None:
+    """Ordonne `sys.path` et construit `app.models` sur les deux répertoires (idempotent)."""
+    for chemin in (FOFAL, BACKEND):
+        if str(chemin) in sys.path:
+            sys.path.remove(str(chemin))
+        sys.path.insert(0, str(chemin))
+
+    if "app.models" in sys.modules:
+        return
+    import app
+
+    spec = importlib.util.spec_from_file_location(
+        "app.models", FOFAL / "app" / "models" / "__init__.py",
+        submodule_search_locations=[str(BACKEND / "app" / "models"), str(FOFAL / "app" / "models")],
+    )
+    modeles = importlib.util.module_from_spec(spec)
+    sys.modules["app.models"] = modeles
+    app.models = modeles
+    spec.loader.exec_module(modeles)
+
+
+assembler()
@@ -0,0 +1,95 @@
+"""
+Benchmark de l'ingestion des relevés de capteurs (flux simulé).
+
+Simule P parcelles équipées chacune de capteurs (température, humidité,
+pluie) qui émettent un relevé toutes les `--pas` secondes, pousse le flux
+dans un TamponMesures et mesure le débit soutenu. Vérifie ensuite que les
+agrégats horaires et journaliers tenus à l'ingestion sont égaux à ceux
+recalculés depuis les relevés bruts.
+
+Usage (depuis backend/) :
+    python -m benchmarks.bench_capteurs --parcelles 80 --heures 6
+    python -m benchmarks.bench_capteurs --url postgresql://...  # base de test (COPY)
+"""
+import argparse
+import math
+import random
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.pool import StaticPool
+
+import app_loader  # noqa: F401  assemble le paquet app avant tout import app
+from app.models import AgregatMesure, MesureCapteur, Parcelle, metadata
+from app.services.sensor_timeseries import HEURE, JOUR, Releve, TamponMesures
+
+GRANDEURS = {"temperature": (26.0, 4.0), "humidite": (80.0, 10.0), "pluie": (0.2, 0.5)}
+
+
+def _flux(parcelles, debut: datetime, heures: int, pas: int):
+    for seconde in range(0, heures * 3600, pas):
+        instant = debut + timedelta(seconds=seconde)
+        cycle = math.sin(2 * math.pi * (seconde % 86400) / 86400)
+        for parcelle in parcelles:
+            for grandeur, (moyenne, amplitude) in GRANDEURS.items():
+                valeur = max(0.0, moyenne + amplitude * cycle + random.gauss(0, amplitude / 5))
+                yield Releve(parcelle, f"{grandeur[:4]}-{str(parcelle)[:8]}", grandeur, instant, round(valeur, 2))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de l'ingestion des relevés de capteurs")
+    parser.add_argument("--url", default="sqlite://", help="base de test (défaut : SQLite en mémoire)")
+    parser.add_argument("--parcelles", type=int, default=80)
+    parser.add_argument("--heures", type=int, default=6)
+    parser.add_argument("--pas", type=int, default=60, help="secondes entre deux relevés d'un capteur")
+    parser.add_argument("--lot", type=int, default=5000)
+    args = parser.parse_args()
+
+    # Base en mémoire : une seule connexion partagée, sinon chaque thread verrait une base vide
+    if args.url == "sqlite://":
+        engine = create_engine(args.url, poolclass=StaticPool, connect_args={"check_same_thread": False})
+    else:
+        engine = create_engine(args.url)
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    parcelles = [uuid.uuid4() for _ in range(args.parcelles)]
+    with engine.begin() as connexion:
+        connexion.execute(insert(Parcelle.__table__), [
+            {"id": p, "code": f"P{i:03d}", "culture_type": "PALMIER", "surface_hectares": 1,
+             "date_plantation": date(2015, 1, 1)}
+            for i, p in enumerate(parcelles)
+        ])
+
+    debut = time.perf_counter()
+    nombre = 0
+    with TamponMesures(engine, taille=args.lot, delai=3600) as tampon:
+        for releve in _flux(parcelles, datetime(2024, 6, 1), args.heures, args.pas):
+            tampon.ajouter(releve)
+            nombre += 1
+    duree = time.perf_counter() - debut
+    print(f"{nombre} relevés en {duree:.1f} s : {nombre / duree:,.0f} relevés/s")
+
+    m, a = MesureCapteur.__table__, AgregatMesure.__table__
+    with engine.connect() as connexion:
+        for granularite, longueur in ((HEURE, 13), (JOUR, 10)):
+            # Début de période recalculé depuis le texte de l'horodatage (AAAA-MM-JJ HH)
+            periode = func.substr(func.cast(m.c.horodatage, m.c.capteur.type), 1, longueur)
+            brut = {
+                (str(ligne.parcelle_id), ligne.grandeur, ligne.periode): (ligne.nombre, round(ligne.somme, 6))
+                for ligne in connexion.execute(
+                    select(m.c.parcelle_id, m.c.grandeur, periode.label("periode"),
+                           func.count().label("nombre"), func.sum(m.c.valeur).label("somme"))
+                    .group_by(m.c.parcelle_id, m.c.grandeur, periode)
+                )
+            }
+            tenus = {
+                (str(ligne.parcelle_id), ligne.grandeur, str(ligne.debut)[:longueur]): (ligne.nombre, round(ligne.somme, 6))
+                for ligne in connexion.execute(select(a).where(a.c.granularite == granularite))
+            }
+            print(f"agrégats {granularite} : {len(tenus)}, identiques au recalcul : {tenus == brut}")
+
+
+if __name__ == "__main__":
+    main()
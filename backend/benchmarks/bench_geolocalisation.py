@@ -0,0 +1,74 @@
+"""
+Benchmark de la géolocalisation en masse de relevés d'équipements.
+
+Génère une grille de N parcelles (polygones irréguliers) et K relevés GPS,
+puis compare l'index spatial (R-tree STR + test vectorisé) au parcours
+naïf de tous les polygones pour chaque point. Vérifie que les deux donnent
+le même résultat.
+
+Usage (depuis backend/) :
+    python -m benchmarks.bench_geolocalisation --parcelles 2000 --points 10000
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+import app_loader  # noqa: F401  assemble le paquet app avant tout import app
+from app.services.parcel_geometry import IndexSpatial, _aretes, lire_anneaux, points_dans_polygone
+
+ORIGINE = (9.70, 4.05)  # lon, lat
+PAS = 0.002  # environ 200 m
+
+
+def _parcelles(nombre: int):
+    cote = int(np.ceil(np.sqrt(nombre)))
+    geometries = []
+    for i in range(nombre):
+        x0, y0 = ORIGINE[0] + (i % cote) * PAS, ORIGINE[1] + (i // cote) * PAS
+        # Hexagone irrégulier inscrit dans la case
+        angles = np.sort(np.random.uniform(0, 2 * np.pi, 6))
+        rayons = np.random.uniform(0.3, 0.5, 6) * PAS
+        anneau = [[x0 + PAS / 2 + r * np.cos(a), y0 + PAS / 2 + r * np.sin(a)] for a, r in zip(angles, rayons)]
+        geometries.append({"type": "Polygon", "coordinates": [anneau + [anneau[0]]]})
+    return geometries, cote
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de la géolocalisation des relevés")
+    parser.add_argument("--parcelles", type=int, default=2000)
+    parser.add_argument("--points", type=int, default=10000)
+    args = parser.parse_args()
+
+    geometries, cote = _parcelles(args.parcelles)
+    aretes = [_aretes(lire_anneaux(geometrie)) for geometrie in geometries]
+    points = np.column_stack([
+        ORIGINE[0] + np.random.uniform(0, cote * PAS, args.points),
+        ORIGINE[1] + np.random.uniform(0, cote * PAS, args.points),
+    ])
+
+    debut = time.perf_counter()
+    index = IndexSpatial(list(range(args.parcelles)), aretes)
+    construction = time.perf_counter() - debut
+    debut = time.perf_counter()
+    resultat = index.localiser(points)
+    indexe = time.perf_counter() - debut
+
+    echantillon = random.sample(range(args.points), min(args.points, 500))
+    debut = time.perf_counter()
+    naif = {}
+    for i in echantillon:
+        naif[i] = next((p for p, a in enumerate(aretes) if points_dans_polygone(points[i:i + 1], a)[0]), None)
+    duree_naive = (time.perf_counter() - debut) / len(echantillon) * args.points
+
+    assert all(resultat[i] == naif[i] for i in echantillon), "résultats différents du parcours naïf"
+    print(f"{args.parcelles} parcelles, {args.points} points, "
+          f"{sum(r is not None for r in resultat)} localisés")
+    print(f"index : construction {construction * 1000:.0f} ms, requête {indexe * 1000:.0f} ms "
+          f"({args.points / indexe:,.0f} points/s)")
+    print(f"naïf (extrapolé) : {duree_naive:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark de pagination des récoltes : OFFSET vs curseur (keyset).
+
+Mesure la latence d'une page à différentes profondeurs. Avec OFFSET, le
+coût croît avec le numéro de page ; avec le curseur il reste constant.
+
+Usage (depuis backend/) :
+    python -m benchmarks.bench_pagination --lignes 200000 --limit 50
+    python -m benchmarks.bench_pagination --url postgresql://...  # base de test
+"""
+import argparse
+import random
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+import app_loader  # noqa: F401  assemble le paquet app avant tout import app
+from app.core.pagination import encoder_curseur, paginer
+from app.models import Parcelle, Recolte, metadata
+
+REPETITIONS = 20
+
+
+def _preparer(url: str, nb_lignes: int):
+    engine = create_engine(url)
+    metadata.drop_all(engine, tables=[Recolte.__table__, Parcelle.__table__])
+    metadata.create_all(engine, tables=[Parcelle.__table__, Recolte.__table__])
+    parcelle_id = uuid.uuid4()
+    origine = datetime(2018, 1, 1)
+    with engine.begin() as connexion:
+        connexion.execute(insert(Parcelle.__table__), [{
+            "id": parcelle_id, "code": "P-BENCH", "culture_type": "PALMIER",
+            "surface_hectares": Decimal("10"), "date_plantation": date(2010, 1, 1),
+        }])
+        for debut in range(0, nb_lignes, 10000):
+            connexion.execute(insert(Recolte.__table__), [
+                {
+                    "id": uuid.uuid4(),
+                    "parcelle_id": parcelle_id,
+                    "date_recolte": (origine + timedelta(minutes=i)).date(),
+                    "quantite_kg": Decimal(random.randint(100, 90000)) / 100,
+                    "qualite": "A",
+                    "created_at": origine + timedelta(minutes=i),
+                    "updated_at": origine + timedelta(minutes=i),
+                }
+                for i in range(debut, min(debut + 10000, nb_lignes))
+            ])
+    return engine
+
+
+def _chronometrer(fonction) -> float:
+    debut = time.perf_counter()
+    for _ in range(REPETITIONS):
+        fonction()
+    return (time.perf_counter() - debut) / REPETITIONS * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="sqlite://")
+    parser.add_argument("--lignes", type=int, default=200000)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+    engine = _preparer(args.url, args.lignes)
+    nb_pages = args.lignes // args.limit
+
+    print(f"{'page':>8} {'offset (ms)':>12} {'curseur (ms)':>13}")
+    with Session(engine) as session:
+        # Pages au-delà de la dernière ignorées (petits volumes)
+        for page in sorted({p for p in (1, 10, 100, nb_pages // 4, nb_pages // 2, nb_pages - 1) if 1 <= p < nb_pages}):
+            decalage = (page - 1) * args.limit
+            requete_offset = (
+                select(Recolte).order_by(Recolte.created_at, Recolte.id).offset(decalage).limit(args.limit)
+            )
+            curseur = None
+            if decalage:
+                precedente = session.execute(
+                    select(Recolte.created_at, Recolte.id)
+                    .order_by(Recolte.created_at, Recolte.id).offset(decalage - 1).limit(1)
+                ).one()
+                curseur = encoder_curseur("created_at", False, precedente.created_at, precedente.id)
+
+            duree_offset = _chronometrer(lambda: session.scalars(requete_offset).all())
+            duree_curseur = _chronometrer(lambda: paginer(session, Recolte, limit=args.limit, cursor=curseur))
+            session.expunge_all()
+            print(f"{page:>8} {duree_offset:>12.2f} {duree_curseur:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
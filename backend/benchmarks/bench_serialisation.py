@@ -0,0 +1,88 @@
+"""
+Benchmark de sérialisation des récoltes : lignes par seconde.
+
+Compare, sur une base SQLite en mémoire :
+- l'ancienne méthode (instances ORM + parcours de `__table__.columns`)
+- `Base.dict()` avec accesseur précalculé
+- le chemin Core (`serialiser_lignes`) sans instances ORM
+
+Usage (depuis backend/) :
+    python -m benchmarks.bench_serialisation --lignes 50000
+"""
+import argparse
+import json
+import random
+import time
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+import app_loader  # noqa: F401  assemble le paquet app avant tout import app
+from app.core.serialization import _convertir, dumps, serialiser_lignes
+from app.models import Parcelle, QualiteRecolte, Recolte, metadata
+
+
+def _preparer(nb_lignes: int):
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine)
+    parcelle_id = uuid.uuid4()
+    with engine.begin() as connexion:
+        connexion.execute(insert(Parcelle.__table__), [{
+            "id": parcelle_id, "code": "P-001", "culture_type": "PALMIER",
+            "surface_hectares": Decimal("5.00"), "date_plantation": date(2015, 1, 1),
+        }])
+        connexion.execute(insert(Recolte.__table__), [
+            {
+                "id": uuid.uuid4(),
+                "parcelle_id": parcelle_id,
+                "date_recolte": date(2020, 1, 1) + timedelta(days=i % 1500),
+                "quantite_kg": Decimal(random.randint(100, 90000)) / 100,
+                "qualite": random.choice(list(QualiteRecolte)),
+                "equipe_recolte": [str(uuid.uuid4())],
+                "conditions_meteo": {"pluie_mm": i % 30},
+            }
+            for i in range(nb_lignes)
+        ])
+    return engine
+
+
+def _ancienne_methode(instance) -> dict:
+    return {column.name: getattr(instance, column.name) for column in instance.__table__.columns}
+
+
+def _mesurer(nom: str, nb_lignes: int, fonction) -> None:
+    debut = time.perf_counter()
+    taille = len(fonction())
+    duree = time.perf_counter() - debut
+    print(f"{nom:<28} {nb_lignes / duree:12.0f} lignes/s  ({taille / 1024:.0f} Kio)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lignes", type=int, default=50000)
+    args = parser.parse_args()
+    engine = _preparer(args.lignes)
+
+    def ancienne():
+        with Session(engine) as session:
+            lignes = [_ancienne_methode(r) for r in session.scalars(select(Recolte))]
+            return json.dumps(lignes, default=_convertir).encode()
+
+    def accesseur():
+        with Session(engine) as session:
+            return dumps([r.dict() for r in session.scalars(select(Recolte))])
+
+    def core():
+        with engine.connect() as connexion:
+            return serialiser_lignes(connexion.execute(select(Recolte.__table__)))
+
+    _mesurer("ORM + __table__.columns", args.lignes, ancienne)
+    _mesurer("ORM + Base.dict()", args.lignes, accesseur)
+    _mesurer("Core + serialiser_lignes", args.lignes, core)
+
+
+if __name__ == "__main__":
+    main()
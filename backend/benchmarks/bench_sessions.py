@@ -0,0 +1,74 @@
+"""
+Benchmark du débit de requêtes : sessions synchrones vs asynchrones.
+
+Simule des requêtes API concurrentes qui exécutent chacune une requête SQL
+courte (pg_sleep pour représenter la latence d'E/S) :
+- chemin sync : pool de threads (comportement de FastAPI pour les dépendances `def`)
+- chemin async : tâches asyncio sur AsyncSessionLocal
+
+Usage (depuis backend/) :
+    python -m benchmarks.bench_sessions --requetes 2000 --concurrence 50
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text
+
+import app_loader  # noqa: F401  assemble le paquet app avant tout import app
+from app.core.database import AsyncSessionLocal, SessionLocal, async_engine, engine
+
+REQUETE = text("SELECT pg_sleep(:duree)")
+
+
+def _requete_sync(duree: float) -> None:
+    db = SessionLocal()
+    try:
+        db.execute(REQUETE, {"duree": duree})
+    finally:
+        db.close()
+
+
+def bench_sync(nb_requetes: int, concurrence: int, duree: float) -> float:
+    """Retourne le débit (requêtes/s) du chemin synchrone."""
+    debut = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrence) as executor:
+        list(executor.map(lambda _: _requete_sync(duree), range(nb_requetes)))
+    return nb_requetes / (time.perf_counter() - debut)
+
+
+async def bench_async(nb_requetes: int, concurrence: int, duree: float) -> float:
+    """Retourne le débit (requêtes/s) du chemin asynchrone."""
+    semaphore = asyncio.Semaphore(concurrence)
+
+    async def _requete() -> None:
+        async with semaphore:
+            async with AsyncSessionLocal() as db:
+                await db.execute(REQUETE, {"duree": duree})
+
+    debut = time.perf_counter()
+    await asyncio.gather(*(_requete() for _ in range(nb_requetes)))
+    debit = nb_requetes / (time.perf_counter() - debut)
+    await async_engine.dispose()
+    return debit
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requetes", type=int, default=2000)
+    parser.add_argument("--concurrence", type=int, default=50)
+    parser.add_argument("--duree", type=float, default=0.005, help="latence simulée (s)")
+    args = parser.parse_args()
+
+    debit_sync = bench_sync(args.requetes, args.concurrence, args.duree)
+    engine.dispose()
+    debit_async = asyncio.run(bench_async(args.requetes, args.concurrence, args.duree))
+
+    print(f"sync  : {debit_sync:10.1f} req/s")
+    print(f"async : {debit_async:10.1f} req/s")
+    print(f"ratio : {debit_async / debit_sync:10.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark des clés primaires uuid4 vs UUIDv7 sur PostgreSQL.
+
+Insère le même volume de lignes dans deux tables temporaires dont la clé
+primaire est générée par uuid4 ou par uuid7, puis compare le débit
+d'insertion (par tranche, pour voir la dégradation quand l'index grossit)
+et la taille finale de l'index de clé primaire.
+
+Usage (depuis backend/, base PostgreSQL de test) :
+    python -m benchmarks.bench_uuid_pk --lignes 10000000
+"""
+import argparse
+import time
+import uuid
+
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine, text
+from sqlalchemy.dialects.postgresql import UUID
+
+import app_loader  # noqa: F401  assemble le paquet app avant tout import app
+from app.core.config import settings
+from app.models.base import uuid7
+
+TAILLE_LOT = 10000
+
+
+def _bench(engine, nom: str, generer, nb_lignes: int, tranche: int) -> None:
+    metadata = MetaData()
+    table = Table(
+        nom, metadata,
+        Column("id", UUID(as_uuid=True), primary_key=True),
+        Column("valeur", Integer, nullable=False),
+    )
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+
+    debut_total = debut_tranche = time.perf_counter()
+    debut_de_tranche = 0  # lignes insérées au début de la tranche en cours
+    with engine.connect() as connexion:
+        for debut in range(0, nb_lignes, TAILLE_LOT):
+            lot = [{"id": generer(), "valeur": i} for i in range(debut, min(debut + TAILLE_LOT, nb_lignes))]
+            connexion.execute(table.insert(), lot)
+            connexion.commit()
+            fin = debut + len(lot)
+            if fin - debut_de_tranche >= tranche or fin == nb_lignes:
+                # La dernière tranche peut être incomplète : débit sur les lignes réellement insérées
+                maintenant = time.perf_counter()
+                print(f"  {nom}: {fin:>10} lignes  "
+                      f"{(fin - debut_de_tranche) / (maintenant - debut_tranche):10.0f} lignes/s")
+                debut_tranche, debut_de_tranche = maintenant, fin
+        duree = time.perf_counter() - debut_total
+        taille = connexion.execute(text(f"SELECT pg_relation_size('{nom}_pkey')")).scalar()
+    print(f"{nom}: {nb_lignes / duree:.0f} lignes/s en moyenne, index PK {taille / 1024 / 1024:.1f} Mio")
+    metadata.drop_all(engine)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lignes", type=int, default=10_000_000)
+    parser.add_argument("--tranche", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    engine = create_engine(settings.SQLALCHEMY_DATABASE_URL)
+    _bench(engine, "bench_pk_uuid4", uuid.uuid4, args.lignes, args.tranche)
+    _bench(engine, "bench_pk_uuid7", uuid7, args.lignes, args.tranche)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark de la valorisation des stocks au CMUP.
+
+Mesure :
+- le coût d'un mouvement courant (incrémental : une ligne lue, une écrite) ;
+- le coût d'un mouvement antidaté (rejeu du suffixe de son solde) ;
+- la revalorisation complète vectorisée de tous les soldes,
+et vérifie que le batch retrouve exactement les valeurs incrémentales.
+
+Usage (depuis backend/) :
+    python -m benchmarks.bench_valorisation --mouvements 100000 --produits 200
+    python -m benchmarks.bench_valorisation --url postgresql://...  # base de test
+"""
+import argparse
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import create_engine, insert
+
+import app_loader  # noqa: F401  assemble le paquet app avant tout import app
+from app.models import Entrepot, Produit, TypeMouvement, metadata
+from app.services.stock_ledger import poster_mouvements
+from app.services.stock_valuation import revaloriser
+
+TAILLE_LOT = 1000
+
+
+def _preparer(url: str, nb_produits: int, nb_entrepots: int):
+    engine = create_engine(url)
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    produits = [uuid.uuid4() for _ in range(nb_produits)]
+    entrepots = [uuid.uuid4() for _ in range(nb_entrepots)]
+    with engine.begin() as connexion:
+        connexion.execute(insert(Produit.__table__), [
+            {"id": p, "code": f"P{i}", "nom": f"Produit {i}", "categorie": "INTRANT", "unite_mesure": "KG"}
+            for i, p in enumerate(produits)
+        ])
+        connexion.execute(insert(Entrepot.__table__), [
+            {"id": e, "code": f"E{i}", "nom": f"Entrepôt {i}"} for i, e in enumerate(entrepots)
+        ])
+    return engine, produits, entrepots
+
+
+def _mouvement(produits, entrepots, date: datetime) -> dict:
+    produit = random.choice(produits)
+    source, destination = random.sample(entrepots, 2)
+    type_mouvement = random.choices(
+        (TypeMouvement.ENTREE, TypeMouvement.SORTIE, TypeMouvement.TRANSFERT, TypeMouvement.PERTE),
+        weights=(5, 3, 1, 1),
+    )[0]
+    return {
+        "produit_id": produit,
+        "type_mouvement": type_mouvement,
+        "quantite": Decimal(random.randint(1, 5000)) / 10,
+        "date_mouvement": date,
+        "entrepot_source_id": None if type_mouvement is TypeMouvement.ENTREE else source,
+        "entrepot_destination_id": destination if type_mouvement in (TypeMouvement.ENTREE, TypeMouvement.TRANSFERT) else None,
+        "cout_unitaire": Decimal(random.randint(100, 100000)) / 100 if type_mouvement is TypeMouvement.ENTREE else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="sqlite://")
+    parser.add_argument("--mouvements", type=int, default=20000)
+    parser.add_argument("--produits", type=int, default=200)
+    parser.add_argument("--entrepots", type=int, default=4)
+    args = parser.parse_args()
+    engine, produits, entrepots = _preparer(args.url, args.produits, args.entrepots)
+    origine = datetime(2024, 1, 1)
+
+    debut = time.perf_counter()
+    with engine.begin() as connexion:
+        for lot in range(0, args.mouvements, TAILLE_LOT):
+            poster_mouvements(connexion, [
+                _mouvement(produits, entrepots, origine + timedelta(minutes=i))
+                for i in range(lot, min(lot + TAILLE_LOT, args.mouvements))
+            ])
+    duree = time.perf_counter() - debut
+    print(f"incrémental    : {args.mouvements} mouvements en {duree:.2f} s "
+          f"({duree / args.mouvements * 1e6:.0f} µs/mouvement)")
+
+    debut = time.perf_counter()
+    with engine.begin() as connexion:
+        for _ in range(20):
+            date = origine + timedelta(minutes=random.randint(0, args.mouvements // 2))
+            poster_mouvements(connexion, [_mouvement(produits, entrepots, date)])
+    print(f"antidaté       : {(time.perf_counter() - debut) / 20 * 1000:.1f} ms/mouvement")
+
+    with engine.begin() as connexion:
+        rapport = revaloriser(connexion)
+    print(f"revalorisation : {rapport.lignes} lignes, {rapport.soldes} soldes en {rapport.duree:.2f} s, "
+          f"{rapport.lignes_modifiees} lignes différentes de l'incrémental")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Fixtures communes : base SQLite en mémoire portant tout le schéma, avec les
+écouteurs de session de tous les services (app.core.startup.SERVICES).
+
+Les modèles sont répartis entre backend/app/models et
+fofal_erp_2024/backend/app/models (où se trouve le registre
+`app.models/__init__.py`) : le paquet est assemblé sur les deux
+répertoires par app_loader, comme dans l'arborescence déployée.
+"""
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+# Assemblage partagé avec les benchmarks (backend/app_loader.py)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import app_loader  # noqa: E402,F401
+
+from app.core.startup import SERVICES  # noqa: E402
+from app.models import metadata  # noqa: E402
+
+for _service in SERVICES:
+    importlib.import_module(_service)
+
+
+@pytest.fixture
+def engine():
+    moteur = create_engine("sqlite://")
+    metadata.create_all(moteur)
+    yield moteur
+    moteur.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    with Session(engine) as s:
+        yield s
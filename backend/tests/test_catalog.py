@@ -0,0 +1,74 @@
+from decimal import Decimal
+
+from app.models import Entrepot, MouvementStock, Produit, TypeMouvement
+from app.services import catalog
+from app.services.stock_alerts import alertes_actives, verifier_seuils
+
+
+def test_cle_id_en_chaine_ou_uuid(session):
+    produit = Produit(code="ENG-01", nom="Engrais", categorie="INTRANT", unite_mesure="KG")
+    session.add(produit)
+    session.commit()
+    connexion = session.connection()
+    assert catalog.produit_par_id(connexion, produit.id).code == "ENG-01"
+    assert catalog.produit_par_id(connexion, str(produit.id)).code == "ENG-01"
+    assert catalog.produit_par_id(connexion, "pas-un-uuid") is None
+    assert set(catalog.produits_par_ids(connexion, [str(produit.id)])) == {produit.id}
+
+
+def test_seuils_lus_par_le_catalogue(session):
+    produit = Produit(code="ENG-02", nom="Engrais", categorie="INTRANT", unite_mesure="KG",
+                      seuil_alerte=Decimal(5))
+    entrepot = Entrepot(nom="Magasin", code="MAG")
+    session.add_all([produit, entrepot])
+    session.flush()
+    session.add(MouvementStock(produit_id=produit.id, type_mouvement=TypeMouvement.ENTREE,
+                               quantite=Decimal(3), entrepot_destination_id=entrepot.id))
+    session.commit()
+    connexion = session.connection()
+    verifier_seuils(connexion, [(produit.id, entrepot.id)])
+    assert [alerte.produit_id for alerte in alertes_actives(connexion)] == [produit.id]
+
+
+def test_lignes_non_validees_jamais_en_cache(session):
+    produit = Produit(code="ENG-10", nom="VALIDE", categorie="INTRANT", unite_mesure="KG")
+    session.add(produit)
+    session.commit()
+    connexion = session.connection()
+    assert catalog.produit_par_code(connexion, "ENG-10").nom == "VALIDE"
+
+    produit.nom = "NON VALIDE"
+    session.add(Produit(code="ENG-11", nom="NON VALIDE", categorie="INTRANT", unite_mesure="KG"))
+    session.flush()
+    connexion = session.connection()
+    # La transaction voit ses propres écritures...
+    assert catalog.produit_par_code(connexion, "ENG-10").nom == "NON VALIDE"
+    assert catalog.produit_par_code(connexion, "ENG-11").nom == "NON VALIDE"
+    # ... sans qu'elles entrent dans le cache du processus
+    assert all(valeur[1].nom != "NON VALIDE" for valeur in catalog.caches["produits"]._entrees.values())
+
+    session.rollback()
+    connexion = session.connection()
+    assert catalog.produit_par_code(connexion, "ENG-10").nom == "VALIDE"
+    assert catalog.produit_par_code(connexion, "ENG-11") is None
+
+
+def test_seuil_releve_dans_la_transaction(session):
+    produit = Produit(code="ENG-12", nom="Engrais", categorie="INTRANT", unite_mesure="KG",
+                      seuil_alerte=Decimal(5))
+    entrepot = Entrepot(nom="Magasin", code="MAG")
+    session.add_all([produit, entrepot])
+    session.flush()
+    session.add(MouvementStock(produit_id=produit.id, type_mouvement=TypeMouvement.ENTREE,
+                               quantite=Decimal(10), entrepot_destination_id=entrepot.id))
+    session.commit()
+    # Seuil mis en cache par une lecture validée
+    assert catalog.produit_par_id(session.connection(), produit.id).seuil_alerte == Decimal(5)
+
+    produit.seuil_alerte = Decimal(100)
+    session.add(MouvementStock(produit_id=produit.id, type_mouvement=TypeMouvement.SORTIE,
+                               quantite=Decimal(1), entrepot_source_id=entrepot.id))
+    session.flush()
+    connexion = session.connection()
+    verifier_seuils(connexion, [(produit.id, entrepot.id)])
+    assert [alerte.seuil for alerte in alertes_actives(connexion)] == [Decimal(100)]
@@ -0,0 +1,61 @@
+import itertools
+
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.pool import StaticPool
+
+from app.core import database
+from app.core.database import RoutingSession
+from app.models import Produit, metadata
+
+
+def _base(code):
+    moteur = create_engine("sqlite://", poolclass=StaticPool)
+    metadata.create_all(moteur)
+    with moteur.begin() as connexion:
+        connexion.execute(Produit.__table__.insert().values(
+            code=code, nom=code, categorie="INTRANT", unite_mesure="KG"))
+    return moteur
+
+
+@pytest.fixture
+def moteurs(monkeypatch):
+    # Réplica de substitution : une base SQLite distincte du primaire
+    primaire, replica = _base("PRIMAIRE"), _base("REPLICA")
+    monkeypatch.setattr(database, "engine", primaire)
+    monkeypatch.setattr(database, "replica_engines", [replica])
+    monkeypatch.setattr(database, "_tourniquet_replicas", itertools.cycle([0]))
+    database.replica_lag.set(0.0, replica=database._nom_replica(0))
+    yield primaire, replica
+    primaire.dispose()
+    replica.dispose()
+
+
+def _codes(session):
+    return session.execute(select(Produit.code).order_by(Produit.code)).scalars().all()
+
+
+def test_lectures_sur_la_replica(moteurs):
+    with RoutingSession(info={"lecture_seule": True}) as session:
+        assert _codes(session) == ["REPLICA"]
+    # Session ordinaire : tout au primaire
+    with RoutingSession() as session:
+        assert _codes(session) == ["PRIMAIRE"]
+
+
+def test_lecture_apres_flush_sur_le_primaire(moteurs):
+    with RoutingSession(info={"lecture_seule": True}) as session:
+        assert _codes(session) == ["REPLICA"]
+        session.add(Produit(code="NOUVEAU", nom="Nouveau", categorie="INTRANT", unite_mesure="KG"))
+        session.flush()
+        assert _codes(session) == ["NOUVEAU", "PRIMAIRE"]
+
+
+def test_sql_brut_considere_comme_ecriture(moteurs):
+    primaire, _ = moteurs
+    with RoutingSession(info={"lecture_seule": True}) as session:
+        session.execute(text("UPDATE produits SET code = 'MODIFIE'"))
+        assert _codes(session) == ["MODIFIE"]
+        session.commit()
+    with primaire.connect() as connexion:
+        assert connexion.execute(text("SELECT code FROM produits")).scalars().all() == ["MODIFIE"]
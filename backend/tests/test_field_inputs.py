@@ -0,0 +1,91 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import select
+
+from app.models import (ActiviteCulturale, CultureType, CycleCulture, Entrepot, MouvementStock, Parcelle,
+                        Produit, TypeActivite, TypeMouvement)
+from app.services.field_inputs import REJETEE, SANS_INTRANT, SORTIE, sortir_intrants
+from app.services.stock_ledger import poster_mouvements, solde
+
+JOUR = date(2024, 6, 3)
+
+
+def _preparer(session):
+    parcelle = Parcelle(code="P-1", culture_type=CultureType.CACAO, surface_hectares=Decimal(5),
+                        date_plantation=date(2018, 1, 1))
+    engrais = Produit(code="ENG-01", nom="Engrais", categorie="INTRANT", unite_mesure="KG")
+    fongicide = Produit(code="12", nom="Fongicide", categorie="INTRANT", unite_mesure="LITRE")
+    magasin = Entrepot(nom="Magasin", code="MAG")
+    session.add_all([parcelle, engrais, fongicide, magasin])
+    session.flush()
+    cycle = CycleCulture(parcelle_id=parcelle.id, date_debut=date(2024, 1, 1))
+    session.add(cycle)
+    session.flush()
+    connexion = session.connection()
+    poster_mouvements(connexion, [
+        {"produit_id": engrais.id, "type_mouvement": TypeMouvement.ENTREE, "quantite": Decimal(10),
+         "entrepot_destination_id": magasin.id, "date_mouvement": datetime(2024, 5, 1)},
+        {"produit_id": fongicide.id, "type_mouvement": TypeMouvement.ENTREE, "quantite": Decimal(5),
+         "entrepot_destination_id": magasin.id, "date_mouvement": datetime(2024, 5, 1)},
+    ])
+    return cycle, engrais, fongicide, magasin
+
+
+def _activite(session, cycle, produits, jour=JOUR):
+    activite = ActiviteCulturale(cycle_id=cycle.id, type_activite=TypeActivite.FERTILISATION,
+                                 date_realisation=jour, produits_utilises=produits)
+    session.add(activite)
+    session.flush()
+    return activite
+
+
+def test_sortie_du_jour(session):
+    cycle, engrais, fongicide, magasin = _preparer(session)
+    acceptee = _activite(session, cycle, [{"produit": "ENG-01", "quantite": 6, "entrepot_code": "MAG"},
+                                          {"produit_code": 12, "quantite": "1.5"}])
+    # Le stock restant (4) ne suffit plus : rejet sans rien sortir
+    insuffisante = _activite(session, cycle, [{"produit_id": str(engrais.id), "quantite": 5}])
+    inconnue = _activite(session, cycle, [{"produit_code": "INCONNU", "quantite": 1}])
+    invalide = _activite(session, cycle, [{"produit_code": "ENG-01", "quantite": "beaucoup"},
+                                          {"produit_code": "ENG-01", "quantite": -2}])
+    sans_intrant = _activite(session, cycle, [])
+    autre_jour = _activite(session, cycle, [{"produit_code": "ENG-01", "quantite": 1}], jour=date(2024, 6, 4))
+
+    rapport = sortir_intrants(session.connection(), JOUR, entrepot_defaut="MAG")
+    statuts = {resultat.activite_id: resultat for resultat in rapport.resultats}
+    assert statuts[acceptee.id].statut == SORTIE and statuts[acceptee.id].mouvements == 2
+    assert statuts[insuffisante.id].statut == REJETEE
+    assert "stock insuffisant" in statuts[insuffisante.id].erreurs[0]
+    assert statuts[inconnue.id].erreurs == ["ligne 1 : produit inconnu"]
+    assert statuts[invalide.id].erreurs == ["ligne 1 : quantité invalide", "ligne 2 : quantité invalide"]
+    assert statuts[sans_intrant.id].statut == SANS_INTRANT
+    assert autre_jour.id not in statuts
+    assert (rapport.activites, rapport.sorties, rapport.rejetees, rapport.mouvements) == (5, 1, 3, 2)
+
+    connexion = session.connection()
+    assert solde(connexion, engrais.id, magasin.id) == Decimal(4)
+    assert solde(connexion, fongicide.id, magasin.id) == Decimal("3.5")
+    m = MouvementStock.__table__
+    dates = connexion.execute(
+        select(m.c.date_mouvement).where(m.c.reference_document == f"ACT-{acceptee.id}")
+    ).scalars().all()
+    assert dates == [datetime.combine(JOUR, datetime.max.time())] * 2
+
+    a = ActiviteCulturale.__table__
+    sorties = dict(connexion.execute(select(a.c.id, a.c.intrants_sortis_le)).all())
+    assert sorties[acceptee.id] is not None and sorties[sans_intrant.id] is not None
+    assert sorties[insuffisante.id] is None and sorties[inconnue.id] is None
+
+    # Deuxième passage : rien n'est sorti deux fois
+    rapport = sortir_intrants(connexion, JOUR, entrepot_defaut="MAG")
+    assert (rapport.activites, rapport.sorties, rapport.mouvements) == (3, 0, 0)
+    assert solde(connexion, engrais.id, magasin.id) == Decimal(4)
+
+
+def test_simulation_n_ecrit_rien(session):
+    cycle, engrais, _, magasin = _preparer(session)
+    _activite(session, cycle, [{"produit_code": "ENG-01", "quantite": 2}])
+    rapport = sortir_intrants(session.connection(), JOUR, entrepot_defaut="MAG", simulation=True)
+    assert rapport.sorties == 1
+    assert solde(session.connection(), engrais.id, magasin.id) == Decimal(10)
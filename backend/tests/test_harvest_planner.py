@@ -0,0 +1,82 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+import numpy as np
+from sqlalchemy import func, select
+
+from app.models import CultureType, Parcelle, ParcelleStatus, TourneeRecolte
+from app.services.harvest_planner import REPLANIFICATION_MANUELLE, calculer_tournees, replanifier_session
+
+EPOQUE = date(1970, 1, 1)
+
+
+def _tournees(session):
+    return session.connection().execute(select(func.count()).select_from(TourneeRecolte.__table__)).scalar()
+
+
+def _parcelle(code):
+    return Parcelle(code=code, culture_type=CultureType.PALMIER, surface_hectares=Decimal(10),
+                    date_plantation=date(2015, 1, 1), statut=ParcelleStatus.ACTIVE)
+
+
+def test_replanification_au_commit_et_non_au_flush(session):
+    session.add(_parcelle("P-1"))
+    session.flush()
+    assert _tournees(session) == 0
+    session.commit()
+    assert _tournees(session) > 0
+
+
+def test_replanification_manuelle(session):
+    session.info[REPLANIFICATION_MANUELLE] = True
+    session.add(_parcelle("P-2"))
+    session.commit()
+    assert _tournees(session) == 0
+    session.add(_parcelle("P-3"))
+    rapport = replanifier_session(session)
+    # Les parcelles notées avant le commit précédent sont toujours en attente
+    assert rapport.parcelles == 2 and _tournees(session) > 0
+
+
+def _tournees_en_boucle(parcelles, debut, fin):
+    """Référence : tournée par tournée, depuis l'entrée en production."""
+    tournees = []
+    for indice, (plantation, surface, cycle, plants_par_ha, maturite, duree_vie, rendement) in enumerate(parcelles):
+        production = EPOQUE + timedelta(days=plantation + maturite)
+        plants = round(surface * plants_par_ha)
+        quantite = round(plants * rendement * cycle / 365.0 * 100) / 100
+        numero, jour = 1, production
+        # Fin de vie exclue, comme la fin de la fenêtre
+        while jour < fin and jour < production + timedelta(days=duree_vie):
+            if jour >= debut:
+                tournees.append((indice, numero, (jour - EPOQUE).days, plants, quantite))
+            numero, jour = numero + 1, jour + timedelta(days=cycle)
+    return tournees
+
+
+def test_calculer_tournees_egal_boucle():
+    debut, fin = date(2024, 1, 1), date(2025, 1, 1)
+    d0, d1 = (debut - EPOQUE).days, (fin - EPOQUE).days
+    alea = random.Random(3)
+    parcelles = [
+        # Bornes exactes : entrée en production au début de la fenêtre, fin de vie à sa fin
+        (d0 - 100, 10.0, 14, 143, 100, 500, 150.0),
+        (d0 - 1000, 4.5, 10, 1111, 0, d1 - d0 + 1000, 2.0),
+        # Fin de vie au début de la fenêtre, pas encore en production, plus du tout
+        (d0 - 2000, 7.0, 21, 143, 500, 1500, 150.0),
+        (d1 - 10, 3.0, 14, 143, 1095, 9000, 150.0),
+        (d0 - 9000, 3.0, 14, 143, 1095, 4000, 150.0),
+    ]
+    for _ in range(300):
+        parcelles.append((
+            d0 + alea.randint(-4000, 400), round(alea.uniform(0.5, 40), 2), alea.randint(7, 30),
+            alea.choice([143, 1111, 400]), alea.randint(0, 1500), alea.randint(30, 4000), alea.uniform(0.5, 200),
+        ))
+    colonnes = [np.array(colonne) for colonne in zip(*parcelles)]
+    calcul = calculer_tournees(*colonnes, debut=debut, fin=fin)
+
+    obtenu = list(zip(*(calcul[nom].tolist() for nom in ("parcelle", "numero", "jour", "plants", "quantite"))))
+    assert obtenu == _tournees_en_boucle(parcelles, debut, fin)
+    planifiees = {parcelle for parcelle, *_ in obtenu}
+    assert {0, 1} <= planifiees and not {2, 3, 4} & planifiees
@@ -0,0 +1,52 @@
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import select
+
+from app.models import AgregatRecolte, CultureType, Parcelle, QualiteRecolte, Recolte
+from app.services.harvest_rollups import reconstruire
+
+
+def _agregats(session):
+    t = AgregatRecolte.__table__
+    lignes = session.connection().execute(
+        select(t.c.granularite, t.c.periode, t.c.parcelle_id, t.c.qualite, t.c.quantite_kg, t.c.nombre_recoltes)
+    ).all()
+    return sorted(map(tuple, lignes), key=str)
+
+
+def _parcelle(session, code):
+    parcelle = Parcelle(code=code, culture_type=CultureType.PALMIER, surface_hectares=Decimal(10),
+                        date_plantation=date(2015, 1, 1))
+    session.add(parcelle)
+    session.flush()
+    return parcelle
+
+
+def test_recolte_corrigee_apres_commit_puis_supprimee(session):
+    nord, sud = _parcelle(session, "P-N"), _parcelle(session, "P-S")
+    session.add(Recolte(parcelle_id=nord.id, date_recolte=date(2024, 3, 4), quantite_kg=Decimal(500),
+                        qualite=QualiteRecolte.A))
+    corrigee = Recolte(parcelle_id=nord.id, date_recolte=date(2024, 3, 5), quantite_kg=Decimal(200),
+                       qualite=QualiteRecolte.B)
+    session.add(corrigee)
+    session.commit()
+
+    # Instance expirée par le commit : correction sans lecture préalable
+    corrigee.parcelle_id = sud.id
+    corrigee.date_recolte = date(2024, 4, 1)
+    corrigee.quantite_kg = Decimal(250)
+    corrigee.qualite = QualiteRecolte.A
+    session.commit()
+    incremental = _agregats(session)
+    reconstruire(session.connection())
+    assert incremental == _agregats(session)
+    assert (("mois", date(2024, 3, 1), nord.id, QualiteRecolte.A, Decimal(500), 1) in incremental)
+    assert (("mois", date(2024, 4, 1), sud.id, QualiteRecolte.A, Decimal(250), 1) in incremental)
+
+    session.delete(corrigee)
+    session.commit()
+    incremental = _agregats(session)
+    reconstruire(session.connection())
+    assert incremental == _agregats(session)
+    assert all(ligne[2] == nord.id for ligne in incremental)
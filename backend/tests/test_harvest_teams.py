@@ -0,0 +1,100 @@
+import uuid
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import delete, select, text
+
+from app.models import (CultureType, DepartementType, Employe, MembreEquipeRecolte, Parcelle, QualiteRecolte,
+                        Recolte, TypeContrat)
+from app.services.harvest_teams import production_par_employe, reconstruire, recoltes_employe
+
+JUIN = (date(2024, 6, 1), date(2024, 6, 30))
+
+
+def _employe(session, matricule, **options):
+    employe = Employe(**options, matricule=matricule, nom=matricule, prenom="Test", date_naissance=date(1990, 1, 1),
+                      departement=DepartementType.PRODUCTION, poste="Cueilleur", date_embauche=date(2023, 1, 1),
+                      type_contrat=TypeContrat.CDI, salaire_base=Decimal(100000))
+    session.add(employe)
+    session.flush()
+    return employe
+
+
+def _parcelle(session):
+    parcelle = Parcelle(code="P-1", culture_type=CultureType.PALMIER, surface_hectares=Decimal(5),
+                        date_plantation=date(2015, 1, 1))
+    session.add(parcelle)
+    session.flush()
+    return parcelle
+
+
+def _index(session):
+    m = MembreEquipeRecolte.__table__
+    return sorted(
+        session.connection().execute(select(m.c.recolte_id, m.c.employe_id, m.c.date_recolte, m.c.taille_equipe)),
+        key=lambda ligne: (str(ligne.recolte_id), str(ligne.employe_id)),
+    )
+
+
+def test_index_suit_les_recoltes(session):
+    a, b, c = (_employe(session, matricule) for matricule in ("C-A", "C-B", "C-C"))
+    parcelle = _parcelle(session)
+    inconnu = uuid.uuid4()
+    recolte = Recolte(parcelle_id=parcelle.id, date_recolte=date(2024, 6, 3), quantite_kg=Decimal(800),
+                      qualite=QualiteRecolte.A, equipe_recolte=[str(a.id), str(b.id), str(inconnu), "invalide",
+                                                                str(a.id)])
+    autre = Recolte(parcelle_id=parcelle.id, date_recolte=date(2024, 6, 10), quantite_kg=Decimal(300),
+                    qualite=QualiteRecolte.B, equipe_recolte=[str(b.id), str(c.id)])
+    session.add_all([recolte, autre])
+    session.flush()
+
+    # L'inconnu compte dans l'équipe déclarée (3) sans recevoir de ligne
+    parts = recoltes_employe(session.connection(), a.id, *JUIN)
+    assert [(ligne.id, ligne.taille_equipe) for ligne in parts] == [(recolte.id, 3)]
+    assert float(parts[0].part_kg) == pytest.approx(800 / 3, abs=0.01)
+    production = {ligne.employe_id: ligne for ligne in production_par_employe(session.connection(), *JUIN)}
+    assert production[b.id].recoltes == 2
+    assert production[b.id].quantite_kg == Decimal(1100)
+    assert float(production[b.id].part_kg) == pytest.approx(800 / 3 + 150, abs=0.01)
+
+    # Équipe réaffectée et date corrigée
+    recolte.equipe_recolte = [str(c.id)]
+    recolte.date_recolte = date(2024, 7, 1)
+    session.flush()
+    assert recoltes_employe(session.connection(), a.id, *JUIN) == []
+    assert [ligne.date_recolte for ligne in recoltes_employe(session.connection(), c.id, date(2024, 7, 1),
+                                                             date(2024, 7, 1))] == [date(2024, 7, 1)]
+    incremental = _index(session)
+    assert reconstruire(session.connection()) == 3
+    assert _index(session) == incremental
+
+    session.delete(autre)
+    session.flush()
+    assert [ligne.recolte_id for ligne in _index(session)] == [recolte.id]
+
+
+def test_employe_enregistre_apres_la_recolte(session):
+    parcelle = _parcelle(session)
+    identifiant = uuid.uuid4()
+    session.add(Recolte(parcelle_id=parcelle.id, date_recolte=date(2024, 6, 3), quantite_kg=Decimal(600),
+                        qualite=QualiteRecolte.A, equipe_recolte=[str(identifiant)]))
+    session.flush()
+    assert _index(session) == []
+
+    _employe(session, "C-TARDIF", id=identifiant)
+    # Indexé au prochain reconstruire()
+    assert reconstruire(session.connection()) == 1
+    assert [ligne.taille_equipe for ligne in recoltes_employe(session.connection(), identifiant, *JUIN)] == [1]
+
+
+def test_suppression_employe_en_cascade(session):
+    session.connection().execute(text("PRAGMA foreign_keys = ON"))
+    employe = _employe(session, "C-PARTI")
+    parcelle = _parcelle(session)
+    session.add(Recolte(parcelle_id=parcelle.id, date_recolte=date(2024, 6, 3), quantite_kg=Decimal(600),
+                        qualite=QualiteRecolte.A, equipe_recolte=[str(employe.id)]))
+    session.flush()
+    assert len(_index(session)) == 1
+    session.execute(delete(Employe).where(Employe.id == employe.id))
+    assert _index(session) == []
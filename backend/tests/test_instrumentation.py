@@ -0,0 +1,115 @@
+import asyncio
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import selectinload
+
+from app.core import instrumentation
+from app.core.config import settings
+from app.models import CultureType, Parcelle, QualiteRecolte, Recolte
+
+
+def test_requete_en_erreur_ne_laisse_rien_sur_la_connexion(monkeypatch):
+    instrumentation.installer()
+    durees = []
+    monkeypatch.setattr(instrumentation.duree_requetes, "observe", lambda duree, **labels: durees.append(duree))
+    moteur = create_engine("sqlite://")
+    with moteur.connect() as connexion:
+        connexion.execute(text("SELECT 1"))
+        avant = {cle: list(valeur) if isinstance(valeur, list) else valeur for cle, valeur in connexion.info.items()}
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                connexion.execute(text("SELECT * FROM table_absente"))
+        assert connexion.info == avant
+        connexion.execute(text("SELECT 1"))
+    assert len(durees) == 2
+
+
+def _parcelles_avec_recoltes(session, nombre=4):
+    parcelles = [Parcelle(code=f"P-{i}", culture_type=CultureType.CACAO, surface_hectares=Decimal(1),
+                          date_plantation=date(2020, 1, 1)) for i in range(nombre)]
+    session.add_all(parcelles)
+    session.flush()
+    session.add_all(Recolte(parcelle_id=parcelle.id, date_recolte=date(2024, 1, 1), quantite_kg=Decimal(10),
+                            qualite=QualiteRecolte.A) for parcelle in parcelles)
+    session.commit()
+    session.expunge_all()
+
+
+def test_detection_n_plus_un(session, monkeypatch):
+    instrumentation.installer()
+    monkeypatch.setattr(settings, "DB_QUERY_STRICT", False)
+    _parcelles_avec_recoltes(session)
+    relation = str(Parcelle.recoltes.property)
+    avant = instrumentation.n_plus_un_total.valeur(endpoint="GET /parcelles", relation=relation)
+    with instrumentation.suivi_requetes("GET /parcelles") as suivi:
+        for parcelle in session.execute(select(Parcelle)).scalars():
+            assert len(parcelle.recoltes) == 1
+    assert suivi.n_plus_un == [relation]
+    assert suivi.nb_requetes == 5
+    assert instrumentation.n_plus_un_total.valeur(endpoint="GET /parcelles", relation=relation) == avant + 1
+
+    # Chargement groupé : plus de N+1
+    session.expunge_all()
+    with instrumentation.suivi_requetes("GET /parcelles") as suivi:
+        for parcelle in session.execute(select(Parcelle).options(selectinload(Parcelle.recoltes))).scalars():
+            assert len(parcelle.recoltes) == 1
+    assert suivi.n_plus_un == [] and suivi.nb_requetes == 2
+
+
+def test_mode_strict(session, monkeypatch):
+    instrumentation.installer()
+    monkeypatch.setattr(settings, "DB_QUERY_STRICT", True)
+    _parcelles_avec_recoltes(session)
+    with pytest.raises(instrumentation.ChargementNPlusUn):
+        with instrumentation.suivi_requetes("GET /parcelles"):
+            for parcelle in session.execute(select(Parcelle)).scalars():
+                parcelle.recoltes
+    session.rollback()
+
+    with instrumentation.suivi_requetes("GET /parcelles/{id}", budget=2) as suivi:
+        session.execute(text("SELECT 1"))
+        session.execute(text("SELECT 2"))
+        with pytest.raises(instrumentation.BudgetRequetesDepasse):
+            session.execute(text("SELECT 3"))
+    assert suivi.nb_requetes == 3
+
+
+def _appeler(application, chemin):
+    async def recevoir():
+        return {"type": "http.request", "body": b""}
+
+    async def envoyer(message):
+        pass
+
+    scope = {"type": "http", "method": "GET", "path": chemin}
+    asyncio.run(instrumentation.InstrumentationSQLMiddleware(application)(scope, recevoir, envoyer))
+
+
+def test_export_metrics_par_gabarit_de_route():
+    instrumentation.installer()
+    moteur = create_engine("sqlite://")
+
+    async def application(scope, receive, send):
+        with moteur.connect() as connexion:
+            connexion.execute(text("SELECT 1"))
+        if scope["path"].startswith("/employes/"):
+            scope["route"] = SimpleNamespace(path="/employes/{id}")
+
+    _appeler(application, "/employes/42")
+    _appeler(application, "/employes/43")
+    _appeler(application, "/inconnu/123")
+    _appeler(application, "/inconnu/456")
+
+    assert instrumentation.requetes_par_appel.valeur(endpoint="GET /employes/{id}") >= 2
+    assert instrumentation.requetes_par_appel.valeur(endpoint="GET <non routé>") >= 2
+    texte = instrumentation.exporter_prometheus()
+    assert "# TYPE fofal_db_requetes_par_appel histogram" in texte
+    assert 'fofal_db_requetes_par_appel_bucket{endpoint="GET /employes/{id}",le="1"}' in texte
+    assert 'fofal_db_requete_duree_secondes_count{requete="SELECT ?"}' in texte
+    # Les URL brutes ne créent pas de séries
+    assert "/employes/42" not in texte and "/inconnu/" not in texte
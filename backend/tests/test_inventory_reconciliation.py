@@ -0,0 +1,95 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import func, select
+
+from app.models import Entrepot, Inventaire, LigneInventaire, MouvementStock, Produit, Stock, TypeMouvement
+from app.services.inventory_reconciliation import (STATUT_TERMINE, STATUT_VALIDE, InventaireDejaValide,
+                                                   flux_ecarts, rapprocher)
+from app.services.stock_ledger import poster_mouvements, solde
+
+
+def _entree(produit, entrepot, quantite, lot=None):
+    return {"produit_id": produit.id, "type_mouvement": TypeMouvement.ENTREE, "quantite": Decimal(quantite),
+            "entrepot_destination_id": entrepot.id, "lot": lot, "date_mouvement": datetime(2024, 5, 1)}
+
+
+def _preparer(session):
+    produits = {code: Produit(code=code, nom=code, categorie="INTRANT", unite_mesure="KG")
+                for code in ("A", "B", "C", "D", "E")}
+    magasin, annexe = Entrepot(nom="Magasin", code="MAG"), Entrepot(nom="Annexe", code="ANX")
+    session.add_all([*produits.values(), magasin, annexe])
+    session.flush()
+    a, b, c, d, e = produits.values()
+    poster_mouvements(session.connection(), [
+        _entree(a, magasin, 10), _entree(a, magasin, 5, lot="L1"), _entree(b, magasin, 4),
+        _entree(c, magasin, 7), _entree(e, annexe, 9),
+    ])
+    inventaire = Inventaire(date_inventaire=datetime(2024, 6, 1), entrepot_id=magasin.id, statut="En cours")
+    session.add(inventaire)
+    session.flush()
+    comptages = {"A": 12, "B": 6, "C": None, "D": 0, "E": 1}
+    session.add_all(
+        LigneInventaire(inventaire_id=inventaire.id, produit_id=produits[code].id,
+                        quantite_physique=None if quantite is None else Decimal(quantite))
+        for code, quantite in comptages.items()
+    )
+    session.flush()
+    return inventaire, produits, magasin
+
+
+def _stock_magasin(connexion, produit, magasin):
+    s = Stock.__table__
+    return connexion.execute(
+        select(func.coalesce(func.sum(s.c.quantite), 0)).where(s.c.produit_id == produit.id,
+                                                               s.c.entrepot_id == magasin.id)
+    ).scalar()
+
+
+def test_ajustements_ramenent_le_stock_au_comptage(session):
+    inventaire, produits, magasin = _preparer(session)
+    connexion = session.connection()
+    rapport = rapprocher(connexion, inventaire.id)
+
+    assert (rapport.lignes, rapport.lignes_comptees, rapport.ecarts, rapport.ajustements) == (5, 4, 3, 3)
+    assert (rapport.surplus, rapport.manquants) == (Decimal(3), Decimal(3))
+    # Stock tous lots confondus égal au comptage ; l'écart est porté par le solde sans lot
+    for code, attendu in {"A": 12, "B": 6, "C": 7, "D": 0, "E": 1}.items():
+        assert Decimal(_stock_magasin(connexion, produits[code], magasin)) == attendu
+    assert solde(connexion, produits["A"].id, magasin.id) == Decimal(7)
+    assert solde(connexion, produits["A"].id, magasin.id, "L1") == Decimal(5)
+
+    m = MouvementStock.__table__
+    ajustements = dict(connexion.execute(
+        select(m.c.produit_id, m.c.quantite).where(m.c.reference_document == f"INV-{inventaire.id}")
+    ).all())
+    assert ajustements == {produits["A"].id: Decimal(-3), produits["B"].id: Decimal(2),
+                           produits["E"].id: Decimal(1)}
+    i = Inventaire.__table__
+    statut, ecarts = connexion.execute(select(i.c.statut, i.c.ecarts).where(i.c.id == inventaire.id)).one()
+    assert statut == STATUT_VALIDE
+    assert (ecarts["ecarts"], ecarts["surplus"], ecarts["manquants"]) == (3, "3.00", "3.00")
+
+    with pytest.raises(InventaireDejaValide):
+        rapprocher(connexion, inventaire.id)
+
+
+def test_simulation_sans_mouvement(session):
+    inventaire, produits, magasin = _preparer(session)
+    connexion = session.connection()
+    rapport = rapprocher(connexion, inventaire.id, ajuster=False)
+    assert (rapport.ecarts, rapport.ajustements) == (3, 0)
+    assert Decimal(_stock_magasin(connexion, produits["A"], magasin)) == 15
+    i = Inventaire.__table__
+    assert connexion.execute(select(i.c.statut).where(i.c.id == inventaire.id)).scalar() == STATUT_TERMINE
+
+    ecarts = json.loads(b"".join(flux_ecarts(connexion, inventaire.id)))
+    assert [(ligne["code"], Decimal(str(ligne["ecart"]))) for ligne in ecarts] == [
+        ("A", Decimal(-3)), ("B", Decimal(2)), ("E", Decimal(1))
+    ]
+
+    # Un inventaire terminé reste rapprochable avec ajustements
+    assert rapprocher(connexion, inventaire.id).ajustements == 3
+    assert Decimal(_stock_magasin(connexion, produits["A"], magasin)) == 12
@@ -0,0 +1,101 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import select
+
+from app.models import (CultureType, Entrepot, LienTracabilite, MouvementStock, Parcelle, Produit, QualiteRecolte,
+                        Recolte, TypeMouvement)
+from app.services.lot_traceability import deriver_lot, origine_mouvement, rappel, reconstruire
+
+
+def _arcs(session):
+    t = LienTracabilite.__table__
+    return sorted(session.connection().execute(
+        select(t.c.amont_type, t.c.amont_id, t.c.aval_type, t.c.aval_id, t.c.quantite)
+    ).all())
+
+
+def _preparer(session):
+    """
+    Deux récoltes mélangées puis ensachées :
+        P-N -> R1 -> L-R1 -\\
+                            L-MIX -> L-SAC -> expédition
+        P-S -> R2 -> L-R2 -/
+    """
+    nord = Parcelle(code="P-N", culture_type=CultureType.CACAO, surface_hectares=Decimal(3),
+                    date_plantation=date(2016, 1, 1))
+    sud = Parcelle(code="P-S", culture_type=CultureType.CACAO, surface_hectares=Decimal(2),
+                   date_plantation=date(2017, 1, 1))
+    feves = Produit(code="FEV", nom="Fèves", categorie="RECOLTE", unite_mesure="KG")
+    magasin, quai = Entrepot(nom="Magasin", code="MAG"), Entrepot(nom="Quai", code="QUAI")
+    session.add_all([nord, sud, feves, magasin, quai])
+    session.flush()
+    r1 = Recolte(parcelle_id=nord.id, date_recolte=date(2024, 3, 1), quantite_kg=Decimal(500),
+                 qualite=QualiteRecolte.A, lot="L-R1")
+    r2 = Recolte(parcelle_id=sud.id, date_recolte=date(2024, 3, 2), quantite_kg=Decimal(300),
+                 qualite=QualiteRecolte.B, lot="L-R2")
+    sans_lot = Recolte(parcelle_id=nord.id, date_recolte=date(2024, 3, 3), quantite_kg=Decimal(100),
+                       qualite=QualiteRecolte.A)
+    session.add_all([r1, r2, sans_lot])
+    session.flush()
+    connexion = session.connection()
+    deriver_lot(connexion, "L-R1", "L-MIX", Decimal(500))
+    deriver_lot(connexion, "L-R2", "L-MIX", Decimal(300))
+    deriver_lot(connexion, "L-MIX", "L-SAC", Decimal(800))
+
+    def mouvement(type_mouvement, lot, jour, **entrepots):
+        return MouvementStock(produit_id=feves.id, type_mouvement=type_mouvement, quantite=Decimal(800), lot=lot,
+                              date_mouvement=datetime(2024, 3, jour), **entrepots)
+
+    mouvements = {
+        "entree": mouvement(TypeMouvement.ENTREE, "L-R1", 4, entrepot_destination_id=magasin.id),
+        "transfert": mouvement(TypeMouvement.TRANSFERT, "L-MIX", 5, entrepot_source_id=magasin.id,
+                               entrepot_destination_id=quai.id),
+        "expedition": mouvement(TypeMouvement.SORTIE, "L-SAC", 6, entrepot_source_id=quai.id),
+        "autre": mouvement(TypeMouvement.ENTREE, "L-AUTRE", 7, entrepot_destination_id=magasin.id),
+    }
+    session.add_all(mouvements.values())
+    session.flush()
+    return (nord, sud), (r1, r2), mouvements
+
+
+def test_trace_amont_et_aval(session):
+    (nord, sud), (r1, r2), mouvements = _preparer(session)
+    connexion = session.connection()
+
+    trace = rappel(connexion, "L-MIX")
+    assert trace.lots_amont == ["L-R1", "L-R2"]
+    assert trace.lots_aval == ["L-SAC"]
+    assert [recolte.id for recolte in trace.recoltes] == [r1.id, r2.id]
+    assert trace.parcelles == sorted([nord.id, sud.id], key=str)
+    # Aval : mouvements du lot et de ses dérivés, pas ceux des lots d'origine
+    assert [m.id for m in trace.mouvements] == [mouvements["transfert"].id, mouvements["expedition"].id]
+    assert [m.id for m in trace.expeditions] == [mouvements["expedition"].id]
+
+    trace = rappel(connexion, "L-R1")
+    assert (trace.lots_amont, trace.lots_aval) == ([], ["L-MIX", "L-SAC"])
+    assert trace.parcelles == [nord.id]
+    assert [m.id for m in trace.mouvements] == [mouvements[nom].id for nom in ("entree", "transfert", "expedition")]
+
+    assert origine_mouvement(connexion, mouvements["expedition"].id) == sorted([nord.id, sud.id], key=str)
+    assert origine_mouvement(connexion, mouvements["autre"].id) == []
+
+
+def test_graphe_suit_les_modifications(session):
+    (nord, sud), (r1, r2), mouvements = _preparer(session)
+    connexion = session.connection()
+
+    # Récolte réaffectée à un autre lot, expédition supprimée
+    r2.lot = "L-R2-BIS"
+    session.delete(mouvements["expedition"])
+    session.flush()
+    trace = rappel(connexion, "L-MIX")
+    assert [recolte.id for recolte in trace.recoltes] == [r1.id]
+    assert trace.expeditions == []
+    assert origine_mouvement(connexion, mouvements["transfert"].id) == [nord.id]
+    assert rappel(connexion, "L-R2-BIS").parcelles == [sud.id]
+
+    # Le graphe reconstruit depuis les tables sources, dérivations conservées, est identique
+    incremental = _arcs(session)
+    reconstruire(connexion)
+    assert _arcs(session) == incremental
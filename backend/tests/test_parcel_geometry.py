@@ -0,0 +1,125 @@
+import random
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.models import CultureType, Parcelle, metadata
+from app.services import parcel_geometry
+from app.services.parcel_geometry import IndexSpatial, lire_anneaux
+
+
+def _dans_anneau(x, y, anneau):
+    dedans = False
+    for (x1, y1), (x2, y2) in zip(anneau, anneau[1:] + anneau[:1]):
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            dedans = not dedans
+    return dedans
+
+
+def _dans_polygones(x, y, polygones):
+    # Règle pair-impair sur tous les anneaux : un trou retire sa surface
+    return sum(_dans_anneau(x, y, anneau) for polygone in polygones for anneau in polygone) % 2 == 1
+
+
+def _carre(x, y, cote):
+    return [[x, y], [x + cote, y], [x + cote, y + cote], [x, y + cote]]
+
+
+def _geometries(graine=7, nombre=300):
+    alea = random.Random(graine)
+    geometries = []
+    for numero in range(nombre):
+        x, y = (numero % 20) * 1.0, (numero // 20) * 1.0
+        forme = numero % 3
+        if forme == 0:
+            # Polygone étoilé irrégulier
+            angles = sorted(alea.uniform(0, 2 * np.pi) for _ in range(7))
+            anneau = [[x + 0.5 + alea.uniform(0.1, 0.45) * np.cos(a), y + 0.5 + alea.uniform(0.1, 0.45) * np.sin(a)]
+                      for a in angles]
+            polygones = [[anneau]]
+            valeur = {"type": "Polygon", "coordinates": [anneau]}
+        elif forme == 1:
+            # Carré troué
+            polygones = [[_carre(x + 0.05, y + 0.05, 0.9), _carre(x + 0.35, y + 0.35, 0.3)]]
+            valeur = {"type": "Feature", "geometry": {"type": "Polygon", "coordinates": polygones[0]}}
+        else:
+            # Deux îlots
+            polygones = [[_carre(x + 0.05, y + 0.05, 0.35)], [_carre(x + 0.55, y + 0.55, 0.4)]]
+            valeur = {"type": "MultiPolygon", "coordinates": polygones}
+        geometries.append((numero, valeur, polygones))
+    return geometries
+
+
+def _index(geometries):
+    return IndexSpatial([numero for numero, _, _ in geometries],
+                        [parcel_geometry._aretes(lire_anneaux(valeur)) for _, valeur, _ in geometries])
+
+
+def test_localisation_egale_force_brute():
+    geometries = _geometries()
+    index = _index(geometries)
+    alea = random.Random(11)
+    points = [(alea.uniform(-1, 21), alea.uniform(-1, 16)) for _ in range(3000)]
+    emprises = [
+        (numero, polygones, np.array([point for polygone in polygones for point in polygone[0]]))
+        for numero, _, polygones in geometries
+    ]
+    attendu = [
+        next((numero for numero, polygones, sommets in emprises
+              if sommets[:, 0].min() <= x <= sommets[:, 0].max() and sommets[:, 1].min() <= y <= sommets[:, 1].max()
+              and _dans_polygones(x, y, polygones)), None)
+        for x, y in points
+    ]
+    assert index.localiser(np.array(points)) == attendu
+
+
+def test_boite_egale_force_brute():
+    geometries = _geometries()
+    index = _index(geometries)
+    alea = random.Random(13)
+    for _ in range(200):
+        x, y = alea.uniform(-1, 21), alea.uniform(-1, 16)
+        boite = (x, y, x + alea.uniform(0, 3), y + alea.uniform(0, 3))
+        attendu = []
+        for numero, _, polygones in geometries:
+            points = np.array([point for polygone in polygones for point in polygone[0]])
+            if (points[:, 0].min() <= boite[2] and points[:, 0].max() >= boite[0]
+                    and points[:, 1].min() <= boite[3] and points[:, 1].max() >= boite[1]):
+                attendu.append(numero)
+        # Ordre de l'index (STR), non significatif
+        assert sorted(index.dans_boite(boite)) == sorted(attendu)
+
+
+def _parcelle(code, coordonnees):
+    return Parcelle(code=code, culture_type=CultureType.CACAO, surface_hectares=Decimal(1),
+                    date_plantation=date(2020, 1, 1), coordonnees_gps=coordonnees)
+
+
+def test_geometrie_illisible_ignoree(session):
+    session.add_all([
+        _parcelle("P-OK", _carre(0, 0, 1)),
+        _parcelle("P-SANS-LAT", [{"lon": 2}, {"lon": 3}, {"lon": 3}]),
+        _parcelle("P-IRREGULIERE", {"type": "Polygon", "coordinates": [[[5, 5], [6, 5, 1, 2], [6]]]}),
+    ])
+    session.commit()
+    index = parcel_geometry.construire_index(session.connection())
+    assert len(index) == 1
+    assert parcel_geometry.localiser(session.connection(), [(0.5, 0.5), (2.5, 0.5)])[0] is not None
+
+
+def test_transaction_annulee_absente_de_l_index_partage(tmp_path):
+    moteur = create_engine(f"sqlite:///{tmp_path / 'parcelles.db'}")
+    metadata.create_all(moteur)
+    parcel_geometry.invalider()
+    with Session(moteur) as session:
+        session.add(_parcelle("P-NON-VALIDEE", _carre(0, 0, 1)))
+        session.flush()
+        # La transaction voit sa parcelle...
+        assert parcel_geometry.parcelle_du_point(session.connection(), 0.5, 0.5) is not None
+        session.rollback()
+    # ... l'index partagé, lui, ne l'a jamais vue
+    with moteur.connect() as connexion:
+        assert parcel_geometry.parcelle_du_point(connexion, 0.5, 0.5) is None
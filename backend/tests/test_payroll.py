@@ -0,0 +1,124 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.models import (Conge, Contrat, DepartementType, Employe, Paie, Presence, StatutConge, StatutEmploye,
+                        TypeConge, TypeContrat, TypePresence)
+from app.services.payroll import calculer_paie
+
+PERIODE = "2024-06"
+
+
+@pytest.fixture(autouse=True)
+def configuration(monkeypatch):
+    # Barème simple : taux horaire 1 500 et taux journalier 12 000 pour 300 000 par mois
+    monkeypatch.setitem(settings.PAYROLL_CONFIG, "monthly_hours", 200)
+    monkeypatch.setitem(settings.PAYROLL_CONFIG, "working_days_per_month", 25)
+    monkeypatch.setitem(settings.PAYROLL_CONFIG, "daily_hours", 8)
+    monkeypatch.setitem(settings.PAYROLL_CONFIG, "overtime_tiers", [[4, 1.25], [None, 1.5]])
+
+
+def _employe(session, matricule, statut=StatutEmploye.ACTIF, salaire=300000, embauche=date(2023, 1, 1),
+             contrats=()):
+    employe = Employe(matricule=matricule, nom=matricule, prenom="Test", date_naissance=date(1990, 1, 1),
+                      departement=DepartementType.PRODUCTION, poste="Ouvrier", date_embauche=embauche,
+                      type_contrat=TypeContrat.CDI, statut=statut, salaire_base=Decimal(salaire))
+    session.add(employe)
+    session.flush()
+    for debut, fin, montant in contrats:
+        session.add(Contrat(employe_id=employe.id, type_contrat=TypeContrat.CDD, date_debut=debut, date_fin=fin,
+                            poste="Ouvrier", salaire_base=Decimal(montant)))
+    session.flush()
+    return employe
+
+
+def _fiches(session):
+    return {fiche.employe_id: fiche for fiche in session.execute(select(Paie).where(Paie.periode == PERIODE)).scalars()}
+
+
+def test_changement_de_contrat_en_cours_de_mois(session):
+    employe = _employe(session, "E-1", contrats=[(date(2023, 1, 1), date(2024, 6, 30), 300000),
+                                                 (date(2024, 6, 16), None, 360000)])
+    calculer_paie(session.connection(), PERIODE)
+    # 15 jours à 300 000, 15 jours à 360 000
+    assert _fiches(session)[employe.id].salaire_base == Decimal("330000.00")
+
+
+def test_contrat_termine_en_cours_de_mois_employe_inactif(session):
+    parti = _employe(session, "E-PARTI", statut=StatutEmploye.INACTIF,
+                     contrats=[(date(2023, 1, 1), date(2024, 6, 10), 300000)])
+    ancien = _employe(session, "E-ANCIEN", statut=StatutEmploye.INACTIF,
+                      contrats=[(date(2023, 1, 1), date(2024, 5, 31), 300000)])
+    # Fiche non payée calculée quand l'employé était encore actif
+    session.add_all([
+        Paie(employe_id=parti.id, periode=PERIODE, salaire_base=Decimal(300000), net_a_payer=Decimal(1)),
+        Paie(employe_id=ancien.id, periode=PERIODE, salaire_base=Decimal(300000), net_a_payer=Decimal(1)),
+    ])
+    session.flush()
+
+    rapport = calculer_paie(session.connection(), PERIODE)
+    session.expire_all()
+    fiches = _fiches(session)
+    assert rapport.fiches == 1
+    assert fiches[parti.id].salaire_base == Decimal("100000.00")
+    assert ancien.id not in fiches
+
+
+def test_heures_supplementaires_par_tranches(session):
+    employe = _employe(session, "E-HS")
+    session.add_all([
+        Presence(employe_id=employe.id, date=date(2024, 6, jour), type_presence=TypePresence.PRESENT,
+                 heures_travaillees=Decimal(10))
+        for jour in (3, 4, 5)
+    ] + [Presence(employe_id=employe.id, date=date(2024, 6, 6), type_presence=TypePresence.PRESENT,
+                  heures_travaillees=Decimal(7))])
+    session.flush()
+    calculer_paie(session.connection(), PERIODE)
+    fiche = _fiches(session)[employe.id]
+    assert fiche.heures_supp == Decimal("6.00")
+    # 4 h à 125 % puis 2 h à 150 % du taux horaire (1 500)
+    assert fiche.primes["heures_supplementaires"] == pytest.approx(4 * 1500 * 1.25 + 2 * 1500 * 1.5)
+
+
+def test_conge_sans_solde_et_absence(session):
+    employe = _employe(session, "E-CSS")
+    session.add_all([
+        # 6 jours calendaires dont 3 en juin : 4 jours ouvrés au prorata, soit 2
+        Conge(employe_id=employe.id, type_conge=TypeConge.SANS_SOLDE, date_debut=date(2024, 6, 28),
+              date_fin=date(2024, 7, 3), nb_jours=4, statut=StatutConge.APPROUVE),
+        Conge(employe_id=employe.id, type_conge=TypeConge.SANS_SOLDE, date_debut=date(2024, 6, 3),
+              date_fin=date(2024, 6, 4), nb_jours=2, statut=StatutConge.REFUSE),
+        Conge(employe_id=employe.id, type_conge=TypeConge.ANNUEL, date_debut=date(2024, 6, 10),
+              date_fin=date(2024, 6, 14), nb_jours=5, statut=StatutConge.APPROUVE),
+        Presence(employe_id=employe.id, date=date(2024, 6, 20), type_presence=TypePresence.ABSENT),
+        Presence(employe_id=employe.id, date=date(2024, 6, 21), type_presence=TypePresence.ABSENT,
+                 justification="certificat médical"),
+    ])
+    session.flush()
+    calculer_paie(session.connection(), PERIODE)
+    fiche = _fiches(session)[employe.id]
+    assert fiche.deductions["conges_sans_solde"] == pytest.approx(2 * 12000)
+    assert fiche.deductions["absences"] == pytest.approx(12000)
+
+
+def test_recalcul_ne_touche_pas_une_fiche_payee(session):
+    payee = _employe(session, "E-PAYE")
+    autre = _employe(session, "E-AUTRE")
+    calculer_paie(session.connection(), PERIODE)
+    fiche = _fiches(session)[payee.id]
+    fiche.date_paiement = datetime(2024, 7, 1)
+    fiche.net_a_payer = Decimal("123.45")
+    payee.salaire_base = Decimal(400000)
+    autre.salaire_base = Decimal(330000)
+    session.flush()
+
+    rapport = calculer_paie(session.connection(), PERIODE)
+    session.expire_all()
+    fiches = _fiches(session)
+    assert (rapport.fiches, rapport.deja_payees) == (1, 1)
+    assert fiches[payee.id].net_a_payer == Decimal("123.45")
+    assert fiches[payee.id].salaire_base == Decimal("300000.00")
+    assert fiches[autre.id].salaire_base == Decimal("330000.00")
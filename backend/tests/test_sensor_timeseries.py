@@ -0,0 +1,22 @@
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.pool import StaticPool
+
+from app.models import MesureCapteur, metadata
+from app.services.sensor_timeseries import Releve, TamponMesures
+
+
+def test_lot_incomplet_ecrit_a_echeance_sans_nouveau_releve():
+    moteur = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    metadata.create_all(moteur)
+    compter = select(func.count()).select_from(MesureCapteur.__table__)
+    with TamponMesures(moteur, taille=100, delai=0.05) as tampon:
+        tampon.ajouter(Releve(uuid.uuid4(), "temp-1", "temperature", datetime(2024, 6, 3, 10), 27.5))
+        with moteur.connect() as connexion:
+            assert connexion.execute(compter).scalar() == 0
+        time.sleep(0.5)
+        with moteur.connect() as connexion:
+            assert connexion.execute(compter).scalar() == 1
@@ -0,0 +1,41 @@
+import json
+from decimal import Decimal
+
+from sqlalchemy import select
+
+from app.core.serialization import serialiser_lignes, serialiser_modeles
+from app.models import CategorieTransaction, Produit, Transaction, TypeTransaction
+
+
+def test_dict_lit_l_attribut_mappe_et_non_le_nom_de_colonne():
+    transaction = Transaction(type=TypeTransaction.RECETTE, categorie=CategorieTransaction.VENTE_PRODUITS,
+                              montant=Decimal("1500.50"), metadonnees={"client": "C-01"})
+    donnees = transaction.dict()
+    assert donnees["metadata"] == {"client": "C-01"}
+    assert "metadonnees" not in donnees
+    [objet] = json.loads(serialiser_modeles([transaction]))
+    assert objet["metadata"] == {"client": "C-01"} and objet["montant"] == "1500.50"
+
+
+def test_bulk_upsert_insere_puis_met_a_jour(session):
+    lignes = [
+        {"code": "ENG-01", "nom": "Engrais", "categorie": "INTRANT", "unite_mesure": "KG"},
+        {"code": "SEM-01", "nom": "Semences", "categorie": "INTRANT", "unite_mesure": "KG"},
+    ]
+    assert Produit.bulk_upsert(session, lignes, "code") == {"inserted": 2, "updated": 0}
+    id_engrais = session.execute(select(Produit.id).where(Produit.code == "ENG-01")).scalar_one()
+
+    lignes = [
+        {"code": "ENG-01", "nom": "Engrais NPK", "categorie": "INTRANT", "unite_mesure": "KG"},
+        {"code": "PHY-01", "nom": "Fongicide", "categorie": "INTRANT", "unite_mesure": "LITRE"},
+        # Doublon de clé dans le lot : la dernière occurrence l'emporte
+        {"code": "PHY-01", "nom": "Fongicide cuivre", "categorie": "INTRANT", "unite_mesure": "LITRE"},
+    ]
+    assert Produit.bulk_upsert(session, lignes, "code") == {"inserted": 1, "updated": 1}
+    resultat = session.execute(select(Produit.__table__.c.code, Produit.__table__.c.nom).order_by("code"))
+    assert json.loads(serialiser_lignes(resultat)) == [
+        {"code": "ENG-01", "nom": "Engrais NPK"},
+        {"code": "PHY-01", "nom": "Fongicide cuivre"},
+        {"code": "SEM-01", "nom": "Semences"},
+    ]
+    assert session.execute(select(Produit.id).where(Produit.code == "ENG-01")).scalar_one() == id_engrais
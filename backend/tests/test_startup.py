@@ -0,0 +1,18 @@
+import subprocess
+
+import pytest
+
+from app.core import startup
+
+
+def test_rapport_imports_echec_sans_stderr(monkeypatch):
+    monkeypatch.setattr(subprocess, "run", lambda *args, **kwargs: subprocess.CompletedProcess(args, -9, "", ""))
+    with pytest.raises(RuntimeError, match=r"code -9"):
+        startup.rapport_imports("app.models")
+
+
+def test_rapport_imports_echec_avec_stderr(monkeypatch):
+    sortie = "import time: self [us] | cumulative | imported package\nModuleNotFoundError: No module named 'x'\n"
+    monkeypatch.setattr(subprocess, "run", lambda *args, **kwargs: subprocess.CompletedProcess(args, 1, "", sortie))
+    with pytest.raises(RuntimeError, match=r"code 1\) : ModuleNotFoundError"):
+        startup.rapport_imports("x")
@@ -0,0 +1,39 @@
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import event, insert
+from sqlalchemy.sql.dml import Insert
+
+from app.models import AlerteStock, Entrepot, Produit, StatutAlerte, Stock
+from app.models.base import generer_id
+from app.services import stock_alerts
+
+
+def test_alerte_creee_entre_temps_non_comptee(session):
+    produit = Produit(code="ENG-03", nom="Engrais", categorie="INTRANT", unite_mesure="KG",
+                      seuil_alerte=Decimal(5))
+    entrepot = Entrepot(nom="Magasin", code="MAG")
+    session.add_all([produit, entrepot])
+    session.flush()
+    session.add(Stock(produit_id=produit.id, entrepot_id=entrepot.id, quantite=Decimal(2)))
+    session.flush()
+    connexion = session.connection()
+    a = AlerteStock.__table__
+
+    # Une transaction concurrente crée l'alerte juste avant l'upsert
+    def concurrente(conn, element, *args):
+        if isinstance(element, Insert) and element.table is a and not conn.info.get("concurrente"):
+            conn.info["concurrente"] = True
+            maintenant = datetime.utcnow()
+            conn.execute(insert(a).values(
+                id=generer_id(), produit_id=produit.id, entrepot_id=entrepot.id, statut=StatutAlerte.ACTIVE,
+                quantite=Decimal(2), seuil=Decimal(5), date_detection=maintenant, notifiee=False,
+                created_at=maintenant, updated_at=maintenant,
+            ))
+
+    event.listen(connexion, "before_execute", concurrente)
+    avant = stock_alerts.alertes_declenchees.valeur()
+    assert stock_alerts.verifier_seuils(connexion, [(produit.id, entrepot.id)])["creees"] == 0
+    assert connexion.info["concurrente"]
+    assert stock_alerts.alertes_declenchees.valeur() == avant
+    assert len(stock_alerts.alertes_actives(connexion)) == 1
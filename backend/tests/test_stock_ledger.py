@@ -0,0 +1,55 @@
+from decimal import Decimal
+
+from app.models import Entrepot, MouvementStock, Produit, TypeMouvement
+from app.services.stock_ledger import solde, verifier_soldes
+
+
+def _catalogue(session):
+    produit = Produit(code="ENG-01", nom="Engrais", categorie="INTRANT", unite_mesure="KG")
+    source = Entrepot(nom="Magasin", code="MAG")
+    destination = Entrepot(nom="Parcelle", code="PAR")
+    session.add_all([produit, source, destination])
+    session.flush()
+    return produit, source, destination
+
+
+def _soldes(session, produit, *entrepots):
+    connexion = session.connection()
+    return [solde(connexion, produit.id, entrepot.id) for entrepot in entrepots]
+
+
+def test_modification_apres_commit_puis_suppression(session):
+    produit, source, destination = _catalogue(session)
+    session.add(MouvementStock(produit_id=produit.id, type_mouvement=TypeMouvement.ENTREE,
+                               quantite=Decimal(10), entrepot_destination_id=source.id))
+    transfert = MouvementStock(produit_id=produit.id, type_mouvement=TypeMouvement.TRANSFERT,
+                               quantite=Decimal(3), entrepot_source_id=source.id,
+                               entrepot_destination_id=destination.id)
+    session.add(transfert)
+    session.commit()
+    assert _soldes(session, produit, source, destination) == [Decimal(7), Decimal(3)]
+
+    # Instance expirée par le commit : affectation sans lecture préalable
+    transfert.quantite = Decimal(4)
+    session.commit()
+    assert _soldes(session, produit, source, destination) == [Decimal(6), Decimal(4)]
+
+    session.delete(transfert)
+    session.commit()
+    assert _soldes(session, produit, source, destination) == [Decimal(10), Decimal(0)]
+    assert verifier_soldes(session.connection()) == []
+
+
+def test_correction_du_cout_apres_commit(session):
+    produit, source, _ = _catalogue(session)
+    entree = MouvementStock(produit_id=produit.id, type_mouvement=TypeMouvement.ENTREE,
+                            quantite=Decimal(5), entrepot_destination_id=source.id,
+                            cout_unitaire=Decimal(100))
+    session.add(entree)
+    session.commit()
+
+    entree.cout_unitaire = Decimal(120)
+    entree.quantite = Decimal(8)
+    session.commit()
+    assert _soldes(session, produit, source) == [Decimal(8)]
+    assert verifier_soldes(session.connection()) == []
@@ -0,0 +1,100 @@
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import select, update
+
+from app.models import Entrepot, LigneValorisation, MouvementStock, Produit, SnapshotStock, TypeMouvement
+from app.services.stock_ledger import poster_mouvements
+from app.services.stock_snapshots import creer_snapshot, stock_a_date
+from app.services.stock_valuation import revaloriser
+
+FIN_JANVIER, FIN_FEVRIER = datetime(2024, 1, 31, 23, 59), datetime(2024, 2, 29, 23, 59)
+
+
+def _positions(positions):
+    return {(p.produit_id, p.entrepot_id, p.lot): (p.quantite, p.cmup) for p in positions}
+
+
+def _depuis_les_lignes(connexion, a_date):
+    """Stock à date relu sur tout l'historique, sans photographie."""
+    t = LigneValorisation.__table__
+    positions = {}
+    for ligne in connexion.execute(
+        select(t.c.produit_id, t.c.entrepot_id, t.c.lot, t.c.quantite_apres, t.c.cmup_apres)
+        .where(t.c.date_mouvement <= a_date).order_by(t.c.date_mouvement, t.c.mouvement_id)
+    ):
+        positions[(ligne.produit_id, ligne.entrepot_id, ligne.lot)] = (ligne.quantite_apres, ligne.cmup_apres)
+    return positions
+
+
+def _snapshot(connexion, a_date):
+    sn = SnapshotStock.__table__
+    return {
+        (ligne.produit_id, ligne.entrepot_id, ligne.lot): (ligne.quantite, ligne.cmup)
+        for ligne in connexion.execute(select(sn).where(sn.c.date_snapshot == a_date))
+    }
+
+
+def _preparer(session):
+    produit = Produit(code="ENG-01", nom="Engrais", categorie="INTRANT", unite_mesure="KG")
+    magasin, champ = Entrepot(nom="Magasin", code="MAG"), Entrepot(nom="Champ", code="CHP")
+    session.add_all([produit, magasin, champ])
+    session.flush()
+    connexion = session.connection()
+    poster_mouvements(connexion, [
+        {"produit_id": produit.id, "type_mouvement": TypeMouvement.ENTREE, "quantite": Decimal(10),
+         "cout_unitaire": Decimal(100), "entrepot_destination_id": magasin.id,
+         "date_mouvement": datetime(2024, 1, 5)},
+        {"produit_id": produit.id, "type_mouvement": TypeMouvement.TRANSFERT, "quantite": Decimal(4),
+         "entrepot_source_id": magasin.id, "entrepot_destination_id": champ.id,
+         "date_mouvement": datetime(2024, 1, 20)},
+        {"produit_id": produit.id, "type_mouvement": TypeMouvement.ENTREE, "quantite": Decimal(6),
+         "cout_unitaire": Decimal(140), "entrepot_destination_id": magasin.id,
+         "date_mouvement": datetime(2024, 2, 10)},
+        {"produit_id": produit.id, "type_mouvement": TypeMouvement.SORTIE, "quantite": Decimal(3),
+         "entrepot_source_id": champ.id, "date_mouvement": datetime(2024, 2, 15)},
+    ])
+    creer_snapshot(connexion, FIN_JANVIER)
+    creer_snapshot(connexion, FIN_FEVRIER)
+    return produit, magasin, champ
+
+
+def test_stock_a_date_et_mouvement_antidate(session):
+    produit, magasin, champ = _preparer(session)
+    connexion = session.connection()
+    for a_date in (FIN_JANVIER, datetime(2024, 2, 12), FIN_FEVRIER, datetime(2024, 3, 1)):
+        assert _positions(stock_a_date(connexion, a_date)) == _depuis_les_lignes(connexion, a_date)
+
+    # Entrée antidatée de janvier : les deux photographies sont corrigées
+    poster_mouvements(connexion, [
+        {"produit_id": produit.id, "type_mouvement": TypeMouvement.ENTREE, "quantite": Decimal(10),
+         "cout_unitaire": Decimal(200), "entrepot_destination_id": magasin.id,
+         "date_mouvement": datetime(2024, 1, 10)},
+    ])
+    for a_date in (FIN_JANVIER, FIN_FEVRIER):
+        assert _snapshot(connexion, a_date) == _depuis_les_lignes(connexion, a_date)
+    assert _snapshot(connexion, FIN_JANVIER)[(produit.id, magasin.id, None)] == (Decimal(16), Decimal(150))
+
+
+def test_revalorisation_refait_les_photographies(session):
+    produit, magasin, champ = _preparer(session)
+    connexion = session.connection()
+    # Correction du coût hors journal : valorisation et photographies périmées
+    m = MouvementStock.__table__
+    connexion.execute(update(m).where(m.c.date_mouvement == datetime(2024, 1, 5)).values(cout_unitaire=120))
+    avant = _snapshot(connexion, FIN_FEVRIER)
+
+    rapport = revaloriser(connexion, reconstruire=True)
+    assert rapport.snapshots == 2
+    for a_date in (FIN_JANVIER, FIN_FEVRIER):
+        assert _snapshot(connexion, a_date) == _depuis_les_lignes(connexion, a_date)
+    assert _snapshot(connexion, FIN_FEVRIER) != avant
+    assert _snapshot(connexion, FIN_JANVIER)[(produit.id, champ.id, None)] == (Decimal(4), Decimal(120))
+
+    # Revalorisation sans écart : aucune photographie refaite
+    assert revaloriser(connexion).snapshots == 0
+    # Ligne de février altérée : seule la photographie de fin février est refaite
+    t = LigneValorisation.__table__
+    connexion.execute(update(t).where(t.c.date_mouvement == datetime(2024, 2, 10)).values(cmup_apres=1))
+    assert revaloriser(connexion).snapshots == 1
+    assert _snapshot(connexion, FIN_FEVRIER) == _depuis_les_lignes(connexion, FIN_FEVRIER)
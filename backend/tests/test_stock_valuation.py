@@ -0,0 +1,76 @@
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import select
+
+from app.models import Entrepot, LigneValorisation, MouvementStock, Produit, TypeMouvement
+from app.services.stock_ledger import poster_mouvements
+from app.services.stock_valuation import revaloriser
+
+
+def _lignes(session):
+    t = LigneValorisation.__table__
+    return {
+        (ligne.mouvement_id, ligne.produit_id, ligne.entrepot_id, ligne.lot):
+            (ligne.quantite_apres, ligne.cmup_apres, ligne.cout_unitaire)
+        for ligne in session.connection().execute(
+            select(t.c.mouvement_id, t.c.produit_id, t.c.entrepot_id, t.c.lot,
+                   t.c.quantite_apres, t.c.cmup_apres, t.c.cout_unitaire)
+        )
+    }
+
+
+def _mouvement_aleatoire(alea, produits, entrepots, origine):
+    type_mouvement = alea.choice([TypeMouvement.ENTREE] * 3 + [TypeMouvement.SORTIE, TypeMouvement.PERTE,
+                                                               TypeMouvement.TRANSFERT, TypeMouvement.AJUSTEMENT])
+    source, destination = alea.sample(entrepots, 2)
+    mouvement = {
+        "produit_id": alea.choice(produits).id,
+        "type_mouvement": type_mouvement,
+        "quantite": Decimal(alea.randint(1, 40)),
+        # Une partie des mouvements est antidatée dans l'historique déjà valorisé
+        "date_mouvement": origine + timedelta(hours=alea.randint(0, 24 * 90)),
+        "lot": alea.choice([None, None, "L1"]),
+    }
+    if type_mouvement in (TypeMouvement.ENTREE, TypeMouvement.AJUSTEMENT):
+        mouvement["entrepot_destination_id"] = destination.id
+        mouvement["cout_unitaire"] = Decimal(alea.randint(100, 900)) / 4
+    elif type_mouvement is TypeMouvement.TRANSFERT:
+        mouvement.update(entrepot_source_id=source.id, entrepot_destination_id=destination.id)
+    else:
+        mouvement["entrepot_source_id"] = source.id
+    return mouvement
+
+
+def test_incremental_egal_revalorisation_complete(session):
+    alea = random.Random(2024)
+    produits = [Produit(code=f"PRD-{i}", nom=f"Produit {i}", categorie="INTRANT", unite_mesure="KG")
+                for i in range(2)]
+    entrepots = [Entrepot(nom=f"Entrepôt {i}", code=f"E{i}") for i in range(3)]
+    session.add_all(produits + entrepots)
+    session.flush()
+    origine = datetime(2024, 1, 1)
+
+    mouvements = []
+    for _ in range(12):
+        # Lot comptabilisé en masse, puis mouvements unitaires par la session
+        poster_mouvements(session.connection(),
+                          [_mouvement_aleatoire(alea, produits, entrepots, origine) for _ in range(8)])
+        nouveaux = [MouvementStock(**_mouvement_aleatoire(alea, produits, entrepots, origine)) for _ in range(4)]
+        session.add_all(nouveaux)
+        session.flush()
+        mouvements.extend(nouveaux)
+        for mouvement in alea.sample(mouvements, 2):
+            mouvements.remove(mouvement)
+            if alea.random() < 0.5:
+                session.delete(mouvement)
+            else:
+                mouvement.quantite = Decimal(alea.randint(1, 40))
+                mouvement.date_mouvement = origine + timedelta(hours=alea.randint(0, 24 * 90))
+        session.flush()
+
+    incremental = _lignes(session)
+    assert revaloriser(session.connection()).lignes_modifiees == 0
+    revaloriser(session.connection(), reconstruire=True)
+    assert _lignes(session) == incremental
@@ -0,0 +1,57 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+
+from app.models import CultureType, ModeleRendement, Parcelle, QualiteRecolte, Recolte
+from app.services.yield_forecast import STATISTIQUES, reconstruire
+
+
+def _statistiques(session):
+    m = ModeleRendement.__table__
+    lignes = session.connection().execute(select(m.c.parcelle_id, *(m.c[nom] for nom in STATISTIQUES))).all()
+    return {ligne[0]: list(ligne[1:]) for ligne in lignes}
+
+
+def _comparer(incremental, reconstruit):
+    # Une parcelle sans plus aucune récolte garde une ligne à sommes nulles
+    incremental = {parcelle: sommes for parcelle, sommes in incremental.items() if sommes[0]}
+    assert set(incremental) == set(reconstruit)
+    for parcelle, sommes in reconstruit.items():
+        assert incremental[parcelle] == pytest.approx(sommes, rel=1e-9, abs=1e-6)
+
+
+def test_statistiques_apres_correction_aveugle_puis_suppression(session):
+    nord = Parcelle(code="P-N", culture_type=CultureType.PALMIER, surface_hectares=Decimal(10),
+                    date_plantation=date(2015, 1, 1))
+    sud = Parcelle(code="P-S", culture_type=CultureType.PALMIER, surface_hectares=Decimal(4),
+                   date_plantation=date(2018, 6, 1))
+    session.add_all([nord, sud])
+    session.flush()
+    recoltes = [
+        Recolte(parcelle_id=nord.id, date_recolte=date(2023, 1, 1) + timedelta(days=14 * i),
+                quantite_kg=Decimal(800 + 10 * i), qualite=QualiteRecolte.A)
+        for i in range(20)
+    ]
+    session.add_all(recoltes)
+    session.commit()
+    corrigee, supprimee = recoltes[3], recoltes[7]
+
+    # Instance expirée par le commit : correction sans lecture préalable
+    corrigee.parcelle_id = sud.id
+    corrigee.date_recolte = date(2024, 2, 1)
+    corrigee.quantite_kg = Decimal(450)
+    session.commit()
+    incremental = _statistiques(session)
+    reconstruire(session.connection())
+    _comparer(incremental, _statistiques(session))
+    assert incremental[sud.id][0] == 1
+
+    session.delete(supprimee)
+    session.delete(corrigee)
+    session.commit()
+    incremental = _statistiques(session)
+    reconstruire(session.connection())
+    _comparer(incremental, _statistiques(session))
+    assert incremental[nord.id][0] == 18
@@ -16,9 +16,12 @@ STATIC_DIR = BASE_DIR / "static"
 MEDIA_DIR = BASE_DIR / "media"
 LOGS_DIR = BASE_DIR / "logs"
 
-# Création des répertoires nécessaires
-for directory in [STATIC_DIR, MEDIA_DIR, LOGS_DIR]:
-    directory.mkdir(exist_ok=True)
+# Création des répertoires nécessaires : faite au démarrage du processus
+# (app.core.startup.demarrer) et non à l'import, qui doit rester sans effet de bord
+def creer_repertoires() -> None:
+    """Crée les répertoires statiques, médias et logs s'ils n'existent pas."""
+    for directory in [STATIC_DIR, MEDIA_DIR, LOGS_DIR]:
+        directory.mkdir(exist_ok=True)
 
 # Configuration de la base de données
 DATABASE_CONFIG = {
@@ -47,14 +50,22 @@ SECURITY_CONFIG = {
 # Configuration des cultures
 AGRICULTURAL_CONFIG = {
     "palm_oil": {
+        "culture_type": "PALMIER",
         "total_hectares": 70,
         "plants_per_hectare": 143,
-        "harvest_cycle_days": 10
+        "harvest_cycle_days": 10,
+        "maturity_months": 36,  # entrée en production après plantation
+        "productive_years": 25,  # durée de production
+        "yield_kg_per_plant_per_year": 140
     },
     "papaya": {
+        "culture_type": "PAPAYE",
         "total_hectares": 10,
         "plants_per_hectare": 1600,
-        "harvest_cycle_days": 7
+        "harvest_cycle_days": 7,
+        "maturity_months": 9,  # entrée en production après plantation
+        "productive_years": 3,  # durée de production
+        "yield_kg_per_plant_per_year": 40
     }
 }
 
@@ -65,6 +76,27 @@ ACCOUNTING_CONFIG = {
     "accounting_standard": "OHADA"
 }
 
+# Configuration de la paie
+PAYROLL_CONFIG = {
+    "monthly_hours": 173.33,  # durée légale mensuelle (40 h/semaine)
+    "daily_hours": 8,  # au-delà : heures supplémentaires
+    "working_days_per_month": 26,  # retenue par jour d'absence ou de congé sans solde
+    # Majoration des heures supplémentaires par tranche mensuelle (heures, taux) ; None : au-delà
+    "overtime_tiers": [[32, 1.2], [32, 1.3], [None, 1.4]],
+    "unpaid_leave_types": ["SANS_SOLDE"],
+    # Cotisations salariales : taux sur le brut, plafonné au besoin
+    "contributions": {
+        "cnps_pension": {"rate": 0.042, "ceiling": 750000},
+        "credit_foncier": {"rate": 0.01, "ceiling": None},
+    },
+    # Impôt sur le revenu : barème annuel sur (brut - abattement - cotisations)
+    "income_tax": {
+        "allowance_rate": 0.30,
+        "brackets": [[2000000, 0.10], [3000000, 0.15], [5000000, 0.25], [None, 0.35]],
+        "surcharge_rate": 0.10,  # centimes additionnels sur l'impôt
+    },
+}
+
 # Configuration des rapports
 REPORTING_CONFIG = {
     "default_language": "fr",
@@ -1,11 +1,13 @@
+from sqlalchemy.orm import relationship
 from .base import Base
 from .production import (
-    Parcelle, CycleCulture, Recolte, ActiviteCulturale,
+    Parcelle, CycleCulture, Recolte, MembreEquipeRecolte, AgregatRecolte, TourneeRecolte, ActiviteCulturale,
+    MesureCapteur, AgregatMesure, ModeleRendement,
     CultureType, ParcelleStatus, QualiteRecolte, TypeActivite
 )
 from .inventory import (
-    Produit, MouvementStock, Entrepot, Stock, Inventaire, LigneInventaire,
-    CategoryProduit, UniteMesure, TypeMouvement
+    Produit, MouvementStock, Entrepot, Stock, Inventaire, LigneInventaire, LigneValorisation,
+    AlerteStock, SnapshotStock, LienTracabilite, CategoryProduit, UniteMesure, TypeMouvement, StatutAlerte
 )
 from .hr import (
     Employe, Contrat, Conge, Presence, Paie,
@@ -33,6 +35,10 @@ Employe.entrepots_geres = relationship("Entrepot", back_populates="responsable")
 Employe.mouvements_stock = relationship("MouvementStock", back_populates="responsable")
 Employe.projets_diriges = relationship("Projet", back_populates="responsable")
 Employe.taches_assignees = relationship("Tache", back_populates="assignee")
+Parcelle.projets = relationship("Projet", back_populates="parcelle")
+
+# Profils de chargement (à importer après la mise en place des relations)
+from .load_profiles import PROFILS, appliquer_profil, enregistrer_profil, options_profil
 
 # Configuration des métadonnées pour la création des tables
 metadata = Base.metadata
@@ -40,12 +46,13 @@ metadata = Base.metadata
 # Liste de tous les modèles pour faciliter les migrations
 __all__ = [
     # Production
-    'Parcelle', 'CycleCulture', 'Recolte', 'ActiviteCulturale',
+    'Parcelle', 'CycleCulture', 'Recolte', 'MembreEquipeRecolte', 'AgregatRecolte', 'TourneeRecolte',
+    'ActiviteCulturale', 'MesureCapteur', 'AgregatMesure', 'ModeleRendement',
     'CultureType', 'ParcelleStatus', 'QualiteRecolte', 'TypeActivite',
     
     # Inventory
-    'Produit', 'MouvementStock', 'Entrepot', 'Stock', 'Inventaire', 'LigneInventaire',
-    'CategoryProduit', 'UniteMesure', 'TypeMouvement',
+    'Produit', 'MouvementStock', 'Entrepot', 'Stock', 'Inventaire', 'LigneInventaire', 'LigneValorisation',
+    'AlerteStock', 'SnapshotStock', 'LienTracabilite', 'CategoryProduit', 'UniteMesure', 'TypeMouvement', 'StatutAlerte',
     
     # HR
     'Employe', 'Contrat', 'Conge', 'Presence', 'Paie',
@@ -64,4 +71,7 @@ __all__ = [
     'Projet', 'Tache', 'RessourceProjet', 'DocumentProjet',
     'StatutProjet', 'PrioriteProjet', 'TypeProjet', 'StatutTache',
     'PrioriteTache', 'TypeRessource', 'TypeDocument',
+
+    # Profils de chargement
+    'PROFILS', 'appliquer_profil', 'enregistrer_profil', 'options_profil',
 ]
@@ -36,8 +36,8 @@ class PlanComptable(Base):
     actif = Column(Boolean, default=True)
     
     # Relations
-    compte_parent = relationship("PlanComptable", remote_side=[id])
-    sous_comptes = relationship("PlanComptable")
+    compte_parent = relationship("PlanComptable", remote_side="PlanComptable.id", back_populates="sous_comptes")
+    sous_comptes = relationship("PlanComptable", back_populates="compte_parent")
     ecritures = relationship("EcritureComptable", back_populates="compte")
 
 class TypePiece(str, enum.Enum):
@@ -57,6 +57,7 @@ class EcritureComptable(Base):
     numero_piece = Column(String(50), nullable=False)
     type_piece = Column(Enum(TypePiece), nullable=False)
     compte_id = Column(UUID(as_uuid=True), ForeignKey("plan_comptable.id"), nullable=False)
+    journal_id = Column(UUID(as_uuid=True), ForeignKey("journaux_comptables.id"))
     libelle = Column(String(200), nullable=False)
     debit = Column(Numeric(15, 2), default=0)
     credit = Column(Numeric(15, 2), default=0)
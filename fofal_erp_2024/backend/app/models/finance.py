@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, Enum, JSON, ForeignKey, Text, Numeric, Integer, Boolean, Date, DateTime
+from sqlalchemy import Column, String, Float, Enum, JSON, ForeignKey, Text, Numeric, Integer, Boolean, Date, DateTime, Index
 from sqlalchemy.orm import relationship
 from .base import Base
 import enum
@@ -34,6 +34,11 @@ class CategorieTransaction(str, enum.Enum):
 class Transaction(Base):
     """Modèle représentant une transaction financière"""
     __tablename__ = "transactions"
+    __table_args__ = (
+        # Pagination par curseur sur (colonne de tri, id)
+        Index("ix_transactions_created_at_id", "created_at", "id"),
+        Index("ix_transactions_date_id", "date", "id"),
+    )
 
     date = Column(DateTime, nullable=False, default=datetime.utcnow)
     type = Column(Enum(TypeTransaction), nullable=False)
@@ -48,7 +53,7 @@ class Transaction(Base):
     compte_destination_id = Column(UUID(as_uuid=True), ForeignKey("comptes.id"))
     
     piece_justificative = Column(String(200))  # Chemin vers le document
-    metadata = Column(JSON)  # Données supplémentaires
+    metadonnees = Column("metadata", JSON)  # Données supplémentaires ("metadata" est réservé par SQLAlchemy)
     
     # Relations
     compte_source = relationship("Compte", foreign_keys=[compte_source_id])
@@ -100,8 +100,8 @@ class Tache(Base):
     # Relations
     projet = relationship("Projet", back_populates="taches")
     assignee = relationship("Employe", back_populates="taches_assignees")
-    tache_parente = relationship("Tache", remote_side=[id])
-    sous_taches = relationship("Tache")
+    tache_parente = relationship("Tache", remote_side="Tache.id", back_populates="sous_taches")
+    sous_taches = relationship("Tache", back_populates="tache_parente")
 
 class TypeRessource(str, enum.Enum):
     """Types de ressources pour les projets"""